@@ -1,8 +1,12 @@
 # plugins/basic_cultivation.py
+import logging
 from typing import Dict, Any, Optional
 
 from app.core.plugin_system import BasePlugin # Assuming BasePlugin is in app.core.plugin_system
 
+# Plugins are loaded from file paths, so name the logger explicitly rather than via __name__
+logger = logging.getLogger("plugins.basic_cultivation")
+
 class BasicCultivationPlugin(BasePlugin):
     """基础修仙插件"""
 
@@ -28,11 +32,7 @@ class BasicCultivationPlugin(BasePlugin):
         super_initialized = super().initialize()
         if not super_initialized:
             return False # Stop if parent initialization failed
-<<<<<<< HEAD
-        print(f"Plugin {self.name} initialized by example plugin. Ready to manage cultivation.")
-=======
-        logging.info(f"Plugin {self.name} initialized by example plugin. Ready to manage cultivation.")
->>>>>>> origin/haa
+        logger.info("Plugin %s initialized by example plugin. Ready to manage cultivation.", self.name)
         # Example: self.load_cultivation_data()
         return True
 
@@ -48,8 +48,8 @@ class BasicCultivationPlugin(BasePlugin):
             data["messages"] = []
 
         if not character_data or not isinstance(character_data, dict):
-            if event_type in ["character_created", "choice_made"]: # Only print warning for relevant events
-                 print(f"{self.name} plugin: Character data not found or invalid for event '{event_type}'. Plugin will not act.")
+            if event_type in ["character_created", "choice_made"]: # Only warn for relevant events
+                 logger.warning("%s plugin: Character data not found or invalid for event '%s'. Plugin will not act.", self.name, event_type)
             return None # No changes if no character data for this plugin to act upon
 
         if event_type == "character_created":
@@ -60,26 +60,27 @@ class BasicCultivationPlugin(BasePlugin):
             character_data["cultivation"]["stage"] = self.CULTIVATION_STAGES[0]
             character_data["cultivation"]["progress"] = 0
             character_data["cultivation"]["spiritual_power"] = 50 # Example starting spiritual power
-            print(f"{self.name}: Initialized cultivation for character {character_data.get('name', 'Unknown')}.")
+            logger.debug("%s: Initialized cultivation for character %s.", self.name, character_data.get('name', 'Unknown'))
             data["messages"].append(f"你感受到了体内的气感，踏入了{self.CULTIVATION_STAGES[0]}。")
 
 
         elif event_type == "choice_made":
             choice_data = data.get("choice") # Get choice data
             if not choice_data or not isinstance(choice_data, dict):
-                print(f"{self.name} plugin: Choice data not found or invalid for event '{event_type}'.")
+                logger.warning("%s plugin: Choice data not found or invalid for event '%s'.", self.name, event_type)
                 return data # Return original data if no choice data to process
 
             # Ensure 'cultivation' key exists and is a dict in character_data
+            # Saved characters carry no cultivation data, so this is the common case on every turn
             if "cultivation" not in character_data or not isinstance(character_data.get("cultivation"), dict) :
-                print(f"{self.name}: Cultivation data missing or invalid for character {character_data.get('name', 'Unknown')} during 'choice_made'.")
+                logger.debug("%s: Cultivation data missing or invalid for character %s during 'choice_made'.", self.name, character_data.get('name', 'Unknown'))
                 return data # Return original data if no cultivation data to process
 
             effects = choice_data.get("effects", {})
             if "cultivation_gain" in effects:
                 gain = effects["cultivation_gain"]
                 if not isinstance(gain, (int, float)):
-                    print(f"{self.name}: Invalid cultivation_gain value '{gain}'. Must be a number.")
+                    logger.warning("%s: Invalid cultivation_gain value '%s'. Must be a number.", self.name, gain)
                     return data # Return original data if gain is invalid
 
                 cult_data = character_data["cultivation"]
@@ -87,13 +88,13 @@ class BasicCultivationPlugin(BasePlugin):
                 try:
                     current_stage_index = self.CULTIVATION_STAGES.index(current_stage_name)
                 except ValueError:
-                    print(f"{self.name}: Unknown cultivation stage '{current_stage_name}' for character. Resetting to first stage.")
+                    logger.warning("%s: Unknown cultivation stage '%s' for character. Resetting to first stage.", self.name, current_stage_name)
                     current_stage_index = 0
                     cult_data["stage"] = self.CULTIVATION_STAGES[0]
 
 
                 cult_data["progress"] = cult_data.get("progress", 0) + gain
-                print(f"{self.name}: Character {character_data.get('name', 'Unknown')} gained {gain} cultivation progress.")
+                logger.debug("%s: Character %s gained %s cultivation progress.", self.name, character_data.get('name', 'Unknown'), gain)
                 data["messages"].append(f"你感觉到修为精进了一丝，当前进度：{cult_data['progress']}/{self.STAGE_MAX_PROGRESS}。")
 
                 if cult_data["progress"] >= self.STAGE_MAX_PROGRESS:
@@ -104,7 +105,7 @@ class BasicCultivationPlugin(BasePlugin):
                         if cult_data["progress"] < 0: cult_data["progress"] = 0 # Ensure progress isn't negative
 
                         breakthrough_message = f"恭喜！你成功突破到了 {cult_data['stage']}！"
-                        print(f"{self.name}: {breakthrough_message}")
+                        logger.info("%s: %s", self.name, breakthrough_message, extra={"character": character_data.get('name'), "stage": cult_data['stage']})
                         data["messages"].append(breakthrough_message)
                         cult_data["spiritual_power"] = cult_data.get("spiritual_power", 50) + 50
                     else:
@@ -117,5 +118,5 @@ class BasicCultivationPlugin(BasePlugin):
         super_cleaned = super().cleanup()
         if not super_cleaned:
             return False
-        print(f"Plugin {self.name} specific cleanup done.")
+        logger.info("Plugin %s specific cleanup done.", self.name)
         return True
@@ -1,9 +1,11 @@
 # app/api/deps.py
-from fastapi import Depends, HTTPException, status, Request # Ensure Request is imported
+import secrets
+from fastapi import Depends, Header, HTTPException, status, Request # Ensure Request is imported
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from typing import Optional
 
+from app.core.config import settings
 from app.core.security import decode_token
 from app.crud import crud_user
 from app.db.session import get_db
@@ -40,6 +42,13 @@ async def get_current_active_user(
     # Add is_active check here if implemented in UserModel
     return current_user
 
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    # Operator endpoints are keyed by a shared token rather than a user role; without one they don't exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
 # --- RAGSystem and PluginManager Dependencies ---
 def get_rag_system(request: Request) -> RAGSystem:
     if not hasattr(request.app.state, 'rag_system') or request.app.state.rag_system is None:
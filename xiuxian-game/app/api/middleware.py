@@ -0,0 +1,97 @@
+# app/api/middleware.py
+# Pure ASGI middlewares. These avoid BaseHTTPMiddleware so they add no extra task or
+# response buffering to each request.
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+from app.core.tracing import SPAN_KIND_SERVER, tracer
+from app.db.query_counter import count_queries
+
+
+class QueryCountHeaderMiddleware:
+    """Adds an X-DB-Query-Count header with the number of SQL statements the request issued."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_with_count(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Query-Count", str(counter.count))
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+
+class TracingMiddleware:
+    """Opens the root span of every HTTP request. Continues the caller's trace if a traceparent header is sent."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        method = scope["method"]
+        attributes = {"http.method": method, "http.target": scope["path"]}
+        with tracer.start_span(f"HTTP {method}", attributes, kind=SPAN_KIND_SERVER, traceparent=traceparent) as span:
+            async def send_with_status(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # The router stores the matched route in the scope; name the span after its template
+                route = scope.get("route")
+                if route is not None and hasattr(route, "path"):
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+
+
+class PrometheusMiddleware:
+    """Records request latency per route template and the number of requests in flight."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500 # Reported if the app raises before starting a response
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.HTTP_REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.HTTP_REQUESTS_IN_PROGRESS.dec()
+            route = scope.get("route")
+            route_path = route.path if route is not None and hasattr(route, "path") else metrics.UNMATCHED_ROUTE
+            metrics.request_duration_child(scope["method"], route_path, status_code).observe(elapsed)
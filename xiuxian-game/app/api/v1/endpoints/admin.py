@@ -0,0 +1,43 @@
+# app/api/v1/endpoints/admin.py
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app import schemas
+from app.api import deps
+from app.core.rag_system import RAGSystem
+from app.core.serialization import model_response
+from app.services.knowledge_watcher import knowledge_watcher
+
+# Every route here requires the X-Admin-Token header (settings.ADMIN_TOKEN)
+router = APIRouter(dependencies=[Depends(deps.require_admin_token)])
+
+@router.get("/knowledge-base", response_model=schemas.BaseResponse[schemas.KnowledgeBaseStatus])
+def read_knowledge_base_status(rag_sys: RAGSystem = Depends(deps.get_rag_system)):
+    """
+    The knowledge-base index this worker serves.
+    """
+    kb = rag_sys.knowledge_base
+    status_data = schemas.KnowledgeBaseStatus(
+        version=kb.version if kb is not None else None,
+        entries=len(kb) if kb is not None else 0,
+        partitions=len(kb.partitions) if kb is not None else 0,
+        directory=str(rag_sys.kb_dir),
+    )
+    return model_response(schemas.BaseResponse[schemas.KnowledgeBaseStatus](data=status_data))
+
+
+@router.post("/knowledge-base/reindex", response_model=schemas.BaseResponse[schemas.KnowledgeBaseReload])
+def reindex_knowledge_base():
+    """
+    Reloads the knowledge base in this worker now, embedding only new or changed entries, and
+    signals the other workers to reload too. Requests keep being served from the current index meanwhile.
+    """
+    result = knowledge_watcher.reindex()
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Knowledge base reload failed; the current index is still being served.",
+        )
+    return model_response(schemas.BaseResponse[schemas.KnowledgeBaseReload](
+        message="Knowledge base reloaded",
+        data=schemas.KnowledgeBaseReload(**result.as_dict()),
+    ))
@@ -8,6 +8,7 @@ from app import crud # Use this form of import
 from app.models.user_models import User as UserModel # For type hinting if needed, changed from app.models
 from app.core.security import create_access_token, verify_password
 from app.db.session import get_db # Import get_db
+from app.core.serialization import model_response
 
 router = APIRouter()
 
@@ -34,11 +35,11 @@ def register_user(
 
     created_user = crud.crud_user.create_user(db=db, user=user_in)
     # Construct the standard response
-    return schemas.BaseResponse[schemas.User](
+    return model_response(schemas.BaseResponse[schemas.User](
         success=True,
         message="User registered successfully",
         data=schemas.User.model_validate(created_user) # Pydantic V2
-    )
+    ))
 
 @router.post("/login", response_model=schemas.BaseResponse[schemas.Token])
 def login_for_access_token(
@@ -58,11 +59,11 @@ def login_for_access_token(
     access_token = create_access_token(subject=user.username) # Use username as subject
 
     token_data = schemas.Token(access_token=access_token, token_type="bearer")
-    return schemas.BaseResponse[schemas.Token](
+    return model_response(schemas.BaseResponse[schemas.Token](
         success=True,
         message="Login successful",
         data=token_data
-    )
+    ))
 
 # Example of a protected endpoint (to be moved/used later)
 # from app.api.deps import get_current_user # This dep would be created later
@@ -1,13 +1,15 @@
 # app/api/v1/endpoints/characters.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app import schemas # Root import for schemas
 from app import crud    # Root import for crud
 from app.api import deps # For dependencies like get_current_active_user
 from app.db.session import get_db # Corrected: get_db is in app.db.session, not directly app.db
+from app.core.serialization import model_response
 from app.models.user_models import User as UserModel # For type hint on current_user
+from app.utils.pagination import decode_cursor, keyset_page
 
 router = APIRouter()
 
@@ -34,9 +36,9 @@ def create_new_character(
         db=db, character_in=character_in, user_id=current_user.id
     )
     # Use .model_validate for Pydantic V2
-    return schemas.BaseResponse[schemas.CharacterDetailed](
+    return model_response(schemas.BaseResponse[schemas.CharacterDetailed](
         data=schemas.CharacterDetailed.model_validate(created_character)
-    )
+    ))
 
 
 @router.get("/", response_model=schemas.BaseResponse[List[schemas.CharacterSimple]])
@@ -47,14 +49,40 @@ def read_user_characters(
     current_user: UserModel = Depends(deps.get_current_active_user)
 ):
     """
-    Retrieve characters for the current user.
+    Retrieve characters for the current user. Prefer /characters/page, which pages by cursor.
     """
-    characters = crud.crud_character.get_characters_by_user(
+    rows = crud.crud_character.get_character_summaries_by_user(
         db=db, user_id=current_user.id, skip=skip, limit=limit
     )
-    # Use .model_validate for Pydantic V2
-    validated_characters = [schemas.CharacterSimple.model_validate(char) for char in characters]
-    return schemas.BaseResponse[List[schemas.CharacterSimple]](data=validated_characters)
+    validated_characters = [schemas.CharacterSimple.model_validate(row) for row in rows]
+    return model_response(schemas.BaseResponse[List[schemas.CharacterSimple]](data=validated_characters))
+
+
+# Declared before /{character_id}, which would otherwise try to parse "page" as an id
+@router.get("/page", response_model=schemas.BaseResponse[schemas.Page[schemas.CharacterSimple]])
+def read_user_characters_page(
+    db: Session = Depends(get_db),
+    size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserModel = Depends(deps.get_current_active_user)
+):
+    """
+    Retrieve one page of the current user's characters, oldest first. Pass the returned
+    pagination.next_cursor as `cursor` to get the next page.
+    """
+    try:
+        after_id = decode_cursor(cursor, (int,))[0] if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    rows = crud.crud_character.get_character_summaries_by_user(
+        db=db, user_id=current_user.id, limit=size + 1, after_id=after_id
+    )
+    items, pagination = keyset_page(rows, size, cursor, sort_key=lambda row: (row.id,))
+    return model_response(schemas.BaseResponse[schemas.Page[schemas.CharacterSimple]](
+        data=schemas.Page[schemas.CharacterSimple](
+            items=[schemas.CharacterSimple.model_validate(row) for row in items], pagination=pagination
+        )
+    ))
 
 
 @router.get("/{character_id}", response_model=schemas.BaseResponse[schemas.CharacterDetailed])
@@ -75,9 +103,9 @@ def read_character_by_id(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
 
     # Use .model_validate for Pydantic V2
-    return schemas.BaseResponse[schemas.CharacterDetailed](
+    return model_response(schemas.BaseResponse[schemas.CharacterDetailed](
         data=schemas.CharacterDetailed.model_validate(character)
-    )
+    ))
 
 # Placeholder for PUT /api/v1/characters/{character_id} if needed later
 # @router.put("/{character_id}", response_model=schemas.BaseResponse[schemas.CharacterDetailed])
@@ -0,0 +1,140 @@
+# app/api/v1/endpoints/game_ws.py
+"""
+WebSocket game channel (api-specification.md, "WebSocket实时API").
+
+    ws://host/ws/game/{character_id}
+    Authorization: Bearer {access_token}    (or ?token={access_token} for browser clients)
+
+The connection is authenticated once. Turns go through the same session cache
+as the REST endpoints (app.services.session_cache): the character and its
+active game state stay in memory and each turn is written behind.
+
+Client -> server:
+    {"type": "make_choice", "data": {"choice_id": "choice_1"}}
+
+Server -> client (every message also carries "timestamp"):
+    story_update         {"scene": StoryScene, "current_date": "Day 3"}  on connect and after each turn
+    choice_result        {"choice_id": "choice_1"}                        the choice was accepted
+    story_token          {"text": "..."}                                  plot text as it is generated
+    plugin_event         {"messages": [...]}                              messages from plugins
+    system_notification  {"level": "error", "message": "..."}
+
+Turns for one character are serialized by the session's turn lock, whether
+they arrive over this channel or over REST.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import anyio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.security import decode_token
+from app.core.tracing import SPAN_KIND_SERVER, tracer
+from app.db.session import SessionLocal
+from app.services.game_session import GameSession
+from app.services.session_cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _message(message_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": message_type, "data": data, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+
+def _bearer_token(websocket: WebSocket) -> Optional[str]:
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return websocket.query_params.get("token")
+
+
+def _authenticate(token: Optional[str]) -> Optional[int]:
+    """The user id for a bearer token, or None."""
+    token_data = decode_token(token) if token else None
+    if not token_data or not token_data.username:
+        return None
+    with SessionLocal() as db:
+        user = crud.crud_user.get_user_by_username(db, username=token_data.username)
+        return user.id if user is not None else None
+
+
+def _get_session(character_id: int, user_id: int) -> Optional[GameSession]:
+    with SessionLocal() as db:
+        return session_cache.get(db, character_id=character_id, user_id=user_id)
+
+
+@router.websocket("/game/{character_id}")
+async def game_channel(websocket: WebSocket, character_id: int):
+    try:
+        user_id = await run_in_threadpool(_authenticate, _bearer_token(websocket))
+        session = await run_in_threadpool(_get_session, character_id, user_id) if user_id is not None else None
+        if session is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated, or no active game for this character.")
+            return
+
+        rag_sys = websocket.app.state.rag_system
+        plugin_mgr = websocket.app.state.plugin_manager
+        await websocket.accept()
+
+        scene = session.current_scene()
+        if scene is not None:
+            await websocket.send_json(_message("story_update", {"scene": scene.model_dump(), "current_date": session.game_state.current_date}))
+
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                message_type = message.get("type")
+                data = message.get("data") or {}
+            except (json.JSONDecodeError, AttributeError):
+                await websocket.send_json(_message("system_notification", {"level": "error", "message": "Messages must be JSON objects."}))
+                continue
+
+            if message_type != "make_choice" or not data.get("choice_id"):
+                await websocket.send_json(_message("system_notification", {"level": "error", "message": f"Unsupported message: {message_type!r}"}))
+                continue
+
+            choice_id = str(data["choice_id"])
+            await websocket.send_json(_message("choice_result", {"choice_id": choice_id}))
+
+            def send_plot_delta(text: str) -> None:
+                # Runs in the worker thread; blocks until the token is sent, which also applies backpressure
+                anyio.from_thread.run(websocket.send_json, _message("story_token", {"text": text}))
+
+            def play_turn():
+                with tracer.start_span("WS make_choice", {"game.character_id": character_id}, kind=SPAN_KIND_SERVER):
+                    # Re-fetched each turn: the cache may have reloaded or evicted the session since the last one
+                    turn_session = _get_session(character_id, user_id)
+                    if turn_session is None:
+                        return None
+                    with turn_session.turn_lock:
+                        result = turn_session.make_choice(choice_id, rag_sys, plugin_mgr, on_plot_delta=send_plot_delta)
+                        session_cache.mark_dirty(turn_session)
+                        current_date = turn_session.game_state.current_date
+                    session_cache.summarize_behind(turn_session, rag_sys)
+                    return result + (current_date,)
+
+            try:
+                result = await run_in_threadpool(play_turn)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.exception("WebSocket turn failed for character %s: %s", character_id, e)
+                await websocket.send_json(_message("system_notification", {"level": "error", "message": "The turn could not be processed."}))
+                continue
+            if result is None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="The active game for this character is no longer available.")
+                return
+
+            scene, _, messages, current_date = result
+            await websocket.send_json(_message("story_update", {"scene": scene.model_dump(), "current_date": current_date}))
+            if messages:
+                await websocket.send_json(_message("plugin_event", {"messages": messages}))
+    except WebSocketDisconnect:
+        pass
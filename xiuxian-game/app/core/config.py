@@ -1,7 +1,7 @@
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import PostgresDsn, model_validator # field_validator is not used in the provided code
+from pydantic import model_validator # field_validator is not used in the provided code
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -10,13 +10,16 @@ class Settings(BaseSettings):
 
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    # Sent as X-Admin-Token to the /api/v1/admin endpoints; unset disables them
+    ADMIN_TOKEN: Optional[str] = None
 
     POSTGRES_SERVER: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
-    # Using Optional with PostgresDsn for the URI
-    SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
+    # Postgres in deployment; a plain string so SQLite URLs (e.g. "sqlite:///./bench.db")
+    # can be supplied directly for local benchmarking.
+    SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
     @model_validator(mode='before')
     @classmethod # model_validator should be a classmethod
@@ -26,7 +29,7 @@ class Settings(BaseSettings):
 
         # If SQLALCHEMY_DATABASE_URI is already provided (e.g. directly in .env or passed to constructor),
         # Pydantic will use it. We don't need to do anything special here for that case.
-        # Pydantic will later try to validate it against PostgresDsn.
+        # Pydantic will later validate it as a string and create_engine will parse it.
         if values.get('SQLALCHEMY_DATABASE_URI'):
             return values
 
@@ -38,11 +41,11 @@ class Settings(BaseSettings):
 
         if all([db_user, db_password, db_server, db_name]):
             # All components are present, so construct the URI.
-            # Pydantic will then validate this constructed URI against PostgresDsn.
+            # The constructed URI is then validated like any explicitly provided one.
             values['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{db_user}:{db_password}@{db_server}/{db_name}"
         # If SQLALCHEMY_DATABASE_URI was not provided AND not all components are present,
         # we don't explicitly raise an error here. Pydantic will handle it:
-        # - If SQLALCHEMY_DATABASE_URI remains None, it will be validated against Optional[PostgresDsn].
+        # - If SQLALCHEMY_DATABASE_URI remains None, it will be validated against Optional[str].
         #   If it were not Optional, Pydantic would raise a validation error if it's None.
         #   Since it IS Optional, None is acceptable at this stage.
         #   However, for a database connection, you'd typically want this to be non-Optional
@@ -52,6 +55,145 @@ class Settings(BaseSettings):
         return values
 
     OPENAI_API_KEY: str
+    # "openai" for the real backend, "stub" for the deterministic local stand-in (benchmarks, offline dev)
+    LLM_BACKEND: str = "openai"
+    STUB_LLM_LATENCY_MS: float = 0.0 # Simulated generation latency for the stub backend
+    STUB_LLM_BATCH_PROMPT_MS: float = 0.0 # Added to a stub batch's latency per prompt after the first
+    STUB_LLM_MAX_CONCURRENCY: int = 0 # Stub calls generating at once; more wait for a slot, as on a self-hosted server. 0: unlimited
+
+    # Non-streamed LLM calls are queued and sent up to LLM_BATCH_MAX_SIZE prompts per completion call
+    # (app/core/llm_scheduler.py). For local or self-hosted backends, which generate a batch in about the time of
+    # one prompt. Story generation waits at most LLM_BATCH_MAX_WAIT_MS for its batch to fill; background calls
+    # (story summaries) LLM_BATCH_BACKGROUND_MAX_WAIT_MS.
+    LLM_BATCHING: bool = False
+    LLM_BATCH_MAX_SIZE: int = 8
+    LLM_BATCH_MAX_WAIT_MS: float = 5.0
+    LLM_BATCH_BACKGROUND_MAX_WAIT_MS: float = 50.0
+    LLM_BATCH_CONCURRENCY: int = 2 # Batches in flight at once
+
+    # When enabled, every response carries an X-DB-Query-Count header (used by benchmarks/load_test.py)
+    DB_QUERY_COUNT_HEADER: bool = False
+
+    # Request-phase tracing (app/core/tracing.py). Spans are exported as OTLP/JSON.
+    TRACING_ENABLED: bool = False
+    TRACE_SAMPLE_RATE: float = 1.0 # Fraction of traces recorded, 0.0 - 1.0
+    TRACE_EXPORT_PATH: Optional[str] = None # e.g. "traces.jsonl"
+    TRACE_EXPORT_ENDPOINT: Optional[str] = None # OTLP/HTTP, e.g. "http://localhost:4318/v1/traces"
+    TRACE_SERVICE_NAME: str = "xiuxian-game"
+
+    # Prometheus metrics at /metrics (app/core/metrics.py). For multiple uvicorn workers also set
+    # the PROMETHEUS_MULTIPROC_DIR environment variable to an empty directory.
+    METRICS_ENABLED: bool = True
+
+    # Structured logging (app/utils/logger.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = "" # Per-logger overrides, e.g. "app.core.rag_system=DEBUG,plugins=WARNING"
+    LOG_FORMAT: str = "json" # "json" or "text"
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0 # Fraction of DEBUG records kept, 0.0 - 1.0
+    LOG_QUEUE_SIZE: int = 10000 # Records beyond this are dropped instead of blocking requests
+
+    # Active game sessions kept in memory with write-behind persistence (app/services/session_cache.py)
+    SESSION_CACHE_MAX_SESSIONS: int = 1000 # Least recently used sessions beyond this are flushed and dropped
+    SESSION_CACHE_IDLE_SECONDS: float = 600.0 # Sessions untouched this long are dropped
+    WRITE_BEHIND_DELAY_SECONDS: float = 1.0 # Upper bound on how long a turn stays unwritten
+    SESSION_VERSION_CHECK: bool = True # Check the row version on each turn; turn off behind sticky routing
+
+    # story_history grows by one event per turn; these bound how much of it is sent around
+    STATE_HISTORY_WINDOW: int = 20 # Latest events in /game/state by default; older ones are paged from /game/history
+    EVENT_HISTORY_WINDOW: int = 10 # Latest events in the game state handed to plugins and the RAG system
+
+    # Rolling story summary (GameSession.summarize). Once STORY_SUMMARY_KEEP_RECENT + STORY_SUMMARY_EVERY
+    # events are unsummarized, all but the latest STORY_SUMMARY_KEEP_RECENT are condensed into the summary
+    # in the background, so prompts carry the summary plus a short tail of events however long the game.
+    STORY_SUMMARY_EVERY: int = 6
+    STORY_SUMMARY_KEEP_RECENT: int = 4
+    STORY_SUMMARY_MAX_CHARS: int = 1200 # Longer summaries are cut to this
+    STORY_SUMMARY_WORKERS: int = 2 # Background threads running summarization LLM calls
+    # Concurrent story generations with the same prompt (e.g. a guild starting the same event at once) share one
+    # LLM call (app/core/single_flight.py). Counted in story_generations_coalesced_total.
+    STORY_COALESCE: bool = True
+    # Also share calls between prompts that differ only in the character's name: prompts name the character with a
+    # placeholder token, which each player's scene gets their own name in place of
+    STORY_COALESCE_ACROSS_NAMES: bool = False
+
+    # Generation policy for story LLM calls (app/core/generation_policy.py). A generation that has no scene after
+    # STORY_DEADLINE_SECONDS gets the fallback scene (0: no deadline). It makes at most STORY_MAX_ATTEMPTS LLM
+    # calls, counting hedges, retries after errors and repair prompts.
+    STORY_DEADLINE_SECONDS: float = 60.0
+    STORY_MAX_ATTEMPTS: int = 3
+    # A call with no token after the STORY_HEDGE_PERCENTILE of recent latencies (at least STORY_HEDGE_MIN_DELAY_MS,
+    # once STORY_HEDGE_MIN_SAMPLES calls are timed) gets a second, concurrent attempt; at most STORY_HEDGE_BUDGET per call
+    STORY_HEDGE: bool = True
+    STORY_HEDGE_PERCENTILE: float = 90.0
+    STORY_HEDGE_MIN_SAMPLES: int = 20
+    STORY_HEDGE_MIN_DELAY_MS: float = 50.0
+    STORY_HEDGE_BUDGET: float = 0.15
+    STORY_ATTEMPT_WORKERS: int = 32 # Threads running attempts; further attempts wait for one, against their deadline
+    # Output that can't be parsed even leniently is sent back alone, without the story context, to be fixed
+    STORY_REPAIR: bool = True
+
+    # Pre-generated opening scenes (app/services/scene_pool.py), kept per identity (and for characters without one)
+    # and per SCENE_POOL_STAGES cultivation stage in the pregenerated_scenes table. /game/start draws one instead
+    # of calling the LLM, and a generation that falls back gets one in place of the default error scene. Each
+    # worker holds up to SCENE_POOL_TARGET scenes per pair; a pair below SCENE_POOL_LOW_WATERMARK is refilled
+    # at once, the others every SCENE_POOL_REFILL_INTERVAL_SECONDS. A worker's scenes go to the other workers
+    # when it hasn't checked in for SCENE_POOL_CLAIM_TTL_SECONDS. Off by default: every worker fills its own pool,
+    # so enabling it costs workers x pairs x SCENE_POOL_TARGET generations up front.
+    SCENE_POOL_ENABLED: bool = False
+    SCENE_POOL_STAGES: List[str] = ["炼气期一层"] # New characters' stage
+    SCENE_POOL_TARGET: int = 8
+    SCENE_POOL_LOW_WATERMARK: int = 3
+    SCENE_POOL_REFILL_INTERVAL_SECONDS: float = 60.0
+    SCENE_POOL_CLAIM_TTL_SECONDS: float = 300.0
+
+    # Knowledge-base retrieval (RAGSystem._retrieve_context)
+    RAG_TOP_K: int = 6 # Knowledge-base entries put in the prompt
+    RAG_CANDIDATES: int = 20 # Candidates taken from each of the vector and BM25 rankings before fusion
+    RAG_RRF_K: int = 60 # Reciprocal rank fusion constant; larger flattens the rank weights
+    RAG_LEXICAL_FAST_PATH: bool = True # Scenes naming known entries skip the embedding call and vector search
+    RAG_LEXICAL_MIN_ENTITIES: int = 1 # Named entries, stages aside, that take a retrieval down the lexical path
+    # Entries are partitioned by the stage, region and faction they name (app/core/knowledge_index.py);
+    # these knowledge_base/ files define the stages (in order), regions and factions
+    RAG_STAGE_SOURCE: str = "cultivation/stages.md"
+    RAG_REGION_SOURCE: str = "world/geography.md"
+    RAG_FACTION_SOURCE: str = "world/factions.md"
+    RAG_PARTITION_SCAN_MAX_ENTRIES: int = 4096 # Partitions up to this size are scanned directly rather than through a FAISS index
+    # FAISS index of each larger partition: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw". The approximate
+    # ones are trained when the knowledge base is loaded; benchmarks/ann_recall.py compares their recall and
+    # latency against flat.
+    RAG_INDEX_TYPE: str = "flat"
+    RAG_IVF_NLIST: int = 0 # Inverted lists per IVF index; 0 picks about 4 * sqrt(entries)
+    RAG_IVF_NPROBE: int = 16 # Lists an IVF search visits; more is slower and closer to exact
+    RAG_INDEX_TRAIN_SAMPLE: int = 65536 # IVF and PQ codebooks are trained on at most this many of a partition's vectors
+    RAG_PQ_M: int = 32 # Bytes per vector in an IVF-PQ index (sub-quantizers; must divide the embedding dimension)
+    RAG_PQ_RERANK: int = 4 # IVF-PQ searches fetch k times this many candidates and re-rank them by exact distance
+    RAG_HNSW_M: int = 32 # Graph neighbours per HNSW node
+    RAG_HNSW_EF_CONSTRUCTION: int = 80
+    RAG_HNSW_EF_SEARCH: int = 64 # Candidates an HNSW search keeps; more is slower and closer to exact
+    RAG_STAGE_LOOKAHEAD: int = 1 # Stages above the character's own whose lore is still retrieved
+    RAG_SCOPE_EVENTS: int = 3 # Latest events whose regions and factions are searched along with game_data's
+
+    # Knowledge-base reloads (app/services/knowledge_watcher.py): each worker polls knowledge_base/ this often
+    # and reloads changed files, embedding only new or changed entries. 0 turns polling off.
+    KB_WATCH_INTERVAL_SECONDS: float = 5.0
+    KB_REINDEX_TRIGGER: str = ".reindex" # Touched in knowledge_base/ by the admin reindex endpoint to wake every worker
+    # Built indexes are written once to this store and memory-mapped by every worker (app/core/knowledge_store.py).
+    # Default: .index/ in the knowledge-base directory. KB_INDEX_STORE=false keeps each worker's index in its own memory.
+    KB_INDEX_STORE: bool = True
+    KB_INDEX_DIR: Optional[str] = None
+    # Entries without a vector are embedded KB_EMBED_BATCH_SIZE per embedder call, KB_EMBED_CONCURRENCY calls at a
+    # time (app/core/embedding_pipeline.py). Failed calls are retried with exponential backoff, and completed
+    # batches are checkpointed in the index store so an interrupted load resumes where it stopped.
+    KB_EMBED_BATCH_SIZE: int = 256
+    KB_EMBED_CONCURRENCY: int = 4
+    KB_EMBED_MAX_RETRIES: int = 5
+    KB_EMBED_RETRY_BASE_SECONDS: float = 1.0 # First retry delay; doubles per retry, with jitter
+    KB_EMBED_RETRY_MAX_SECONDS: float = 30.0
+    KB_EMBED_PROGRESS_SECONDS: float = 10.0 # How often a long embedding run logs entries done and entries/s
+
+    # Story prompts are trimmed by section priority to fit this many tokens (app/core/prompt_builder.py)
+    PROMPT_TOKEN_BUDGET: int = 1500
+    PROMPT_TOKENIZER: str = "cl100k_base" # tiktoken encoding; the stub backend counts with its own tokenizer
 
     # Pydantic V2 uses SettingsConfigDict for configuration
     model_config = SettingsConfigDict(
@@ -0,0 +1,231 @@
+# app/core/embedding_pipeline.py
+"""
+Embeds knowledge-base entries in batches, with bounded concurrency, retries and checkpoints.
+
+KnowledgeBaseLoader passes EmbeddingPipeline.embed the entry texts that have no
+vector yet. They go to the embedder in batches of KB_EMBED_BATCH_SIZE. At most
+KB_EMBED_CONCURRENCY batches are in flight at once, so a large import is neither
+one huge request nor one request per entry. A batch that raises (a rate limit, a
+timeout) is retried after an exponential backoff with jitter. If it still fails
+after KB_EMBED_MAX_RETRIES retries, the load fails and the current index stays.
+
+Each completed batch is written to the checkpoint directory as its text hashes
+and vectors. The directory is .embeddings/ in the index store, one subdirectory
+per embedder. An interrupted or failed load leaves the checkpoints behind. The
+next load, in this worker or another one, embeds only the texts that no
+checkpoint covers. Resuming goes by text, not by batch number, so it still works
+if files were edited in between. The loader clears the checkpoints once the
+index built from them is in the store.
+
+A long run logs its progress and throughput (entries/s) every
+KB_EMBED_PROGRESS_SECONDS. Batches are counted by result in
+rag_index_embed_batches_total.
+"""
+import hashlib
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_BYTES = 20 # sha1
+
+
+def text_key(text: str) -> bytes:
+    """Identity of an entry text for vector reuse: the same text always embeds the same way."""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def embedder_id(embeddings: Any) -> str:
+    """Short identity of an embedder (class, model, dimension). Checkpoints made by another embedder are never reused."""
+    cls = type(embeddings)
+    description = f"{cls.__module__}.{cls.__qualname__}:{getattr(embeddings, 'model', '')}:{getattr(embeddings, 'dimension', '')}"
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+
+class EmbeddingPipeline:
+    def __init__(self, embeddings: Any, batch_size: int, concurrency: int, max_retries: int, retry_base_seconds: float,
+                 retry_max_seconds: float, progress_seconds: float, checkpoint_dir: Optional[Path] = None):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.progress_seconds = progress_seconds
+        self.checkpoint_dir = checkpoint_dir # None: no checkpoints
+
+    @classmethod
+    def from_settings(cls, embeddings: Any, checkpoint_root: Optional[Path] = None) -> "EmbeddingPipeline":
+        """A pipeline configured by the KB_EMBED_* settings, checkpointing under checkpoint_root/<embedder id> if given."""
+        return cls(
+            embeddings,
+            batch_size=settings.KB_EMBED_BATCH_SIZE,
+            concurrency=settings.KB_EMBED_CONCURRENCY,
+            max_retries=settings.KB_EMBED_MAX_RETRIES,
+            retry_base_seconds=settings.KB_EMBED_RETRY_BASE_SECONDS,
+            retry_max_seconds=settings.KB_EMBED_RETRY_MAX_SECONDS,
+            progress_seconds=settings.KB_EMBED_PROGRESS_SECONDS,
+            checkpoint_dir=checkpoint_root / embedder_id(embeddings) if checkpoint_root is not None else None,
+        )
+
+    def embed(self, texts: Sequence[str]) -> Tuple[np.ndarray, int]:
+        """
+        Vectors of `texts`, one float32 row per text, and how many were taken from checkpoints
+        rather than embedded. Raises the embedder's exception if a batch fails after all its retries.
+        """
+        keys = [text_key(text) for text in texts]
+        rows: Dict[bytes, List[int]] = {}
+        for row, key in enumerate(keys):
+            rows.setdefault(key, []).append(row)
+        vectors: Optional[np.ndarray] = None
+
+        resumed = 0
+        for checkpoint_keys, checkpoint_vectors in self._read_checkpoints(set(rows)):
+            if vectors is None:
+                vectors = np.empty((len(texts), checkpoint_vectors.shape[1]), dtype=np.float32)
+            elif checkpoint_vectors.shape[1] != vectors.shape[1]:
+                continue
+            for key, vector in zip(checkpoint_keys, checkpoint_vectors):
+                for row in rows.pop(key, ()):
+                    vectors[row] = vector
+                    resumed += 1
+        if resumed:
+            logger.info("Resuming knowledge-base embedding: %d of %d entries are already in checkpoints.", resumed, len(texts))
+
+        pending = [rows_of_key[0] for rows_of_key in rows.values()] # One text per distinct key
+        batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        progress = _Progress(len(pending), self.progress_seconds)
+        failed = threading.Event() # Set once a batch has failed for good; the others stop retrying
+        checkpoints = self.checkpoint_dir is not None
+        remaining = iter(batches)
+        in_flight: Dict[Future, List[int]] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="kb-embed") as executor:
+            try:
+                while True:
+                    # Keep `concurrency` batches in flight, and only as many texts in memory as they hold
+                    while len(in_flight) < self.concurrency:
+                        batch = next(remaining, None)
+                        if batch is None:
+                            break
+                        in_flight[executor.submit(self._embed_batch, [texts[row] for row in batch], failed)] = batch
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = in_flight.pop(future)
+                        batch_vectors = future.result()
+                        if vectors is None:
+                            vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+                        for row, vector in zip(batch, batch_vectors):
+                            for same in rows[keys[row]]:
+                                vectors[same] = vector
+                        if checkpoints:
+                            checkpoints = self._write_checkpoint([keys[row] for row in batch], batch_vectors)
+                        progress.add(len(batch))
+            except BaseException:
+                failed.set()
+                for future in in_flight:
+                    future.cancel()
+                raise
+        progress.finish(resumed)
+        if vectors is None: # No texts
+            vectors = np.empty((0, 0), dtype=np.float32)
+        return vectors, resumed
+
+    def clear_checkpoints(self) -> None:
+        """Drops this embedder's checkpoints, once the index they fed has been stored."""
+        if self.checkpoint_dir is not None:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def _embed_batch(self, texts: List[str], failed: threading.Event) -> np.ndarray:
+        attempt = 0
+        while True:
+            try:
+                vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+                if vectors.ndim != 2 or len(vectors) != len(texts):
+                    raise ValueError(f"embedder returned {vectors.shape} for {len(texts)} texts")
+                metrics.KB_EMBED_BATCHES["ok"].inc()
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or failed.is_set():
+                    metrics.KB_EMBED_BATCHES["failed"].inc()
+                    raise
+                # Exponential backoff with jitter, so concurrent batches hitting a rate limit don't retry in step
+                delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                metrics.KB_EMBED_BATCHES["retried"].inc()
+                logger.warning("Embedding a batch of %d entries failed (%s); retry %d of %d in %.2fs.",
+                               len(texts), e, attempt, self.max_retries, delay)
+                if failed.wait(delay): # Another batch failed for good meanwhile
+                    raise
+
+    def _read_checkpoints(self, wanted: Set[bytes]) -> List[Tuple[List[bytes], np.ndarray]]:
+        """(keys, vectors) of the checkpointed entries among `wanted`, checkpoint by checkpoint."""
+        if self.checkpoint_dir is None or not wanted or not self.checkpoint_dir.is_dir():
+            return []
+        found = []
+        for path in sorted(self.checkpoint_dir.glob("*.npz")):
+            try:
+                with np.load(path) as checkpoint:
+                    keys, vectors = checkpoint["keys"], checkpoint["vectors"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Skipping unreadable embedding checkpoint %s: %s", path, e)
+                continue
+            keys = [key.tobytes() for key in keys]
+            hits = [i for i, key in enumerate(keys) if key in wanted]
+            if hits:
+                found.append(([keys[i] for i in hits], np.asarray(vectors[hits], dtype=np.float32)))
+        return found
+
+    def _write_checkpoint(self, keys: List[bytes], vectors: np.ndarray) -> bool:
+        """Writes one completed batch. False if checkpoints can't be written, which turns them off for this run."""
+        joined = b"".join(keys)
+        path = self.checkpoint_dir / f"{hashlib.sha1(joined).hexdigest()[:16]}.npz"
+        staging = path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        try:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            np.savez(staging, keys=np.frombuffer(joined, dtype=np.uint8).reshape(len(keys), _KEY_BYTES), vectors=vectors)
+            os.replace(staging, path) # A reader never sees half a checkpoint
+        except OSError as e:
+            logger.warning("Could not write embedding checkpoints in %s (%s); an interrupted load will start over.", self.checkpoint_dir, e)
+            try:
+                staging.unlink()
+            except OSError:
+                pass
+            return False
+        return True
+
+
+class _Progress:
+    """Logs entries embedded and throughput every `interval` seconds, and once at the end of a long run."""
+
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = self._logged = time.perf_counter()
+
+    def add(self, count: int) -> None:
+        self.done += count
+        now = time.perf_counter()
+        if self.interval > 0 and now - self._logged >= self.interval and self.done < self.total:
+            self._logged = now
+            logger.info("Embedded %d of %d knowledge-base entries (%.1f entries/s).", self.done, self.total, self.done / (now - self.started))
+
+    def finish(self, resumed: int) -> None:
+        elapsed = time.perf_counter() - self.started
+        if self.done and (self.interval <= 0 or elapsed >= self.interval or resumed):
+            logger.info("Embedded %d knowledge-base entries in %.1fs (%.1f entries/s); %d resumed from checkpoints.",
+                        self.done, elapsed, self.done / elapsed if elapsed else 0.0, resumed)
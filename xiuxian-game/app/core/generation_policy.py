@@ -0,0 +1,295 @@
+# app/core/generation_policy.py
+"""
+Deadlines, hedging and retries for story LLM calls.
+
+RAGSystem runs each story generation's LLM calls through GenerationPolicy.call
+with an AttemptBudget: the generation's deadline (STORY_DEADLINE_SECONDS) and
+the number of LLM calls it may make (STORY_MAX_ATTEMPTS), counting every kind
+of attempt:
+
+  first   the call itself
+  hedge   a second, concurrent call made when the first hasn't produced a token
+          by the hedge delay. Whichever answers first is used and the other is
+          abandoned
+  retry   a new call after every running attempt raised
+  repair  a short re-prompt that sends only the malformed output back for fixing
+          (RAGSystem._repair_story_output), under the same budget
+
+The hedge delay is the STORY_HEDGE_PERCENTILE of recent latencies: time to the
+first streamed token for streamed calls, and time to the whole completion for
+the rest. So only the slowest calls are hedged. Each call adds STORY_HEDGE_BUDGET
+hedge credit and each hedge spends one, which caps hedges at that share of calls
+even when the backend slows down and every call is past the delay. Extra cost stays
+bounded that way, and a struggling backend doesn't get twice the load.
+
+Attempts run on a pool of STORY_ATTEMPT_WORKERS threads, so the caller can stop
+waiting at the deadline. Each runs in a copy of the caller's context, so context
+variables such as the current trace span carry over. While every worker is busy,
+new attempts queue and their wait counts against the deadline. The caller gets DeadlineExceeded and RAGSystem falls back to the default scene. A
+non-streamed call can't be cancelled, so an abandoned one runs to completion in
+the background and its result is dropped. A streamed one stops at its next token.
+Streamed tokens go to the caller's on_delta from the caller's own thread, and only
+from the attempt that produced the first token. The WebSocket channel's callback
+has to run on the thread that called it.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+Emit = Callable[[str], None]
+
+_STREAM_CLOSED = -1 # _Race.streamer once the attempt that was streaming failed: later attempts stream nothing
+
+
+class DeadlineExceeded(Exception):
+    """The generation's deadline passed before any attempt answered."""
+
+
+class _Abandoned(Exception):
+    """Raised inside an attempt's emit to stop a streamed attempt that can no longer be used."""
+
+
+class AttemptBudget:
+    """One generation's deadline and the LLM calls it may still make. Used from the generation's own thread."""
+
+    __slots__ = ("deadline", "attempts_left")
+
+    def __init__(self, seconds: float, attempts: int):
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+        self.attempts_left = max(1, attempts)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds to the deadline (negative once past); None without a deadline."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def can_attempt(self) -> bool:
+        remaining = self.remaining()
+        return self.attempts_left > 0 and (remaining is None or remaining > 0)
+
+    def take(self) -> bool:
+        if self.attempts_left <= 0:
+            return False
+        self.attempts_left -= 1
+        return True
+
+
+class _LatencyWindow:
+    """The latest `size` latencies of one kind, for the hedge delay."""
+
+    def __init__(self, size: int):
+        self._samples: Deque[float] = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class _Race:
+    """The attempts of one GenerationPolicy.call. Attempts update it under `changed`; the caller waits on it."""
+
+    def __init__(self, call: Callable[[Optional[Emit]], str], streamed: bool):
+        self.call = call
+        self.streamed = streamed
+        self.changed = threading.Condition()
+        self.started = time.monotonic()
+        self.launched = 0
+        self.running = 0
+        self.first_token: Optional[float] = None
+        self.streamer: Optional[int] = None # Number of the attempt whose tokens go to the caller
+        self.deltas: List[str] = []
+        self.sent = 0 # Deltas already passed to the caller's on_delta
+        self.done = False
+        self.text: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class GenerationPolicy:
+    def __init__(self, deadline: float, max_attempts: int, hedge: bool, hedge_percentile: float, hedge_min_samples: int,
+                 hedge_min_delay: float, hedge_budget: float, window: int = 200, workers: int = 32):
+        self.deadline = deadline # Seconds; 0: none
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self._latencies = {True: _LatencyWindow(window), False: _LatencyWindow(window)} # By streamed: first token / completion
+        self._hedge_credit = 0.0
+        self._credit_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="story-attempt")
+
+    @classmethod
+    def from_settings(cls) -> "GenerationPolicy":
+        return cls(
+            deadline=settings.STORY_DEADLINE_SECONDS,
+            max_attempts=settings.STORY_MAX_ATTEMPTS,
+            hedge=settings.STORY_HEDGE,
+            hedge_percentile=settings.STORY_HEDGE_PERCENTILE,
+            hedge_min_samples=settings.STORY_HEDGE_MIN_SAMPLES,
+            hedge_min_delay=settings.STORY_HEDGE_MIN_DELAY_MS / 1000.0,
+            hedge_budget=settings.STORY_HEDGE_BUDGET,
+            workers=settings.STORY_ATTEMPT_WORKERS,
+        )
+
+    def shutdown(self) -> None:
+        """Stops taking attempts. Abandoned attempts still running are not waited for."""
+        self._executor.shutdown(wait=False)
+
+    def budget(self) -> AttemptBudget:
+        """A new generation's budget, its deadline starting now."""
+        return AttemptBudget(self.deadline, self.max_attempts)
+
+    def hedge_delay(self, streamed: bool) -> Optional[float]:
+        """Seconds without a token after which a call is hedged; None until enough calls have been timed, or with hedging off."""
+        if not self.hedge:
+            return None
+        delay = self._latencies[streamed].percentile(self.hedge_percentile, self.hedge_min_samples)
+        return None if delay is None else max(delay, self.hedge_min_delay)
+
+    def call(self, budget: AttemptBudget, call: Callable[[Optional[Emit]], str], on_delta: Optional[Emit] = None,
+             kind: str = "first", hedge: bool = True) -> str:
+        """
+        call(emit)'s result under the budget: hedged if it is slow to produce a token, retried if it raises
+        while attempts and time remain. Streamed tokens go to on_delta in this thread. Raises DeadlineExceeded,
+        or the last attempt's exception once no attempts are left.
+        """
+        if not budget.take():
+            raise RuntimeError("No LLM attempts left in this generation's budget")
+        if budget.deadline is None and budget.attempts_left == 0 and not (hedge and self.hedge):
+            try: # Nothing to race or retry: call in this thread
+                text = call(on_delta)
+            except Exception:
+                metrics.STORY_LLM_ATTEMPTS[(kind, "failed")].inc()
+                raise
+            metrics.STORY_LLM_ATTEMPTS[(kind, "won")].inc()
+            return text
+
+        race = _Race(call, streamed=on_delta is not None)
+        hedge_delay = self.hedge_delay(race.streamed) if hedge else None
+        if hedge_delay is not None:
+            with self._credit_lock:
+                self._hedge_credit = min(self._hedge_credit + self.hedge_budget, max(1.0, self.hedge_budget * 100))
+        hedged = False
+        with race.changed:
+            self._launch(race, kind)
+        while True:
+            deltas: List[str] = []
+            with race.changed:
+                while True:
+                    if race.sent < len(race.deltas):
+                        deltas = race.deltas[race.sent:]
+                        race.sent = len(race.deltas)
+                        break
+                    if race.done:
+                        return race.text
+                    remaining = budget.remaining()
+                    if remaining is not None and remaining <= 0:
+                        race.done = True # The running attempts lose
+                        raise DeadlineExceeded(f"No answer from the LLM within {self.deadline:g}s")
+                    if race.running == 0: # Every attempt so far raised
+                        if not budget.take():
+                            race.done = True
+                            raise race.error
+                        self._launch(race, "retry")
+                        continue
+                    wait = remaining
+                    if hedge_delay is not None and not hedged and race.first_token is None:
+                        until_hedge = race.started + hedge_delay - time.monotonic()
+                        if until_hedge <= 0:
+                            hedged = True
+                            if budget.attempts_left > 0 and self._spend_hedge_credit():
+                                budget.take()
+                                self._launch(race, "hedge")
+                            continue
+                        wait = until_hedge if wait is None else min(wait, until_hedge)
+                    race.changed.wait(wait)
+            try:
+                for delta in deltas: # Outside the lock: the callback may block
+                    on_delta(delta)
+            except BaseException:
+                with race.changed:
+                    race.done = True # The caller is gone; stop the attempts
+                raise
+
+    def _spend_hedge_credit(self) -> bool:
+        with self._credit_lock:
+            if self._hedge_credit < 1.0:
+                return False
+            self._hedge_credit -= 1.0
+            return True
+
+    def _launch(self, race: _Race, kind: str) -> None:
+        """Starts an attempt in a copy of the caller's context. Called with race.changed held."""
+        race.launched += 1
+        race.running += 1
+        self._executor.submit(contextvars.copy_context().run, self._attempt, race, race.launched, kind)
+
+    def _attempt(self, race: _Race, number: int, kind: str) -> None:
+        with race.changed:
+            if race.done: # Decided while it waited for a worker
+                race.running -= 1
+                metrics.STORY_LLM_ATTEMPTS[(kind, "lost")].inc()
+                return
+        started = time.monotonic()
+        first_token = [True]
+
+        def emit(delta: str) -> None:
+            now = time.monotonic()
+            with race.changed:
+                if race.done:
+                    raise _Abandoned()
+                if first_token[0]:
+                    first_token[0] = False
+                    self._latencies[True].add(now - started)
+                    if race.first_token is None:
+                        race.first_token = now
+                if race.streamer is None:
+                    race.streamer = number # First token of the call: this attempt streams, the others are dropped
+                if race.streamer == number:
+                    race.deltas.append(delta)
+                    race.changed.notify_all()
+                elif race.streamer != _STREAM_CLOSED:
+                    raise _Abandoned()
+
+        result = "failed"
+        try:
+            text = race.call(emit if race.streamed else None)
+        except _Abandoned:
+            result = "lost"
+            with race.changed:
+                race.running -= 1
+        except Exception as e:
+            with race.changed:
+                race.running -= 1
+                if race.streamer == number:
+                    race.streamer = _STREAM_CLOSED # The caller has part of this attempt's plot; a retry's would not follow on
+                if not race.done:
+                    race.error = e
+                race.changed.notify_all()
+        else:
+            if not race.streamed:
+                self._latencies[False].add(time.monotonic() - started)
+            with race.changed:
+                race.running -= 1
+                if race.done:
+                    result = "lost"
+                else:
+                    result = "won"
+                    race.done = True
+                    race.text = text
+                    race.changed.notify_all()
+        metrics.STORY_LLM_ATTEMPTS[(kind, result)].inc()
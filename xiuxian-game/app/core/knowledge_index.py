@@ -0,0 +1,452 @@
+# app/core/knowledge_index.py
+"""
+Knowledge-base index partitioned by metadata: cultivation stage, region and faction.
+
+Entries are tagged when the knowledge base is loaded (KnowledgeMetadata.tag):
+
+  stage    the highest cultivation stage the entry names, as a tier (0 = the first
+           entry of RAG_STAGE_SOURCE, 炼气期)
+  region   the first region the entry names other than itself (RAG_REGION_SOURCE
+           entries, "/" aliases included)
+  faction  the first faction the entry names other than itself (RAG_FACTION_SOURCE entries)
+
+The entries of RAG_REGION_SOURCE and RAG_FACTION_SOURCE are tagged by what they define
+instead: a region's entry with that region only, a faction's with that faction only, or
+with the first region it names if it has one (青云门, 位于青云山, is 青云山脉 lore).
+
+A file can set any of them for all of its entries with front matter, which wins
+over what the text names:
+
+    ---
+    region: 十万大山
+    ---
+
+Entries with the same (region, faction, stage) form a partition, stored as one
+contiguous range of ids. A search takes the partitions whose region is untagged or in
+scope AND whose faction is untagged or in scope, so an entry tagged with both a region
+and a faction is only found when both are in scope. Partitions larger than RAG_PARTITION_SCAN_MAX_ENTRIES get
+their own FAISS index; smaller ones are scanned straight from the vector matrix,
+which for a few dozen entries is cheaper than a FAISS call. A search looks only
+at the partitions its RetrievalScope admits, so its cost follows the size of the
+lore relevant to the character rather than the size of the whole corpus.
+
+The FAISS index type is RAG_INDEX_TYPE: exact "flat", or the approximate
+"ivf_flat" (k-means lists, RAG_IVF_NPROBE of them searched), "ivf_pq" (the same
+with vectors product-quantized to RAG_PQ_M bytes) and "hnsw" (a neighbour graph).
+Approximate indexes are trained on their partition's vectors when it is built.
+"""
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core.config import settings
+from app.core.lexical_index import LexicalIndex, NameMatcher, split_aliases
+
+logger = logging.getLogger(__name__)
+
+FRONT_MATTER_KEYS = ("stage", "region", "faction")
+_FRONT_MATTER_LINE = re.compile(r"^\s*(\w+)\s*[:：]\s*(.*?)\s*$")
+_NAME_ALIASES = re.compile(r"[/／、]")
+
+
+def parse_front_matter(content: str) -> Tuple[Dict[str, str], str]:
+    """Splits "---"-delimited "key: value" front matter off a knowledge-base file. Returns (metadata, rest)."""
+    lines = content.split("\n")
+    if not lines or lines[0].strip() != "---":
+        return {}, content
+    for end in range(1, len(lines)):
+        if lines[end].strip() == "---":
+            break
+    else:
+        return {}, content # No closing line: not front matter
+    metadata: Dict[str, str] = {}
+    for line in lines[1:end]:
+        match = _FRONT_MATTER_LINE.match(line)
+        if match and match.group(1) in FRONT_MATTER_KEYS and match.group(2):
+            metadata[match.group(1)] = match.group(2)
+    return metadata, "\n".join(lines[end + 1:])
+
+
+class RetrievalScope:
+    """
+    The partitions a search may scan: stage tiers up to max_stage (None: any) and the given
+    regions and factions. Entries without a stage, region or faction are always in scope;
+    a tagged region and a tagged faction must both be in it.
+    """
+
+    def __init__(self, max_stage: Optional[int] = None, regions: Iterable[str] = (), factions: Iterable[str] = ()):
+        self.max_stage = max_stage
+        self.regions = frozenset(regions)
+        self.factions = frozenset(factions)
+
+    def admits_stage(self, stage: Optional[int]) -> bool:
+        return stage is None or self.max_stage is None or stage <= self.max_stage
+
+    def __repr__(self) -> str:
+        return f"<RetrievalScope(max_stage={self.max_stage}, regions={sorted(self.regions)}, factions={sorted(self.factions)})>"
+
+
+class KnowledgeMetadata:
+    """The stages, regions and factions the knowledge base defines, and how to find them in text."""
+
+    def __init__(self, stages: Sequence[Sequence[str]], regions: Dict[str, str], factions: Dict[str, str]):
+        # Each takes lowercased names and aliases to the tier or the canonical name
+        self._stages = [list(aliases) for aliases in stages]
+        self._stage_tiers = {alias: tier for tier, aliases in enumerate(stages) for alias in aliases}
+        self._regions = regions
+        self._factions = factions
+        # Equal for equal vocabularies in any process, so tags computed under one can be reused under the other
+        self.signature = hashlib.sha1(json.dumps(self.vocabulary(), sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        self._stage_matcher = NameMatcher(self._stage_tiers)
+        self._region_matcher = NameMatcher(regions)
+        self._faction_matcher = NameMatcher(factions)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Document]) -> "KnowledgeMetadata":
+        """Reads the vocabularies from the entries of the configured source files and from front matter."""
+        stages: List[List[str]] = []
+        regions: Dict[str, str] = {}
+        factions: Dict[str, str] = {}
+        for entry in entries:
+            source = entry.metadata.get("source")
+            name = entry.metadata.get("entry")
+            aliases = split_aliases(name)
+            if aliases and source == settings.RAG_STAGE_SOURCE:
+                stages.append(aliases)
+            elif aliases and source in (settings.RAG_REGION_SOURCE, settings.RAG_FACTION_SOURCE):
+                vocabulary = regions if source == settings.RAG_REGION_SOURCE else factions
+                canonical = _NAME_ALIASES.split(name)[0].strip() # "青云山脉/青云山" is 青云山脉
+                for alias in aliases:
+                    vocabulary.setdefault(alias, canonical)
+            # Regions and factions that only appear in front matter can still be matched in queries
+            for key, vocabulary in (("region", regions), ("faction", factions)):
+                value = entry.metadata.get(key)
+                if isinstance(value, str):
+                    vocabulary.setdefault(value.lower(), value)
+        return cls(stages, regions, factions)
+
+    def vocabulary(self) -> Dict[str, Any]:
+        """The constructor's arguments, as JSON-serializable values."""
+        return {"stages": self._stages, "regions": self._regions, "factions": self._factions}
+
+    def stage_tier(self, text: str) -> Optional[int]:
+        """The highest stage tier named in the text, e.g. 0 for "炼气期三层"."""
+        tiers = [self._stage_tiers[name] for name in self._stage_matcher.find(text)]
+        return max(tiers) if tiers else None
+
+    def is_stage(self, name: Optional[str]) -> bool:
+        """Whether an entry name ("名称/别名") is one of the stages."""
+        return any(alias in self._stage_tiers for alias in split_aliases(name))
+
+    def regions_in(self, text: str) -> List[str]:
+        return list(dict.fromkeys(self._regions[name] for name in self._region_matcher.find(text)))
+
+    def factions_in(self, text: str) -> List[str]:
+        return list(dict.fromkeys(self._factions[name] for name in self._faction_matcher.find(text)))
+
+    def tag(self, entry: Document) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+        """Sets entry.metadata stage (tier), region and faction and returns them. Values from front matter are kept."""
+        metadata = entry.metadata
+        text = entry.page_content
+        own = set(split_aliases(metadata.get("entry")))
+        stage = metadata.get("stage")
+        if isinstance(stage, str):
+            metadata["stage"] = self._stage_tiers.get(stage.lower())
+            if metadata["stage"] is None:
+                logger.warning("Unknown stage %r in front matter of %s.", stage, metadata.get("source"))
+        else:
+            metadata["stage"] = self.stage_tier(text)
+        own_region = next((self._regions[name] for name in own if name in self._regions), None)
+        own_faction = next((self._factions[name] for name in own if name in self._factions), None)
+        if own_region is not None or own_faction is not None:
+            # A region's or faction's own entry goes with it alone; a faction with a home region goes with the region
+            if not metadata.get("region"):
+                metadata["region"] = own_region or (next(iter(self.regions_in(text)), None) if own_faction else None)
+            if not metadata.get("faction"):
+                metadata["faction"] = own_faction if not metadata["region"] else None
+            return metadata["stage"], metadata["region"], metadata["faction"]
+        if not metadata.get("region"):
+            metadata["region"] = next((self._regions[name] for name in self._region_matcher.find(text) if name not in own), None)
+        if not metadata.get("faction"):
+            metadata["faction"] = next((self._factions[name] for name in self._faction_matcher.find(text) if name not in own), None)
+        return metadata["stage"], metadata["region"], metadata["faction"]
+
+    def scope(self, game_state: Dict[str, Any], character: Dict[str, Any]) -> RetrievalScope:
+        """
+        The character's stage tier plus RAG_STAGE_LOOKAHEAD, and the regions and factions of
+        game_data ("region", "faction"), the current scene and the latest RAG_SCOPE_EVENTS events.
+        """
+        tier = self.stage_tier(str(character.get("cultivation_stage") or ""))
+        game_data = game_state.get("game_data") or {}
+        texts = [str(game_state.get("current_scene_id") or "")]
+        recent_events = (game_state.get("story_history") or [])[-settings.RAG_SCOPE_EVENTS:] if settings.RAG_SCOPE_EVENTS > 0 else []
+        for event in recent_events:
+            if isinstance(event, dict):
+                texts.append(str(event.get("plot") or ""))
+                action = event.get("action_taken")
+                if isinstance(action, dict):
+                    texts.append(str(action.get("text") or ""))
+        text = "\n".join(texts)
+        regions = self.regions_in(text)
+        factions = self.factions_in(text)
+        if isinstance(game_data.get("region"), str):
+            regions.append(self._regions.get(game_data["region"].lower(), game_data["region"]))
+        if isinstance(game_data.get("faction"), str):
+            factions.append(self._factions.get(game_data["faction"].lower(), game_data["faction"]))
+        return RetrievalScope(
+            max_stage=None if tier is None else tier + settings.RAG_STAGE_LOOKAHEAD,
+            regions=regions,
+            factions=factions,
+        )
+
+
+class Partition:
+    """Entries start..end-1 of a KnowledgeIndex, which share a region, faction and stage."""
+
+    def __init__(self, region: Optional[str], faction: Optional[str], stage: Optional[int], start: int, end: int, index: Any):
+        self.region = region
+        self.faction = faction
+        self.stage = stage
+        self.start = start
+        self.end = end
+        self.index = index # FAISS index over the partition's vectors (ids are offsets from start), or None to scan them
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+
+def _partition_index(vectors: np.ndarray, partition: Partition) -> Any:
+    if len(partition) <= settings.RAG_PARTITION_SCAN_MAX_ENTRIES:
+        return None
+    return build_partition_index(np.ascontiguousarray(vectors[partition.start:partition.end], dtype=np.float32))
+
+
+def _partition_key(metadata: Dict[str, Any]) -> Tuple:
+    # Untagged values sort first, and stages ascend within a (region, faction) pair
+    region, faction, stage = metadata.get("region"), metadata.get("faction"), metadata.get("stage")
+    return (region is not None, region or "", faction is not None, faction or "", -1 if stage is None else stage)
+
+
+# faiss.index_factory descriptions, filled in by build_partition_index
+_INDEX_FACTORY = {
+    "flat": "Flat",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}np", # "np": no polysemous training, which searches don't use and which is most of the training time
+    "hnsw": "HNSW{hnsw_m}",
+}
+
+
+def partition_index_config() -> Dict[str, Any]:
+    """The settings partition indexes are built with; an index built under other ones is rebuilt on load."""
+    return {
+        "type": settings.RAG_INDEX_TYPE if settings.RAG_INDEX_TYPE in _INDEX_FACTORY else "flat",
+        "scan_max_entries": settings.RAG_PARTITION_SCAN_MAX_ENTRIES,
+        "ivf_nlist": settings.RAG_IVF_NLIST,
+        "train_sample": settings.RAG_INDEX_TRAIN_SAMPLE,
+        "pq_m": settings.RAG_PQ_M,
+        "hnsw_m": settings.RAG_HNSW_M,
+        "hnsw_ef_construction": settings.RAG_HNSW_EF_CONSTRUCTION,
+    }
+
+
+def build_partition_index(vectors: np.ndarray) -> Any:
+    """A RAG_INDEX_TYPE FAISS index over the vectors (ids are row numbers), trained on them first if the type needs it."""
+    config = partition_index_config()
+    if config["type"] != settings.RAG_INDEX_TYPE:
+        logger.warning("Unknown RAG_INDEX_TYPE %r; using an exact flat index.", settings.RAG_INDEX_TYPE)
+    count, dimension = vectors.shape
+    # Enough lists to keep each short, but at least 39 training vectors per list, as FAISS's k-means wants
+    nlist = config["ivf_nlist"] or int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // 39))
+    pq_m = max(m for m in range(1, min(config["pq_m"], dimension) + 1) if dimension % m == 0)
+    index = faiss.index_factory(dimension, _INDEX_FACTORY[config["type"]].format(nlist=nlist, pq_m=pq_m, hnsw_m=config["hnsw_m"]), faiss.METRIC_L2)
+    if config["type"] == "hnsw":
+        index.hnsw.efConstruction = config["hnsw_ef_construction"]
+    elif config["type"] == "ivf_pq":
+        # Each sub-quantizer clusters low-dimensional slices, for which a few thousand vectors are plenty; don't warn per slice
+        index.pq.cp.min_points_per_centroid = 1
+    try:
+        if not index.is_trained:
+            sample = vectors
+            if count > config["train_sample"] > 0: # Same sample for the same vectors, so every build agrees
+                sample = vectors[np.sort(np.random.default_rng(0).choice(count, config["train_sample"], replace=False))]
+            index.train(sample)
+    except RuntimeError as e: # e.g. fewer vectors than PQ centroids
+        logger.warning("Could not train a %s index on %d vectors (%s); using an exact flat index.", config["type"], count, e)
+        index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+
+def search_partition_index(index: Any, vectors: np.ndarray, squared_norms: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k nearest (squared L2 distances, row ids) to query (one row) in a partition index over these vectors.
+    IVF-PQ distances are approximate, so its best k * RAG_PQ_RERANK candidates are re-ranked against the vectors.
+    """
+    rerank = isinstance(index, faiss.IndexIVFPQ) and settings.RAG_PQ_RERANK > 1
+    distances, ids = index.search(query, min(len(vectors), k * settings.RAG_PQ_RERANK) if rerank else min(len(vectors), k))
+    ids = ids[0][ids[0] >= 0] # Approximate indexes may return fewer than asked (id -1)
+    if not rerank:
+        return distances[0][:len(ids)], ids
+    exact = squared_norms[ids] - 2.0 * (vectors[ids] @ query[0]) + float(query[0] @ query[0])
+    nearest = np.argsort(exact, kind="stable")[:k]
+    return exact[nearest], ids[nearest]
+
+
+def configure_search(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Applies the search-time settings (RAG_IVF_NPROBE, RAG_HNSW_EF_SEARCH, or the given values) to a partition index."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe or settings.RAG_IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or settings.RAG_HNSW_EF_SEARCH
+
+
+class KnowledgeIndex:
+    """
+    Knowledge-base entries with their embeddings and BM25 index, partitioned by metadata.
+    Entry ids are positions in `texts`, which are ordered by partition. The arrays may be
+    memory-mapped from a shared store (app/core/knowledge_store.py) or held in memory.
+    """
+
+    def __init__(self, texts: Sequence[str], names: Sequence[Optional[str]], vectors: np.ndarray, squared_norms: np.ndarray,
+                 positions: np.ndarray, metadata: KnowledgeMetadata, lexical: LexicalIndex, partitions: List[Partition], version: str = "",
+                 index_config: Optional[Dict[str, Any]] = None):
+        self.version = version # Identifies the knowledge-base contents it was built from (KnowledgeBaseLoader)
+        self.index_config = index_config if index_config is not None else partition_index_config() # What the partition indexes were built with
+        self.texts = texts
+        self.names = names # Entry names ("名称"), "" or None for unnamed entries
+        self.vectors = vectors
+        self.squared_norms = squared_norms
+        self.positions = positions # Entry id -> position in the entries build() was given
+        self.metadata = metadata
+        self.lexical = lexical
+        self.partitions = partitions
+        self._partition_starts = [partition.start for partition in partitions]
+        # region -> faction -> partitions by ascending stage, untagged first
+        self._by_region: Dict[Optional[str], Dict[Optional[str], List[Partition]]] = {}
+        for partition in partitions:
+            self._by_region.setdefault(partition.region, {}).setdefault(partition.faction, []).append(partition)
+
+    @classmethod
+    def build(cls, entries: List[Document], vectors: np.ndarray, metadata: KnowledgeMetadata, version: str = "") -> "KnowledgeIndex":
+        """Orders tagged entries (KnowledgeMetadata.tag) by partition and indexes them; entries[i] embeds as vectors[i]."""
+        order = sorted(range(len(entries)), key=lambda i: _partition_key(entries[i].metadata))
+        entries = [entries[i] for i in order]
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32)[order])
+        texts = [entry.page_content for entry in entries]
+        names = [entry.metadata.get("entry") for entry in entries]
+        partitions: List[Partition] = []
+        start = 0
+        for _, group in itertools.groupby(entries, key=lambda entry: _partition_key(entry.metadata)):
+            first = next(group)
+            end = start + 1 + sum(1 for _ in group)
+            partitions.append(Partition(first.metadata.get("region"), first.metadata.get("faction"), first.metadata.get("stage"), start, end, None))
+            start = end
+        for partition in partitions:
+            partition.index = _partition_index(vectors, partition)
+        return cls(
+            texts, names, vectors, np.einsum("ij,ij->i", vectors, vectors), np.asarray(order, dtype=np.int32),
+            metadata, LexicalIndex.build(texts, names), partitions, version=version,
+        )
+
+    def with_current_index_config(self) -> "KnowledgeIndex":
+        """This index with its partition indexes rebuilt under the current settings (partition_index_config)."""
+        partitions = [Partition(p.region, p.faction, p.stage, p.start, p.end, None) for p in self.partitions]
+        for partition in partitions:
+            partition.index = _partition_index(self.vectors, partition)
+        return KnowledgeIndex(self.texts, self.names, self.vectors, self.squared_norms, self.positions, self.metadata,
+                              self.lexical, partitions, version=self.version)
+
+    def partition_of(self, entry_id: int) -> Partition:
+        return self.partitions[bisect.bisect_right(self._partition_starts, entry_id) - 1]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def select(self, scope: Optional[RetrievalScope] = None) -> List[Partition]:
+        """
+        The partitions in scope, in id order. Without a scope, all of them. Region and faction
+        combine with AND: a (青云山脉, 青云门) partition needs both in scope, not either.
+        """
+        if scope is None:
+            return self.partitions
+        selected: List[Partition] = []
+        for region in (None, *scope.regions):
+            by_faction = self._by_region.get(region)
+            if not by_faction:
+                continue
+            for faction in (None, *scope.factions):
+                for partition in by_faction.get(faction, ()):
+                    if not scope.admits_stage(partition.stage):
+                        break # Later partitions have higher stages
+                    selected.append(partition)
+        selected.sort(key=lambda partition: partition.start)
+        return selected
+
+    def search(self, query_vector: Sequence[float], k: int, partitions: Sequence[Partition]) -> List[Tuple[int, float]]:
+        """The k nearest (entry id, L2 distance) pairs within the partitions, nearest first."""
+        query = np.asarray([query_vector], dtype=np.float32)
+        ids: List[np.ndarray] = []
+        distances: List[np.ndarray] = []
+        for start, end, partition in self._search_units(partitions):
+            if partition is not None:
+                found_distances, found_ids = search_partition_index(partition.index, self.vectors[start:end], self.squared_norms[start:end], query, k)
+                ids.append(found_ids + start)
+                distances.append(found_distances)
+                continue
+            # Squared L2 distance, as IndexFlatL2 reports it: |v|^2 - 2 v.q + |q|^2
+            scanned = self.squared_norms[start:end] - 2.0 * (self.vectors[start:end] @ query[0]) + float(query[0] @ query[0])
+            if end - start > k:
+                nearest = np.argpartition(scanned, k - 1)[:k]
+                ids.append(nearest + start)
+                distances.append(scanned[nearest])
+            else:
+                ids.append(np.arange(start, end))
+                distances.append(scanned)
+        if not ids:
+            return []
+        all_ids = np.concatenate(ids)
+        all_distances = np.concatenate(distances)
+        nearest = np.argsort(all_distances, kind="stable")[:k]
+        return list(zip(all_ids[nearest].tolist(), all_distances[nearest].tolist()))
+
+    def lexical_search(self, query: str, k: int, partitions: Sequence[Partition]) -> List[Tuple[int, float]]:
+        """BM25 over the partitions' entries only."""
+        if len(partitions) == len(self.partitions):
+            return self.lexical.search(query, k)
+        return self.lexical.search(query, k, [(start, end) for start, end, _ in self._search_units(partitions, merge_indexed=True)])
+
+    def _search_units(self, partitions: Sequence[Partition], merge_indexed: bool = False) -> List[Tuple[int, int, Optional[Partition]]]:
+        """
+        (start, end, partition) per partition with a FAISS index, and (start, end, None) per run of
+        neighbouring partitions to scan directly. With merge_indexed, indexed partitions join runs too.
+        """
+        units: List[Tuple[int, int, Optional[Partition]]] = []
+        for partition in partitions:
+            if partition.index is not None and not merge_indexed:
+                units.append((partition.start, partition.end, partition))
+            elif units and units[-1][2] is None and units[-1][1] == partition.start:
+                units[-1] = (units[-1][0], partition.end, None)
+            else:
+                units.append((partition.start, partition.end, None))
+        return units
+
+    def match_entities(self, query: str, scope: Optional[RetrievalScope] = None) -> List[int]:
+        """
+        Entries named in the query, longest names first. A named entry is relevant wherever it is,
+        so only the stage limit of the scope applies.
+        """
+        entity_ids = self.lexical.match_entities(query)
+        if scope is None:
+            return entity_ids
+        return [entry_id for entry_id in entity_ids if scope.admits_stage(self.partition_of(entry_id).stage)]
@@ -0,0 +1,259 @@
+# app/core/knowledge_loader.py
+"""
+Loads knowledge_base/ into a KnowledgeIndex, embedding only what changed.
+
+The loader remembers each file's content hash and where its entries sit in the
+live index. A reload re-reads the directory, parses only the files whose hash
+changed, embeds only entry texts it has no vector for (entries of unchanged files,
+and unchanged entries of changed files, keep theirs), and re-tags only changed
+files unless the stage, region or faction vocabulary itself changed. Entries of
+deleted files drop out. The new index is built beside the live one and the caller
+swaps it in (copy-on-write), so queries never wait for a reload and never see a
+half-built index.
+
+The index version is a hash of the file paths and contents, so every worker that
+has loaded the same files reports the same version. Built versions are written to
+the shared store (app/core/knowledge_store.py): the first worker to load a version
+builds and writes it, and the others map it instead of embedding anything.
+Embedding goes through EmbeddingPipeline (app/core/embedding_pipeline.py): batched,
+retried, and checkpointed in the store, so a load interrupted partway through a
+large import resumes without re-embedding the batches it finished.
+"""
+import contextlib
+import hashlib
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.embedding_pipeline import EmbeddingPipeline, text_key
+from app.core.knowledge_index import KnowledgeIndex, KnowledgeMetadata, parse_front_matter, partition_index_config
+from app.core.knowledge_store import open_store, store_directory, store_lock, write_store
+
+logger = logging.getLogger(__name__)
+
+# Knowledge-base entries are "名称: 描述" lines
+_ENTRY_NAME = re.compile(r"^\s*([^:：\n]{1,40})[:：]")
+
+
+def split_entries(content: str, source: str, first_id: int = 0, metadata: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """
+    One Document per knowledge-base entry. A line starting "名称:" opens an entry and
+    other non-blank lines continue the current one. metadata["id"] numbers entries from first_id;
+    `metadata` (the file's front matter) is copied into every entry.
+    """
+    entries: List[Document] = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        match = _ENTRY_NAME.match(line)
+        if match or not entries:
+            entry_metadata = dict(metadata or {}, source=source, entry=match.group(1).strip() if match else None, id=first_id + len(entries))
+            entries.append(Document(page_content=line.strip(), metadata=entry_metadata))
+        else:
+            entries[-1].page_content += "\n" + line.strip()
+    return entries
+
+
+class LoadResult:
+    def __init__(self, version: str, entries: int, embedded: int, files_added: int, files_changed: int,
+                 files_removed: int, files_unchanged: int, seconds: float, from_store: bool = False, resumed: int = 0):
+        self.version = version
+        self.entries = entries
+        self.embedded = embedded # Entry texts sent to the embedder; the rest reused their vectors
+        self.files_added = files_added
+        self.files_changed = files_changed
+        self.files_removed = files_removed
+        self.files_unchanged = files_unchanged
+        self.seconds = seconds
+        self.from_store = from_store # Mapped from the shared store, already built by another worker (or an earlier run)
+        self.resumed = resumed # Entries whose vectors came from an interrupted load's checkpoints instead of the embedder
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class _FileState:
+    def __init__(self, digest: str, front_matter: Dict[str, str], first: int, end: int):
+        self.digest = digest
+        self.front_matter = front_matter
+        # The file's entries are positions first..end-1 of the order the index was built in (KnowledgeIndex.positions)
+        self.first = first
+        self.end = end
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_FileState":
+        return cls(data["digest"], data["front_matter"], data["first"], data["end"])
+
+
+class KnowledgeBaseLoader:
+    """Builds KnowledgeIndexes from a knowledge-base directory. Not thread-safe; RAGSystem serializes loads."""
+
+    def __init__(self, embeddings: Any):
+        self.embeddings = embeddings
+        self._files: Dict[str, _FileState] = {} # relative path -> state in _index
+        self._index: Optional[KnowledgeIndex] = None # The last index loaded
+        self._loaded = False
+
+    def load(self, kb_dir: Path) -> Tuple[Optional[KnowledgeIndex], LoadResult]:
+        """
+        A new index over the *.md files under kb_dir (None if there are no entries).
+        If embedding fails the exception propagates and the loader's state is unchanged.
+        """
+        started = time.perf_counter()
+        digests: Dict[str, str] = {}
+        contents: Dict[str, bytes] = {} # Files not in the last index as they are now
+        added = changed = unchanged = 0
+        for file_path in sorted(kb_dir.glob("**/*.md")):
+            relative = file_path.relative_to(kb_dir).as_posix()
+            try:
+                raw = file_path.read_bytes()
+            except OSError as e:
+                logger.error("Error reading knowledge-base file %s: %s", file_path, e)
+                continue
+            digests[relative] = hashlib.sha1(raw).hexdigest()
+            previous = self._files.get(relative)
+            if previous is not None and previous.digest == digests[relative]:
+                unchanged += 1
+                continue
+            contents[relative] = raw
+            if previous is None:
+                added += 1
+            else:
+                changed += 1
+        removed = len(self._files.keys() - digests.keys())
+        version = hashlib.sha1("".join(f"{relative}\0{digest}\n" for relative, digest in sorted(digests.items())).encode("utf-8")).hexdigest()[:12]
+        if self._loaded and not (added or changed or removed):
+            # Nothing changed (e.g. another worker's reindex trigger): keep the index we have
+            return self._index, LoadResult(version, len(self._index or ()), 0, 0, 0, 0, unchanged, round(time.perf_counter() - started, 3))
+
+        store_dir = store_directory(kb_dir) if settings.KB_INDEX_STORE else None
+        embedded = resumed = 0
+        with store_lock(store_dir) if store_dir is not None else contextlib.nullcontext():
+            stored = open_store(store_dir, version) if store_dir is not None else None
+            rebuilt = False
+            if stored is not None:
+                index, stored_files = stored
+                files = {relative: _FileState.from_dict(state) for relative, state in stored_files.items()}
+                if index.index_config != partition_index_config():
+                    # Stored under other index settings (e.g. RAG_INDEX_TYPE): keep its vectors, rebuild its FAISS indexes
+                    logger.info("Rebuilding the partition indexes of knowledge base %s for the current index settings.", version)
+                    index = index.with_current_index_config()
+                    rebuilt = True
+            else:
+                pipeline = EmbeddingPipeline.from_settings(self.embeddings, store_dir / ".embeddings" if store_dir is not None else None)
+                index, files, embedded, resumed = self._build(digests, contents, version, pipeline)
+                rebuilt = True
+            if rebuilt and index is not None and store_dir is not None:
+                try:
+                    write_store(store_dir, index, {relative: state.as_dict() for relative, state in files.items()})
+                except OSError as e:
+                    logger.warning("Could not write the knowledge-base store in %s (%s); this worker keeps its index in memory.", store_dir, e)
+                else:
+                    if stored is None:
+                        pipeline.clear_checkpoints() # The vectors they hold are in the store now
+                    # Serve from the mapping, like the other workers, and let the built arrays go
+                    reopened = open_store(store_dir, version)
+                    if reopened is not None:
+                        index = reopened[0]
+
+        # Commit the new state only once everything above succeeded
+        self._files = files
+        self._index = index
+        self._loaded = True
+        result = LoadResult(
+            version=version, entries=len(index or ()), embedded=embedded, files_added=added, files_changed=changed,
+            files_removed=removed, files_unchanged=unchanged, seconds=round(time.perf_counter() - started, 3),
+            from_store=stored is not None and not rebuilt, resumed=resumed,
+        )
+        return index, result
+
+    def _build(self, digests: Dict[str, str], contents: Dict[str, bytes], version: str,
+               pipeline: EmbeddingPipeline) -> Tuple[Optional[KnowledgeIndex], Dict[str, _FileState], int, int]:
+        """
+        Builds the index in memory, reusing the last index's vectors and tags.
+        Returns (index, file states, entries embedded, entries resumed from checkpoints).
+        """
+        previous = self._index
+        previous_ids = np.empty(len(previous or ()), dtype=np.int64) # Build position -> entry id in the last index
+        if previous is not None:
+            previous_ids[previous.positions] = np.arange(len(previous))
+
+        # Vectors of the last index's entries in changed or removed files, which may still be there word for word
+        reusable: Dict[bytes, int] = {}
+        for relative, state in self._files.items():
+            if digests.get(relative) != state.digest:
+                for entry_id in previous_ids[state.first:state.end].tolist():
+                    reusable.setdefault(text_key(previous.texts[entry_id]), entry_id)
+
+        entries: List[Document] = []
+        rows: List[int] = [] # Per entry: its row in previous.vectors, or -1 - its row in the new vectors
+        missing: Dict[bytes, int] = {} # Text key -> row in the new vectors
+        missing_texts: List[str] = []
+        kept_ids: List[Tuple[int, int]] = [] # (entry, entry id in the last index) for entries of unchanged files
+        files: Dict[str, _FileState] = {}
+        for relative, digest in digests.items():
+            first = len(entries)
+            state = self._files.get(relative)
+            if relative not in contents:
+                # Unchanged since the last index: take its entries from there
+                for entry_id in previous_ids[state.first:state.end].tolist():
+                    kept_ids.append((len(entries), entry_id))
+                    entries.append(Document(page_content=previous.texts[entry_id], metadata=dict(
+                        state.front_matter, source=relative, entry=previous.names[entry_id] or None)))
+                    rows.append(entry_id)
+                files[relative] = _FileState(digest, state.front_matter, first, len(entries))
+                continue
+            try:
+                front_matter, content = parse_front_matter(contents[relative].decode("utf-8"))
+            except UnicodeDecodeError as e:
+                logger.error("Error decoding knowledge-base file %s: %s", relative, e)
+                front_matter, content = {}, ""
+            for entry in split_entries(content, source=relative, first_id=first, metadata=front_matter):
+                key = text_key(entry.page_content)
+                row = reusable.get(key)
+                if row is None:
+                    if key not in missing:
+                        missing[key] = len(missing_texts)
+                        missing_texts.append(entry.page_content)
+                    row = -1 - missing[key]
+                entries.append(entry)
+                rows.append(row)
+            files[relative] = _FileState(digest, front_matter, first, len(entries))
+
+        new_vectors, resumed = pipeline.embed(missing_texts) if missing_texts else (None, 0)
+        embedded = len(missing_texts) - resumed
+        metrics.KB_ENTRIES_EMBEDDED.inc(embedded)
+        if not entries:
+            return None, files, embedded, resumed
+
+        rows_array = np.asarray(rows, dtype=np.int64)
+        dimension = new_vectors.shape[1] if new_vectors is not None else previous.vectors.shape[1]
+        vectors = np.empty((len(entries), dimension), dtype=np.float32)
+        kept = rows_array >= 0
+        if kept.any():
+            vectors[kept] = previous.vectors[rows_array[kept]]
+        if new_vectors is not None:
+            vectors[~kept] = new_vectors[-1 - rows_array[~kept]]
+
+        kb_metadata = KnowledgeMetadata.from_entries(entries)
+        tagged = [False] * len(entries)
+        if kept_ids and previous.metadata.signature == kb_metadata.signature:
+            # Unchanged files keep their tags, which are their entries' partitions in the last index
+            for position, entry_id in kept_ids:
+                partition = previous.partition_of(entry_id)
+                entries[position].metadata.update(stage=partition.stage, region=partition.region, faction=partition.faction)
+                tagged[position] = True
+        for entry, done in zip(entries, tagged):
+            if not done:
+                kb_metadata.tag(entry)
+        return KnowledgeIndex.build(entries, vectors, kb_metadata, version=version), files, embedded, resumed
@@ -0,0 +1,200 @@
+# app/core/knowledge_store.py
+"""
+Read-only on-disk form of a KnowledgeIndex, memory-mapped by every worker.
+
+Each index version is written once into its own directory of the store
+(KB_INDEX_DIR, by default .index/ inside the knowledge-base directory):
+
+  manifest.json      version, vocabularies, partitions, the BM25 term table and
+                     the files the index was built from
+  vectors.f32        entry embeddings, one float32 row per entry id
+  norms.f32          their squared L2 norms
+  texts.bin/.idx     entry texts, UTF-8 back to back, and count + 1 uint64 offsets
+  names.bin/.idx     entry names, the same way ("" for unnamed entries)
+  positions.i32      entry id -> position in the build order (KnowledgeIndex.positions)
+  postings.i32       BM25 doc ids, term by term
+  weights.f32        BM25 term weights, aligned with postings.i32
+  partition-N.faiss  FAISS index of the partition starting at entry N, if it has one
+                     (of the type in the manifest's index_config)
+
+open_store maps the arrays with numpy.memmap and the FAISS indexes with
+IO_FLAG_MMAP_IFC, so the vectors, texts and postings live once in the OS page
+cache however many workers serve them; a worker's own memory holds only the
+term table, the entry-name lookup and the partition list. A version directory is
+written under a temporary name and renamed into place, so a reader never sees a
+partial one, and store_lock lets one worker build a version while the others wait
+and then map it.
+"""
+import contextlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.core.knowledge_index import KnowledgeIndex, KnowledgeMetadata, Partition, configure_search
+from app.core.lexical_index import LexicalIndex
+
+try:
+    import fcntl
+except ImportError: # Not on POSIX: workers may build the same version concurrently; the rename still keeps one
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 3 # Bumped when the layout or the tagging rules change; directories of other formats are rebuilt
+_MANIFEST = "manifest.json"
+_LOCK = ".lock"
+_KEEP_VERSIONS = 2 # The live version and the one before it, which workers may still be swapping out of
+_FAISS_MMAP = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class PackedStrings:
+    """A read-only sequence of strings stored back to back in one UTF-8 buffer, found by offset."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self._data[self._offsets[index]:self._offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[index] for index in range(len(self)))
+
+
+def store_directory(kb_dir: Path) -> Path:
+    return Path(settings.KB_INDEX_DIR) if settings.KB_INDEX_DIR else kb_dir / ".index"
+
+
+@contextlib.contextmanager
+def store_lock(store_dir: Path) -> Iterator[None]:
+    """Held while checking for a version and building it, so only one worker embeds a given version."""
+    try:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(store_dir / _LOCK, "a+b")
+    except OSError as e:
+        logger.warning("Could not lock the knowledge-base store %s: %s", store_dir, e)
+        yield
+        return
+    with lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def open_store(store_dir: Path, version: str) -> Optional[Tuple[KnowledgeIndex, Dict[str, Any]]]:
+    """The stored index of this version and the files it was built from, or None if there is none (or it is unreadable)."""
+    path = store_dir / version
+    try:
+        manifest = json.loads((path / _MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != STORE_FORMAT:
+        return None
+    try:
+        count, dimension = manifest["count"], manifest["dimension"]
+        vectors = _map(path / "vectors.f32", np.float32, (count, dimension))
+        texts = PackedStrings(_map(path / "texts.bin", np.uint8), _map(path / "texts.idx", np.uint64))
+        names = PackedStrings(_map(path / "names.bin", np.uint8), _map(path / "names.idx", np.uint64))
+        partitions = [
+            Partition(region, faction, stage, start, end, faiss.read_index(str(path / index_file), _FAISS_MMAP) if index_file else None)
+            for region, faction, stage, start, end, index_file in manifest["partitions"]
+        ]
+        for partition in partitions:
+            if partition.index is not None:
+                configure_search(partition.index) # Search settings may have changed since it was written
+        lexical = LexicalIndex(
+            count,
+            {term: (low, high, idf) for term, (low, high, idf) in manifest["terms"].items()},
+            _map(path / "postings.i32", np.int32),
+            _map(path / "weights.f32", np.float32),
+            names,
+        )
+        index = KnowledgeIndex(
+            texts, names, vectors, _map(path / "norms.f32", np.float32), _map(path / "positions.i32", np.int32),
+            KnowledgeMetadata(**manifest["vocabulary"]), lexical, partitions, version=version, index_config=manifest["index_config"],
+        )
+    except (OSError, ValueError, KeyError, RuntimeError) as e: # faiss raises RuntimeError
+        logger.warning("Knowledge-base store %s is unreadable, rebuilding it: %s", path, e)
+        return None
+    return index, manifest["files"]
+
+
+def write_store(store_dir: Path, index: KnowledgeIndex, files: Dict[str, Any]) -> Path:
+    """Writes the index and the files it was built from as store_dir/<index.version>. Raises OSError if it can't."""
+    final = store_dir / index.version
+    staging = store_dir / f".{index.version}.{os.getpid()}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    try:
+        np.ascontiguousarray(index.vectors, dtype=np.float32).tofile(staging / "vectors.f32")
+        np.asarray(index.squared_norms, dtype=np.float32).tofile(staging / "norms.f32")
+        np.asarray(index.positions, dtype=np.int32).tofile(staging / "positions.i32")
+        _write_strings(staging / "texts", index.texts)
+        _write_strings(staging / "names", [name or "" for name in index.names])
+        np.asarray(index.lexical.doc_ids, dtype=np.int32).tofile(staging / "postings.i32")
+        np.asarray(index.lexical.weights, dtype=np.float32).tofile(staging / "weights.f32")
+        partitions: List[List[Any]] = []
+        for partition in index.partitions:
+            index_file = None
+            if partition.index is not None:
+                index_file = f"partition-{partition.start}.faiss"
+                faiss.write_index(partition.index, str(staging / index_file))
+            partitions.append([partition.region, partition.faction, partition.stage, partition.start, partition.end, index_file])
+        manifest = {
+            "format": STORE_FORMAT,
+            "version": index.version,
+            "count": len(index),
+            "dimension": int(index.vectors.shape[1]),
+            "vocabulary": index.metadata.vocabulary(),
+            "partitions": partitions,
+            "index_config": index.index_config,
+            "terms": index.lexical.terms,
+            "files": files,
+        }
+        (staging / _MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        if final.exists():
+            shutil.rmtree(final) # Left by an older format or a failed read; readers of it keep their mapping
+        os.replace(staging, final)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _prune(store_dir, keep=final)
+    return final
+
+
+def _map(path: Path, dtype: Any, shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+    if path.stat().st_size == 0:
+        return np.zeros(shape or 0, dtype=dtype) # numpy can't map an empty file
+    # A plain ndarray over the mapping: memmap's subclass hooks would run on every slice taken at query time
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape).view(np.ndarray)
+
+
+def _write_strings(base: Path, strings: Sequence[str]) -> None:
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    base.with_suffix(".bin").write_bytes(b"".join(encoded))
+    offsets.tofile(base.with_suffix(".idx"))
+
+
+def _prune(store_dir: Path, keep: Path) -> None:
+    # Workers still serving a removed version keep reading it: their mappings outlive the unlink
+    versions = sorted((path for path in store_dir.iterdir() if path.is_dir() and not path.name.startswith(".")),
+                      key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in versions[_KEEP_VERSIONS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,325 @@
+# app/core/lenient_json.py
+r"""
+Lenient JSON parsing for LLM output.
+
+loads_object finds the JSON object in a model's reply (inside a ```json fence,
+or from the first "{") and parses it. Well-formed output takes the fast path:
+one json.loads call, exactly as before, except that NaN and Infinity, which
+json.loads accepts, go to the lenient parser like any other defect. Only output json.loads rejects goes
+through the lenient parser, which repairs the defects models commonly make and
+records each kind it repaired:
+
+  trailing_comma        "a": 1, } and doubled commas
+  missing_comma         members or items with nothing between them, such as ["a" "b"]
+  unquoted_key          {plot: "..."}
+  single_quotes         {'plot': '...'}
+  unescaped_quote       "he said "go" to me" (a quote not followed by , : } ], a line break or
+                        another string)
+  python_literal        True, False, None
+  number                leading zeros (01), NaN, Infinity
+  comment               // and /* */ comments
+  control_char          raw line breaks and tabs inside strings
+  bad_escape            escapes JSON doesn't define, such as \' or \x
+  fullwidth_punctuation ：，“” in place of :, and "
+  truncated             output cut off mid-object; open strings, arrays and objects are closed
+                        and a member whose value never started is dropped
+
+The parser is a single pass over the text with no token list: strings are
+sliced out with str.find between escapes, so a plot is copied once. It stops at
+the end of the top-level object, so text after it (a closing fence, a remark
+from the model) is ignored, and any prefix of an object parses, so truncated
+output keeps what was generated. Input that can't be read as an object even
+leniently raises json.JSONDecodeError.
+"""
+import json
+import re
+from typing import Any, Set, Tuple
+
+_FENCED = re.compile(r"```json\s*([\s\S]*?)\s*```")
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LEADING_ZERO = re.compile(r"-?0\d")
+_NON_FINITE = re.compile(r"-?Infinity|NaN")
+_WORD = re.compile(r"[A-Za-z]+")
+_BARE_KEY = re.compile(r"[\w$][\w$-]*")
+_CONTROL = re.compile(r"[\x00-\x1f]")
+
+_WHITESPACE = " \t\r\n﻿　"
+_QUOTES = {'"': '"', "'": "'", "“": "”"} # Opening quote -> closing quote
+_COMMAS = ",，"
+_COLONS = ":："
+_STRING_FOLLOWERS = ",，:：}]" # What may follow a closing quote; any other character means the quote was part of the string
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', "'": "'"}
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+
+_MISSING = object() # A value cut off before it started
+
+
+def _reject_constant(name: str) -> Any:
+    raise json.JSONDecodeError(f"{name} is not valid JSON", name, 0)
+
+
+_DECODER = json.JSONDecoder(parse_constant=_reject_constant) # json.loads, without NaN and Infinity
+
+
+def loads_object(text: str) -> Tuple[Any, Set[str]]:
+    """
+    The JSON object in an LLM reply and the kinds of defects repaired to read it (empty for
+    well-formed output). Raises json.JSONDecodeError if there is no object to read.
+    """
+    match = _FENCED.search(text)
+    if match:
+        json_str = match.group(1)
+    else:
+        start, end = text.find("{"), text.rfind("}")
+        json_str = text[start:end + 1] if start != -1 and end > start else text
+    try:
+        return _DECODER.decode(json_str), set()
+    except json.JSONDecodeError as e:
+        error = e
+
+    # An unclosed fence doesn't match _FENCED, so search the whole reply for the object
+    start = text.find("{", match.start(1) if match else 0)
+    if start == -1:
+        raise error
+    parser = _Parser(text, start)
+    return parser.object(), parser.repairs
+
+
+class _Parser:
+    __slots__ = ("text", "pos", "end", "repairs")
+
+    def __init__(self, text: str, pos: int):
+        self.text = text
+        self.pos = pos
+        self.end = len(text)
+        self.repairs: Set[str] = set()
+
+    def _fail(self, message: str) -> None:
+        raise json.JSONDecodeError(message, self.text, self.pos)
+
+    def _skip(self) -> None:
+        """Moves past whitespace and comments."""
+        text, pos, end = self.text, self.pos, self.end
+        while pos < end:
+            ch = text[pos]
+            if ch in _WHITESPACE:
+                pos += 1
+            elif text.startswith("//", pos):
+                newline = text.find("\n", pos)
+                pos = end if newline == -1 else newline + 1
+                self.repairs.add("comment")
+            elif text.startswith("/*", pos):
+                close = text.find("*/", pos + 2)
+                pos = end if close == -1 else close + 2
+                self.repairs.add("comment")
+            else:
+                break
+        self.pos = pos
+
+    def _at_end(self) -> bool:
+        """Skips to the next token; True (and the output counts as truncated) if there is none."""
+        self._skip()
+        if self.pos >= self.end:
+            self.repairs.add("truncated")
+            return True
+        return False
+
+    def _separator(self, allowed: str) -> bool:
+        """Consumes one of `allowed` (ASCII first, full-width second) if it is next."""
+        ch = self.text[self.pos]
+        if ch not in allowed:
+            return False
+        if ch != allowed[0]:
+            self.repairs.add("fullwidth_punctuation")
+        self.pos += 1
+        return True
+
+    def value(self) -> Any:
+        if self._at_end():
+            return _MISSING
+        text, pos = self.text, self.pos
+        ch = text[pos]
+        if ch == "{":
+            return self.object()
+        if ch == "[":
+            return self.array()
+        if ch in _QUOTES:
+            return self.string()
+        match = _NUMBER.match(text, pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            if _LEADING_ZERO.match(number):
+                self.repairs.add("number")
+            return float(number) if "." in number or "e" in number or "E" in number else int(number)
+        match = _NON_FINITE.match(text, pos)
+        if match:
+            self.repairs.add("number")
+            self.pos = match.end()
+            return float(match.group().replace("Infinity", "inf"))
+        match = _WORD.match(text, pos)
+        if match:
+            word = match.group()
+            if word in _LITERALS:
+                if not word.islower():
+                    self.repairs.add("python_literal")
+                self.pos = match.end()
+                return _LITERALS[word]
+            if match.end() == self.end: # "tr" at the very end: a literal cut off
+                for literal, value in _LITERALS.items():
+                    if literal.startswith(word):
+                        self.repairs.add("truncated")
+                        self.pos = self.end
+                        return value
+        self._fail("Expecting value")
+
+    def object(self) -> dict:
+        """Parses the object at self.pos, which is at its "{"."""
+        self.pos += 1
+        result = {}
+        while True:
+            if self._at_end():
+                return result
+            ch = self.text[self.pos]
+            if ch == "}":
+                self.pos += 1
+                return result
+            if self._separator(_COMMAS): # A comma with no member before it
+                self.repairs.add("trailing_comma")
+                continue
+            key = self.key()
+            if self._at_end():
+                return result
+            if not self._separator(_COLONS):
+                self._fail("Expecting ':' delimiter")
+            value = self.value()
+            if value is _MISSING:
+                return result
+            result[key] = value
+            if self._at_end():
+                return result
+            if self._separator(_COMMAS):
+                self._skip()
+                if self.pos < self.end and self.text[self.pos] == "}":
+                    self.repairs.add("trailing_comma")
+            elif self.text[self.pos] != "}":
+                self.repairs.add("missing_comma") # key() fails below if what follows isn't a member either
+
+    def array(self) -> list:
+        """Parses the array at self.pos, which is at its "["."""
+        self.pos += 1
+        result = []
+        while True:
+            if self._at_end():
+                return result
+            ch = self.text[self.pos]
+            if ch == "]":
+                self.pos += 1
+                return result
+            if self._separator(_COMMAS):
+                self.repairs.add("trailing_comma")
+                continue
+            value = self.value()
+            if value is _MISSING:
+                return result
+            result.append(value)
+            if self._at_end():
+                return result
+            if self._separator(_COMMAS):
+                self._skip()
+                if self.pos < self.end and self.text[self.pos] == "]":
+                    self.repairs.add("trailing_comma")
+            elif self.text[self.pos] != "]":
+                self.repairs.add("missing_comma")
+
+    def key(self) -> str:
+        if self.text[self.pos] in _QUOTES:
+            return self.string()
+        match = _BARE_KEY.match(self.text, self.pos)
+        if not match:
+            self._fail("Expecting property name")
+        self.repairs.add("unquoted_key")
+        self.pos = match.end()
+        return match.group()
+
+    def string(self) -> str:
+        """Parses the string at self.pos, which is at its opening quote."""
+        text, end = self.text, self.end
+        quote = text[self.pos]
+        close = _QUOTES[quote]
+        if quote == "'":
+            self.repairs.add("single_quotes")
+        elif quote != '"':
+            self.repairs.add("fullwidth_punctuation")
+        pieces = []
+        i = self.pos + 1
+        while True:
+            stop = text.find(close, i)
+            backslash = text.find("\\", i, end if stop == -1 else stop)
+            if backslash != -1:
+                pieces.append(text[i:backslash])
+                i = self._escape(backslash, pieces)
+                continue
+            if stop == -1:
+                pieces.append(text[i:])
+                self.pos = end
+                self.repairs.add("truncated")
+                break
+            pieces.append(text[i:stop])
+            if self._closes(stop, quote):
+                self.pos = stop + 1
+                break
+            pieces.append(close) # A quote inside the string the model forgot to escape
+            self.repairs.add("unescaped_quote")
+            i = stop + 1
+        value = pieces[0] if len(pieces) == 1 else "".join(pieces)
+        if _CONTROL.search(value):
+            self.repairs.add("control_char")
+        return value
+
+    def _closes(self, quote_pos: int, quote: str) -> bool:
+        """
+        Whether the quote at quote_pos ends its string: the end of input, a delimiter or a line break follows
+        it, or whitespace and then the opening quote of the next string (a missing comma).
+        """
+        text, end = self.text, self.end
+        i = quote_pos + 1
+        while i < end and text[i] in _WHITESPACE:
+            i += 1
+        if i >= end or text[i] in _STRING_FOLLOWERS or "\n" in text[quote_pos + 1:i]:
+            return True
+        return i > quote_pos + 1 and text[i] == quote
+
+    def _escape(self, i: int, pieces: list) -> int:
+        """Decodes the escape at text[i] (a backslash) into pieces; returns the index after it."""
+        text, end = self.text, self.end
+        if i + 1 >= end:
+            self.repairs.add("truncated")
+            return end
+        escape = text[i + 1]
+        if escape != "u":
+            decoded = _ESCAPES.get(escape)
+            if decoded is None:
+                self.repairs.add("bad_escape")
+                decoded = escape
+            pieces.append(decoded)
+            return i + 2
+        if i + 6 > end:
+            self.repairs.add("truncated")
+            return end
+        try:
+            code = int(text[i + 2:i + 6], 16)
+        except ValueError:
+            self.repairs.add("bad_escape")
+            pieces.append("u")
+            return i + 2
+        if 0xD800 <= code < 0xDC00 and text.startswith("\\u", i + 6): # Surrogate pair
+            try:
+                low = int(text[i + 8:i + 12], 16)
+            except ValueError:
+                low = 0
+            if 0xDC00 <= low < 0xE000:
+                pieces.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                return i + 12
+        pieces.append(chr(code))
+        return i + 6
@@ -0,0 +1,199 @@
+# app/core/lexical_index.py
+"""
+In-memory BM25 index over knowledge-base entries, for exact-name retrieval.
+
+The knowledge base is mostly Chinese proper nouns (sects, places, stages, NPCs),
+which embeddings match loosely. Text is tokenized into character bigrams for
+CJK runs (unigrams for single characters) and lowercase words otherwise, so
+"青云门" matches "青云门的入门剑法" without a word segmenter.
+
+Each entry may also have a name ("名称: 描述" lines). match_entities finds known
+names contained in a query, which RAGSystem uses to skip embedding the query.
+
+Searches can be restricted to ranges of document ids. The knowledge index
+stores each metadata partition as one contiguous id range (app/core/knowledge_index.py),
+so a search scoped to a few partitions only touches their slices of each posting list.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RUN = re.compile(r"([㐀-䶿一-鿿豈-﫿]+)|([a-z0-9_]+)")
+_NAME_ALIASES = re.compile(r"[/／、]")
+MIN_NAME_CHARS = 2 # Shorter names would match inside almost any query
+
+
+def tokenize(text: str) -> List[str]:
+    """CJK character bigrams (a lone character as a unigram) and lowercase alphanumeric words."""
+    tokens: List[str] = []
+    for cjk, word in _TOKEN_RUN.findall(text.lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def split_aliases(name: Optional[str]) -> List[str]:
+    """The lowercased names in a "名称/别名" entry name, shortest ones dropped."""
+    aliases = (alias.strip().lower() for alias in _NAME_ALIASES.split(name or ""))
+    return [alias for alias in aliases if len(alias) >= MIN_NAME_CHARS]
+
+
+class NameMatcher:
+    """Finds known names inside a text: one dict lookup per text position and distinct name length, not per name."""
+
+    def __init__(self, names: Iterable[str]):
+        self._names = {name.lower() for name in names if len(name) >= MIN_NAME_CHARS}
+        # Lengths of the names starting with each MIN_NAME_CHARS-character prefix
+        name_lengths: Dict[str, set] = defaultdict(set)
+        for name in self._names:
+            name_lengths[name[:MIN_NAME_CHARS]].add(len(name))
+        self._name_lengths = {prefix: sorted(lengths) for prefix, lengths in name_lengths.items()}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def find(self, text: str) -> List[str]:
+        """Every occurrence of a known name in the (lowercased) text, in order of position."""
+        text = text.lower()
+        found: List[str] = []
+        for start in range(len(text) - MIN_NAME_CHARS + 1):
+            for length in self._name_lengths.get(text[start:start + MIN_NAME_CHARS], ()):
+                name = text[start:start + length]
+                if len(name) == length and name in self._names:
+                    found.append(name)
+        return found
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[int]:
+    """Merges ranked lists of document ids: score(d) = sum over lists of 1 / (k + rank of d)."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+
+class LexicalIndex:
+    """
+    BM25 over tokenize(); document ids are positions in the texts passed to build().
+    Postings are stored term by term in two flat arrays, doc ids and precomputed BM25 term
+    weights, so a query costs one vectorized add per query term. The arrays may be memory-mapped
+    (app/core/knowledge_store.py).
+    """
+
+    def __init__(self, size: int, terms: Dict[str, Tuple[int, int, float]], doc_ids: np.ndarray, weights: np.ndarray,
+                 names: Sequence[Optional[str]] = ()):
+        self._size = size
+        self.terms = terms # term -> (start, end) of its postings in doc_ids/weights, and its idf
+        self.doc_ids = doc_ids # Ascending within each term
+        self.weights = weights
+
+        self._names: Dict[str, List[int]] = defaultdict(list) # lowercased name -> doc ids
+        for doc_id, name in enumerate(names):
+            for alias in split_aliases(name):
+                self._names[alias].append(doc_id)
+        self._names = dict(self._names)
+        self._matcher = NameMatcher(self._names)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], names: Sequence[Optional[str]] = (), k1: float = 1.5, b: float = 0.75) -> "LexicalIndex":
+        # One (term id, doc id, term frequency) triple per posting, turned into per-term ranges in bulk
+        term_ids: Dict[str, int] = {}
+        posting_terms: List[int] = []
+        posting_tfs: List[int] = []
+        posting_counts: List[int] = [] # Distinct terms per doc
+        doc_lengths: List[int] = []
+        for text in texts:
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            doc_lengths.append(len(tokens))
+            posting_counts.append(len(counts))
+            posting_tfs.extend(counts.values())
+            posting_terms.extend([term_ids.setdefault(term, len(term_ids)) for term in counts])
+        n = len(doc_lengths)
+        lengths = np.asarray(doc_lengths, dtype=np.float32)
+        norms = k1 * (1 - b + b * lengths / (float(lengths.mean()) if n and lengths.mean() else 1.0))
+        doc_of = np.repeat(np.arange(n, dtype=np.int32), posting_counts)
+        tf = np.asarray(posting_tfs, dtype=np.float32)
+        weights = tf * (k1 + 1) / (tf + norms[doc_of])
+        term_of = np.asarray(posting_terms, dtype=np.int64)
+        order = np.argsort(term_of, kind="stable") # Stable, so each term's doc ids stay ascending
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(term_of, minlength=len(term_ids))))).tolist()
+        terms: Dict[str, Tuple[int, int, float]] = {}
+        for term, term_id in term_ids.items():
+            low, high = bounds[term_id], bounds[term_id + 1]
+            terms[term] = (low, high, math.log(1.0 + (n - (high - low) + 0.5) / (high - low + 0.5)))
+        return cls(n, terms, doc_of[order], weights[order].astype(np.float32), names)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def search(self, query: str, k: int, ranges: Optional[Sequence[Tuple[int, int]]] = None) -> List[Tuple[int, float]]:
+        """
+        The k best (doc id, BM25 score) pairs for the query, best first. With ranges, only
+        documents in those sorted, non-overlapping [start, end) id ranges are scored.
+        """
+        if ranges is not None and not ranges:
+            return []
+        terms = Counter(tokenize(query))
+        # Ranges covering most of the index are cheaper to score in full and mask
+        if ranges is None or 2 * sum(end - start for start, end in ranges) >= self._size:
+            offset = 0
+            scores = np.zeros(self._size, dtype=np.float32)
+            for term, query_tf in terms.items():
+                posting = self.terms.get(term)
+                if posting is not None:
+                    low, high, idf = posting
+                    scores[self.doc_ids[low:high]] += (idf * query_tf) * self.weights[low:high] # A term lists each doc once, so plain fancy-index add is safe
+            if ranges is not None:
+                in_ranges = np.zeros(self._size, dtype=bool)
+                for start, end in ranges:
+                    in_ranges[start:end] = True
+                scores[~in_ranges] = 0.0
+            ranges = None
+            matched = np.flatnonzero(scores)
+        else:
+            # Scores live in a compact array over the ranges only, so the cost follows their size, not the index's
+            bounds = np.asarray(ranges, dtype=np.int64).reshape(-1)
+            starts = bounds[0::2]
+            bases = np.concatenate(([0], np.cumsum(bounds[1::2] - starts)[:-1]))
+            scores = np.zeros(int((bounds[1::2] - starts).sum()), dtype=np.float32)
+            for term, query_tf in terms.items():
+                posting = self.terms.get(term)
+                if posting is None:
+                    continue
+                ids, weights, idf = self.doc_ids[posting[0]:posting[1]], self.weights[posting[0]:posting[1]], posting[2]
+                cuts = np.searchsorted(ids, bounds) # Posting ids are ascending
+                for r in np.flatnonzero(cuts[1::2] > cuts[0::2]):
+                    low, high = cuts[2 * r], cuts[2 * r + 1]
+                    scores[ids[low:high] - starts[r] + bases[r]] += (idf * query_tf) * weights[low:high]
+            matched = np.flatnonzero(scores)
+            # Back from compact positions to doc ids
+            range_of = np.searchsorted(bases, matched, side="right") - 1
+            offset = starts[range_of] - bases[range_of]
+        if len(matched) > k:
+            keep = np.argpartition(-scores[matched], k - 1)[:k]
+            matched = matched[keep]
+            if ranges is not None:
+                offset = offset[keep]
+        doc_ids = (matched + offset).tolist()
+        ranked = sorted(zip(doc_ids, scores[matched].tolist()), key=lambda pair: (-pair[1], pair[0]))
+        return [(doc_id, float(score)) for doc_id, score in ranked]
+
+    def match_entities(self, query: str) -> List[int]:
+        """Doc ids of entries whose name occurs in the query, longest names first."""
+        found: List[int] = []
+        seen = set()
+        for name in sorted(self._matcher.find(query), key=len, reverse=True):
+            for doc_id in self._names[name]:
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    found.append(doc_id)
+        return found
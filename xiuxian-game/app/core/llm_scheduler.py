@@ -0,0 +1,163 @@
+# app/core/llm_scheduler.py
+"""
+Micro-batching scheduler for LLM completion calls.
+
+Local and self-hosted model servers generate a batch of prompts in about the
+time of one, so sending one prompt per request wastes most of their throughput.
+With LLM_BATCHING on, RAGSystem's non-streamed LLM calls go through
+GenerationScheduler.generate instead of straight to the LLM. A dispatcher thread
+collects queued prompts into one batch and sends it as a single llm.generate
+call. The batch goes out once it has LLM_BATCH_MAX_SIZE prompts, or once its
+oldest prompt has waited its lane's maximum wait. Each caller then gets the
+completion for its own prompt, or the call's exception.
+
+There are two lanes:
+
+  interactive  a player is waiting for the result (story generation); short maximum
+               wait, LLM_BATCH_MAX_WAIT_MS
+  background   nobody is waiting yet (story summaries, speculative generation);
+               LLM_BATCH_BACKGROUND_MAX_WAIT_MS
+
+A batch takes interactive prompts first and fills its free slots with background
+ones, so background work rides along in batches that are going out anyway. A
+background prompt that has waited past its maximum wait gets one slot even if
+the interactive lane could fill the batch, so it can't starve. At most
+LLM_BATCH_CONCURRENCY batches are in flight. While they all are, new prompts
+queue up and go out together in the next batch, so batches grow with load
+without anyone waiting longer than they would behind a busy backend anyway.
+
+Streamed calls (the WebSocket channel's plot tokens) bypass the scheduler:
+batched completions come back whole.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+LANES = ("interactive", "background")
+
+
+class _Request:
+    __slots__ = ("prompt", "lane", "enqueued", "future")
+
+    def __init__(self, prompt: str, lane: str):
+        self.prompt = prompt
+        self.lane = lane
+        self.enqueued = time.monotonic()
+        self.future: Future = Future()
+
+
+class GenerationScheduler:
+    def __init__(self, llm: Any, max_batch_size: int, max_wait: float, background_max_wait: float, concurrency: int):
+        self.llm = llm
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = {"interactive": max_wait, "background": max(max_wait, background_max_wait)} # Seconds, by lane
+        self.concurrency = max(1, concurrency)
+        self._queues: Dict[str, Deque[_Request]] = {lane: deque() for lane in LANES}
+        self._changed = threading.Condition()
+        self._free_slots = threading.Semaphore(self.concurrency) # One per batch that may be in flight
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="llm-batch")
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._queue_wait = {lane: metrics.LLM_QUEUE_WAIT.labels(lane) for lane in LANES}
+
+    @classmethod
+    def from_settings(cls, llm: Any) -> "GenerationScheduler":
+        return cls(
+            llm,
+            max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+            max_wait=settings.LLM_BATCH_MAX_WAIT_MS / 1000.0,
+            background_max_wait=settings.LLM_BATCH_BACKGROUND_MAX_WAIT_MS / 1000.0,
+            concurrency=settings.LLM_BATCH_CONCURRENCY,
+        )
+
+    def generate(self, prompt: str, lane: str = "interactive") -> str:
+        """The completion of `prompt`, generated in a batch with other queued prompts. Raises what the LLM call raised."""
+        if lane not in self._queues:
+            raise ValueError(f"Unknown LLM scheduler lane {lane!r}; expected one of {LANES}")
+        request = _Request(prompt, lane)
+        with self._changed:
+            if self._stopping:
+                raise RuntimeError("LLM scheduler is shut down")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-scheduler", daemon=True)
+                self._thread.start()
+            self._queues[lane].append(request)
+            self._changed.notify()
+        return request.future.result()
+
+    def queued(self) -> Dict[str, int]:
+        """Prompts waiting for a batch, by lane."""
+        with self._changed:
+            return {lane: len(queue) for lane, queue in self._queues.items()}
+
+    def shutdown(self) -> None:
+        """Sends what is queued, waits for the batches in flight and stops the dispatcher."""
+        with self._changed:
+            self._stopping = True
+            self._changed.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=30)
+        self._executor.shutdown(wait=True)
+
+    # --- Dispatcher ---
+
+    def _run(self) -> None:
+        while True:
+            self._free_slots.acquire() # Form the next batch only once it can be sent; prompts keep queueing meanwhile
+            batch = self._next_batch()
+            if batch is None:
+                self._free_slots.release()
+                return
+            self._executor.submit(self._dispatch, batch)
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        """Blocks until a batch is due and takes it off the queues. None once shut down with nothing queued."""
+        interactive, background = self._queues["interactive"], self._queues["background"]
+        with self._changed:
+            while True:
+                queued = len(interactive) + len(background)
+                if not queued:
+                    if self._stopping:
+                        return None
+                    self._changed.wait()
+                    continue
+                now = time.monotonic()
+                due = min(queue[0].enqueued + self.max_wait[lane] for lane, queue in self._queues.items() if queue)
+                if queued >= self.max_batch_size or now >= due or self._stopping:
+                    break
+                self._changed.wait(due - now)
+
+            batch: List[_Request] = []
+            if background and now >= background[0].enqueued + self.max_wait["background"]:
+                batch.append(background.popleft()) # Overdue: a slot even if interactive prompts could fill the batch
+            while interactive and len(batch) < self.max_batch_size:
+                batch.append(interactive.popleft())
+            while background and len(batch) < self.max_batch_size:
+                batch.append(background.popleft())
+            return batch
+
+    def _dispatch(self, batch: List[_Request]) -> None:
+        try:
+            sent = time.monotonic()
+            for request in batch:
+                self._queue_wait[request.lane].observe(sent - request.enqueued)
+            metrics.LLM_BATCH_SIZE.observe(len(batch))
+            try:
+                result = self.llm.generate([request.prompt for request in batch])
+                texts = [generations[0].text for generations in result.generations]
+                if len(texts) != len(batch):
+                    raise ValueError(f"LLM returned {len(texts)} completions for a batch of {len(batch)} prompts")
+            except Exception as e: # Each caller logs it, as it would a failed call of its own
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+            for request, text in zip(batch, texts):
+                request.future.set_result(text)
+        finally:
+            self._free_slots.release()
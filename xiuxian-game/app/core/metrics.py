@@ -0,0 +1,237 @@
+# app/core/metrics.py
+"""
+Prometheus metrics for the service, served at /metrics.
+
+Hot-path cost is kept down by binding label children ahead of time: modules
+hold on to the child for their fixed label values (e.g. STORY_FALLBACKS["llm_error"])
+and per-route children are cached in a dict, so recording a sample is a dict
+lookup plus an observe() call.
+
+Multiple uvicorn workers: set PROMETHEUS_MULTIPROC_DIR to an empty directory
+before starting uvicorn. prometheus_client then keeps values in per-process
+mmap files and /metrics aggregates every worker's files on each scrape.
+Gauges use "livesum" so values of exited workers are dropped.
+"""
+import os
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Latency buckets (seconds). Requests and LLM calls take up to tens of seconds; retrieval and plugins are sub-second.
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# --- HTTP ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", multiprocess_mode="livesum",
+)
+
+UNMATCHED_ROUTE = "<unmatched>" # Keeps label cardinality bounded for 404 scans
+_route_children: Dict[Tuple[str, str, str], Histogram] = {}
+
+
+def _status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+def request_duration_child(method: str, route: str, status_code: int) -> Histogram:
+    """The pre-bound histogram child for a (method, route, status class) combination."""
+    key = (method, route, _status_class(status_code))
+    child = _route_children.get(key)
+    if child is None:
+        child = _route_children[key] = HTTP_REQUEST_DURATION.labels(*key)
+    return child
+
+
+def prebind_routes(app) -> None:
+    """Binds the 2xx children for every route at startup so the first requests don't pay for it."""
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ():
+            request_duration_child(method, route.path, 200)
+
+# --- Database pool ---
+
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured connection pool size", multiprocess_mode="livesum")
+DB_POOL_CONNECTIONS_OPEN = Gauge("db_pool_connections_open", "Open DB connections", multiprocess_mode="livesum")
+DB_POOL_CONNECTIONS_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out", "DB connections currently checked out of the pool", multiprocess_mode="livesum",
+)
+
+
+def _on_connect(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS_OPEN.inc()
+
+
+def _on_close(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS_OPEN.dec()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CONNECTIONS_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS_CHECKED_OUT.dec()
+
+
+def instrument_pool(engine) -> None:
+    """Tracks pool usage through SQLAlchemy pool events."""
+    from sqlalchemy import event
+
+    if event.contains(engine, "checkout", _on_checkout):
+        return
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        DB_POOL_SIZE.set(size())
+    event.listen(engine, "connect", _on_connect)
+    event.listen(engine, "close", _on_close)
+    event.listen(engine, "checkout", _on_checkout)
+    event.listen(engine, "checkin", _on_checkin)
+
+# --- Story generation ---
+
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "LLM call latency", ["backend"], buckets=REQUEST_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens sent to and received from the LLM", ["backend", "direction"])
+# Batched LLM calls (app/core/llm_scheduler.py, LLM_BATCHING)
+LLM_BATCH_SIZE = Histogram("llm_batch_size", "Prompts per batched LLM completion call", buckets=(1, 2, 4, 8, 16, 32, 64))
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "Time prompts wait for their batch to be sent, by scheduler lane", ["lane"], buckets=FAST_BUCKETS,
+)
+RETRIEVAL_DURATION = Histogram(
+    "rag_retrieval_duration_seconds", "Knowledge-base retrieval latency by stage", ["stage"], buckets=FAST_BUCKETS,
+)
+STORY_FALLBACKS = Counter(
+    "story_generation_fallbacks_total", "Default error scenes returned instead of a generated scene", ["reason"],
+)
+
+# Fallback reasons, one per _get_default_error_scene path in RAGSystem
+FALLBACK_REASONS = ("llm_unavailable", "llm_error", "deadline", "json_error", "structure_error", "unexpected_error")
+
+# Story LLM calls under the generation policy (app/core/generation_policy.py). "lost": abandoned or beaten
+# by another attempt of the same call, or finished after the deadline
+_STORY_LLM_ATTEMPTS = Counter("story_llm_attempts_total", "Story LLM calls by kind and result", ["kind", "result"])
+STORY_LLM_ATTEMPTS = {
+    (kind, result): _STORY_LLM_ATTEMPTS.labels(kind, result)
+    for kind in ("first", "hedge", "retry", "repair") for result in ("won", "lost", "failed")
+}
+
+STORY_GENERATIONS_COALESCED = Counter(
+    "story_generations_coalesced_total", "Story generations that shared a concurrent identical generation's LLM call instead of making their own",
+)
+
+# Story outputs json.loads rejected but the lenient parser (app/core/lenient_json.py) read; unreadable ones
+# are story_generation_fallbacks_total{reason="json_error"|"structure_error"}
+_STORY_OUTPUT_PARSES = Counter("story_output_parses_total", "Story LLM outputs read into a scene, as well-formed or repaired JSON", ["result"])
+STORY_OUTPUT_PARSES = {result: _STORY_OUTPUT_PARSES.labels(result) for result in ("clean", "repaired")}
+_STORY_OUTPUT_REPAIRS = Counter("story_output_repairs_total", "Story LLM outputs that needed each kind of repair to be read", ["repair"])
+# lenient_json's repairs, then the scene-level ones in RAGSystem._parse_llm_output
+OUTPUT_REPAIRS = (
+    "trailing_comma", "missing_comma", "unquoted_key", "single_quotes", "unescaped_quote", "python_literal", "comment",
+    "control_char", "bad_escape", "fullwidth_punctuation", "number", "truncated", "choice_id", "extra_choices", "duration",
+)
+STORY_OUTPUT_REPAIRS = {repair: _STORY_OUTPUT_REPAIRS.labels(repair) for repair in OUTPUT_REPAIRS}
+
+_STORY_SUMMARIES = Counter("story_summaries_total", "Rolling story summary updates by result", ["result"])
+STORY_SUMMARIES = {result: _STORY_SUMMARIES.labels(result) for result in ("ok", "error")}
+
+# Story prompt size by section after trimming to PROMPT_TOKEN_BUDGET (app/core/prompt_builder.py)
+PROMPT_SECTION_TOKENS = Histogram(
+    "prompt_section_tokens", "Tokens per story prompt section", ["section"],
+    buckets=(0, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+PROMPT_SECTIONS_TRIMMED = Counter("prompt_sections_trimmed_total", "Prompts in which a section was trimmed to fit the budget", ["section"])
+
+
+def prompt_section_metrics(section: str) -> Tuple[Histogram, Counter]:
+    """Pre-bound (tokens, trimmed) metrics for a named prompt section."""
+    return PROMPT_SECTION_TOKENS.labels(section), PROMPT_SECTIONS_TRIMMED.labels(section)
+
+RETRIEVAL_SCANNED = Histogram(
+    "rag_retrieval_scanned_entries", "Knowledge-base entries in the partitions a retrieval searched",
+    buckets=(16, 64, 256, 1024, 4096, 16384, 65536, 262144),
+)
+# Knowledge-base (re)loads (app/core/knowledge_loader.py)
+_KB_LOADS = Counter("rag_index_loads_total", "Knowledge-base index loads and reloads by result", ["result"])
+KB_LOADS = {result: _KB_LOADS.labels(result) for result in ("ok", "error")}
+KB_ENTRIES_EMBEDDED = Counter("rag_index_embedded_entries_total", "Knowledge-base entries embedded; unchanged entries reuse their vectors")
+# Embedder calls by the batched pipeline (app/core/embedding_pipeline.py); "retried" counts failed attempts that were retried
+_KB_EMBED_BATCHES = Counter("rag_index_embed_batches_total", "Knowledge-base embedding batches by result", ["result"])
+KB_EMBED_BATCHES = {result: _KB_EMBED_BATCHES.labels(result) for result in ("ok", "retried", "failed")}
+# 1 for the version a worker serves, 0 for versions it has replaced. Summed over workers,
+# rag_index_version{version="..."} is how many workers serve each version.
+KB_INDEX_VERSION = Gauge("rag_index_version", "Knowledge-base index version served", ["version"], multiprocess_mode="livesum")
+
+_RETRIEVAL_PATHS = Counter("rag_retrievals_total", "Knowledge-base retrievals by path", ["path"])
+
+RETRIEVAL_EMBED = RETRIEVAL_DURATION.labels("embed")
+RETRIEVAL_SEARCH = RETRIEVAL_DURATION.labels("search")
+RETRIEVAL_LEXICAL = RETRIEVAL_DURATION.labels("lexical")
+# "lexical": the query named known entries, no embedding; "hybrid": vector + BM25 fused
+RETRIEVAL_PATHS = {path: _RETRIEVAL_PATHS.labels(path) for path in ("lexical", "hybrid")}
+STORY_FALLBACK_COUNTERS = {reason: STORY_FALLBACKS.labels(reason) for reason in FALLBACK_REASONS}
+
+# --- Caches ---
+
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+
+
+def cache_counters(cache: str) -> Tuple[Counter, Counter]:
+    """Pre-bound (hit, miss) counters for a named cache. Hit rate = hit / (hit + miss)."""
+    return CACHE_LOOKUPS.labels(cache, "hit"), CACHE_LOOKUPS.labels(cache, "miss")
+
+# Write-behind game state flushes (app/services/session_cache.py)
+_WRITE_BEHIND_FLUSHES = Counter("write_behind_flushes_total", "Game state flushes by result", ["result"])
+WRITE_BEHIND_FLUSHES = {result: _WRITE_BEHIND_FLUSHES.labels(result) for result in ("ok", "conflict", "error")}
+WRITE_BEHIND_FLUSH_DURATION = Histogram(
+    "write_behind_flush_duration_seconds", "Time to write one game state snapshot", buckets=FAST_BUCKETS,
+)
+
+# Pre-generated scene pool (app/services/scene_pool.py). use: "opening" (/game/start) or "fallback" (in place
+# of the default error scene); miss: nothing pooled for the character's identity and stage
+_SCENE_POOL_DRAWS = Counter("scene_pool_draws_total", "Scene pool lookups by use and result", ["use", "result"])
+SCENE_POOL_DRAWS = {(use, result): _SCENE_POOL_DRAWS.labels(use, result) for use in ("opening", "fallback") for result in ("hit", "miss")}
+_SCENE_POOL_GENERATIONS = Counter("scene_pool_generations_total", "Scenes generated for the pool by result", ["result"])
+SCENE_POOL_GENERATIONS = {result: _SCENE_POOL_GENERATIONS.labels(result) for result in ("ok", "failed")}
+SCENE_POOL_SIZE = Gauge("scene_pool_scenes", "Pre-generated scenes held by this worker", multiprocess_mode="livesum")
+
+# --- Plugins ---
+
+PLUGIN_HANDLER_DURATION = Histogram(
+    "plugin_handler_duration_seconds", "Time spent in a plugin's handle_event", ["plugin", "event"], buckets=FAST_BUCKETS,
+)
+PLUGIN_HANDLER_ERRORS = Counter("plugin_handler_errors_total", "Exceptions raised by plugin handlers", ["plugin", "event"])
+
+# --- Exposition ---
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Returns the exposition body and content type, aggregating all workers in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drops this worker's live gauges from the aggregate. Called on shutdown."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
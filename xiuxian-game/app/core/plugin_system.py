@@ -1,10 +1,17 @@
 # app/core/plugin_system.py
 import importlib.util
 import inspect
+import logging
 import os
+import time
 from pathlib import Path
 from typing import Dict, List, Any, Type, Optional
 
+from app.core import metrics
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
 # --- Base Plugin Interface ---
 class BasePlugin:
     """基础插件接口"""
@@ -19,7 +26,7 @@ class BasePlugin:
 
     def initialize(self) -> bool:
         """插件初始化. 返回True表示成功, False表示失败."""
-        print(f"Initializing plugin: {self.name} v{self.version}")
+        logger.info("Initializing plugin: %s v%s", self.name, self.version)
         return True
 
     def handle_event(self, event_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -34,7 +41,7 @@ class BasePlugin:
 
     def cleanup(self) -> bool:
         """插件清理. 返回True表示成功, False表示失败."""
-        print(f"Cleaning up plugin: {self.name} v{self.version}")
+        logger.info("Cleaning up plugin: %s v%s", self.name, self.version)
         return True
 
 # --- Simplified Event Types (as per MVP doc) ---
@@ -42,12 +49,8 @@ PLUGIN_EVENTS = {
     "character_created": "角色创建后触发",
     "game_started": "游戏开始时触发",
     "choice_made": "玩家做出选择后触发",
-<<<<<<< HEAD
-    "scene_generated": "新场景生成后触发"
-=======
     "scene_generated": "新场景生成后触发",
     "game_loaded": "游戏从存档加载后触发" # ADDED
->>>>>>> origin/haa
     # Add more events as needed
 }
 
@@ -64,21 +67,22 @@ class PluginManager:
         # For this subtask, assume 'plugins' is at the same level as where the app would be run from (e.g. project root)
         self.plugins_dir = Path(plugins_dir)
         self._loaded_plugin_modules = {} # To keep track of loaded modules
+        self._handler_metrics: Dict[tuple, tuple] = {} # (plugin, event) -> pre-bound (duration, errors) children
 
     def load_plugins(self):
         """加载所有插件"""
         if not self.plugins_dir.is_dir():
-            print(f"Plugins directory '{self.plugins_dir.resolve()}' not found or not a directory.")
+            logger.warning("Plugins directory '%s' not found or not a directory.", self.plugins_dir.resolve())
             return
 
-        print(f"Scanning for plugins in '{self.plugins_dir.resolve()}'...")
+        logger.info("Scanning for plugins in '%s'...", self.plugins_dir.resolve())
         for file_path in self.plugins_dir.glob("*.py"):
             if file_path.name == "__init__.py":
                 continue # Skip __init__.py files
 
             module_name = file_path.stem
             if module_name in self._loaded_plugin_modules:
-                print(f"Module {module_name} already loaded. Skipping.")
+                logger.info("Module %s already loaded. Skipping.", module_name)
                 continue
 
             try:
@@ -94,28 +98,44 @@ class PluginManager:
                             try:
                                 plugin_instance = obj(plugin_manager=self) # Pass self (PluginManager)
                                 if plugin_instance.name in self.plugins:
-                                    print(f"Warning: Plugin with name '{plugin_instance.name}' already loaded. Skipping {obj.__name__} from {file_path.name}.")
+                                    logger.warning("Plugin with name '%s' already loaded. Skipping %s from %s.", plugin_instance.name, obj.__name__, file_path.name)
                                     continue
 
                                 if plugin_instance.initialize():
                                     self.plugins[plugin_instance.name] = plugin_instance
-                                    print(f"Successfully loaded and initialized plugin: {plugin_instance.name} v{plugin_instance.version} from {file_path.name}")
+                                    self._bind_handler_metrics(plugin_instance.name)
+                                    logger.info("Successfully loaded and initialized plugin: %s v%s from %s", plugin_instance.name, plugin_instance.version, file_path.name)
                                 else:
-                                    print(f"Failed to initialize plugin: {plugin_instance.name} from {file_path.name}")
+                                    logger.error("Failed to initialize plugin: %s from %s", plugin_instance.name, file_path.name)
                             except Exception as e:
-                                print(f"Error instantiating or initializing plugin {name} from {file_path.name}: {e}")
+                                logger.exception("Error instantiating or initializing plugin %s from %s: %s", name, file_path.name, e)
                 else:
-                    print(f"Could not create module spec for {file_path.name}. Skipping.")
+                    logger.warning("Could not create module spec for %s. Skipping.", file_path.name)
             except Exception as e:
-                print(f"Error loading plugin module from {file_path.name}: {e}")
+                logger.exception("Error loading plugin module from %s: %s", file_path.name, e)
 
         if not self.plugins:
-            print("No plugins were loaded.")
+            logger.info("No plugins were loaded.")
+
+    def _bind_handler_metrics(self, plugin_name: str):
+        """Binds the metric children for every known event at load time, off the request path."""
+        for event_type in PLUGIN_EVENTS:
+            self._get_handler_metrics(plugin_name, event_type)
+
+    def _get_handler_metrics(self, plugin_name: str, event_type: str) -> tuple:
+        key = (plugin_name, event_type)
+        handler_metrics = self._handler_metrics.get(key)
+        if handler_metrics is None:
+            handler_metrics = self._handler_metrics[key] = (
+                metrics.PLUGIN_HANDLER_DURATION.labels(plugin_name, event_type),
+                metrics.PLUGIN_HANDLER_ERRORS.labels(plugin_name, event_type),
+            )
+        return handler_metrics
 
     def emit_event(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """发送事件到所有已加载并初始化的插件"""
         if event_type not in PLUGIN_EVENTS:
-            print(f"Warning: Emitting unknown event type '{event_type}'. Known events: {PLUGIN_EVENTS}")
+            logger.warning("Emitting unknown event type '%s'. Known events: %s", event_type, list(PLUGIN_EVENTS))
             # Depending on strictness, you might choose to not proceed or proceed cautiously.
             # For now, we'll proceed.
 
@@ -125,15 +145,23 @@ class PluginManager:
 
         current_data = data.copy() # Work on a copy to allow plugins to modify it sequentially
 
-        for plugin_name, plugin in self.plugins.items():
-            try:
-                print(f"Emitting event '{event_type}' to plugin '{plugin_name}'")
-                returned_data = plugin.handle_event(event_type, current_data)
-                if returned_data is not None and isinstance(returned_data, dict):
-                    current_data = returned_data # Update data for the next plugin
-                # If plugin returns None, current_data remains unchanged for the next plugin
-            except Exception as e:
-                print(f"Error in plugin {plugin_name} during event '{event_type}': {e}")
+        with tracer.start_span("plugins.emit_event", {"plugin.event": event_type, "plugin.count": len(self.plugins)}):
+            for plugin_name, plugin in self.plugins.items():
+                duration_metric, error_metric = self._get_handler_metrics(plugin_name, event_type)
+                with tracer.start_span("plugin.handle_event", {"plugin.name": plugin_name, "plugin.event": event_type}) as span:
+                    start = time.perf_counter()
+                    try:
+                        logger.debug("Emitting event '%s' to plugin '%s'", event_type, plugin_name)
+                        returned_data = plugin.handle_event(event_type, current_data)
+                        if returned_data is not None and isinstance(returned_data, dict):
+                            current_data = returned_data # Update data for the next plugin
+                        # If plugin returns None, current_data remains unchanged for the next plugin
+                    except Exception as e:
+                        span.record_exception(e)
+                        error_metric.inc()
+                        logger.exception("Error in plugin %s during event '%s': %s", plugin_name, event_type, e,
+                                         extra={"plugin": plugin_name, "event": event_type})
+                    duration_metric.observe(time.perf_counter() - start)
 
         return current_data # Return the final data after all plugins have processed it
 
@@ -143,7 +171,8 @@ class PluginManager:
             try:
                 plugin.cleanup()
             except Exception as e:
-                print(f"Error during cleanup of plugin {plugin_name}: {e}")
+                logger.exception("Error during cleanup of plugin %s: %s", plugin_name, e)
             del self.plugins[plugin_name]
         self._loaded_plugin_modules.clear()
-        print("All plugins unloaded.")
+        self._handler_metrics.clear()
+        logger.info("All plugins unloaded.")
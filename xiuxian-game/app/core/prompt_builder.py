@@ -0,0 +1,156 @@
+# app/core/prompt_builder.py
+"""
+Token-budgeted prompt assembly.
+
+A prompt template is filled from named sections, each with a priority. Token
+counts come from a local tokenizer (TokenCounter); when the filled prompt is
+over PROMPT_TOKEN_BUDGET, the lowest-priority sections are trimmed first, down
+to their min_tokens, and only then below it, each in its own way:
+
+  "tail"   cut from the end (retrieved context, summaries)
+  "lines"  drop whole lines from the start (event lists, oldest first)
+
+Required sections are never trimmed. The template's static text is counted once
+when the builder is created, not on every prompt. Section sizes and trims are
+reported to metrics (prompt_section_tokens, prompt_sections_trimmed_total).
+"""
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """Counts and truncates text in the tokens of a tokenizer."""
+
+    def __init__(self, name: str, count: Callable[[str], int],
+                 encode: Optional[Callable[[str], List[int]]] = None, decode: Optional[Callable[[List[int]], str]] = None):
+        self.name = name
+        self._count = count
+        self._encode = encode
+        self._decode = decode
+
+    def count(self, text: str) -> int:
+        return self._count(text) if text else 0
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of text that is at most max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self._encode is not None:
+            tokens = self._encode(text)
+            return text if len(tokens) <= max_tokens else self._decode(tokens[:max_tokens])
+        if self.count(text) <= max_tokens:
+            return text
+        low, high = 0, len(text) # Counters without an encoder: binary search on the prefix length
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+def tiktoken_counter(encoding_name: str) -> TokenCounter:
+    """A TokenCounter for a tiktoken encoding. Raises if tiktoken or the encoding's files are unavailable."""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+    return TokenCounter(
+        encoding_name,
+        count=lambda text: len(encoding.encode(text, disallowed_special=())),
+        encode=lambda text: encoding.encode(text, disallowed_special=()),
+        decode=encoding.decode,
+    )
+
+
+class PromptSection:
+    def __init__(self, name: str, text: str, priority: int, trim: str = "tail", min_tokens: int = 0, required: bool = False):
+        self.name = name # Template variable it fills
+        self.text = text
+        self.priority = priority # Lower priorities are trimmed first
+        self.trim = trim # "tail" or "lines"
+        self.min_tokens = min_tokens # Kept until every optional section is down to its own minimum
+        self.required = required
+
+
+class BuiltPrompt:
+    def __init__(self, text: str, tokens: int, section_tokens: Dict[str, int], trimmed: List[str]):
+        self.text = text
+        self.tokens = tokens
+        self.section_tokens = section_tokens
+        self.trimmed = trimmed
+
+
+class PromptBuilder:
+    def __init__(self, template: str, counter: TokenCounter, budget: int):
+        self.template = template
+        self.counter = counter
+        self.budget = budget
+        # The template without any section text; its size is the same for every prompt
+        self._static_tokens = counter.count(template.format_map(_Blank()))
+        self._section_metrics: Dict[str, Tuple] = {} # Section name -> metrics.prompt_section_metrics, bound on first use
+
+    def build(self, sections: List[PromptSection]) -> BuiltPrompt:
+        texts = {s.name: s.text for s in sections}
+        tokens = {s.name: self.counter.count(s.text) for s in sections}
+        trimmed: List[str] = []
+
+        over = self._static_tokens + sum(tokens.values()) - self.budget
+        optional = sorted((s for s in sections if not s.required), key=lambda s: s.priority)
+        for use_floor in (True, False):
+            for section in optional:
+                floor = section.min_tokens if use_floor else 0
+                if over <= 0:
+                    break
+                if tokens[section.name] <= floor:
+                    continue
+                target = max(floor, tokens[section.name] - over)
+                if section.trim == "lines":
+                    texts[section.name] = self._drop_leading_lines(texts[section.name], target)
+                else:
+                    texts[section.name] = self.counter.truncate(texts[section.name], target)
+                new_tokens = self.counter.count(texts[section.name])
+                over -= tokens[section.name] - new_tokens
+                tokens[section.name] = new_tokens
+                if section.name not in trimmed:
+                    trimmed.append(section.name)
+        for name in trimmed:
+            self._metrics(name)[1].inc()
+        if over > 0:
+            logger.warning("Prompt is %d tokens over its budget of %d after trimming every optional section.", over, self.budget)
+
+        for name, count in tokens.items():
+            self._metrics(name)[0].observe(count)
+        return BuiltPrompt(
+            text=self.template.format(**texts),
+            tokens=self._static_tokens + sum(tokens.values()),
+            section_tokens=tokens,
+            trimmed=trimmed,
+        )
+
+    def _metrics(self, name: str) -> Tuple:
+        section_metrics = self._section_metrics.get(name)
+        if section_metrics is None:
+            section_metrics = self._section_metrics[name] = metrics.prompt_section_metrics(name)
+        return section_metrics
+
+    def _drop_leading_lines(self, text: str, max_tokens: int) -> str:
+        lines = text.split("\n")
+        kept: List[str] = []
+        used = 0
+        for line in reversed(lines): # Keep the latest lines
+            line_tokens = self.counter.count(line) + 1 # +1 for the newline
+            if used + line_tokens > max_tokens:
+                break
+            kept.append(line)
+            used += line_tokens
+        return "\n".join(reversed(kept))
+
+
+class _Blank(dict):
+    def __missing__(self, key: str) -> str:
+        return ""
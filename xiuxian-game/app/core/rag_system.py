@@ -1,47 +1,13 @@
 # app/core/rag_system.py
+import hashlib
 import os
-<<<<<<< HEAD
-import re # Import re for parsing
-from pathlib import Path
-from typing import Dict, Any, List, Optional # Added Optional
-
-from langchain.llms.openai import OpenAI # Corrected import for OpenAI LLM
-from langchain.embeddings.openai import OpenAIEmbeddings # Corrected import
-from langchain.vectorstores.faiss import FAISS
-# from langchain.chains import RetrievalQA # Not used in the MVP snippet, direct retrieval and formatting
-from langchain.prompts import PromptTemplate
-from langchain.docstore.document import Document # For creating documents for FAISS
-
-from app.core.config import settings
-from app.schemas.game_schemas import StoryScene, StoryChoice # For return type
-
-class RAGSystem:
-    """简化的RAG系统"""
-
-    def __init__(self):
-        self.knowledge_base: Optional[FAISS] = None # Type hint for clarity
-        # Ensure API key is available
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY not set in environment variables.")
-
-        self.llm = OpenAI(temperature=0.7, openai_api_key=settings.OPENAI_API_KEY)
-        self.embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
-        self.load_knowledge_base()
-
-    def load_knowledge_base(self):
-        """加载知识库"""
-        kb_dir = Path("knowledge_base") # Assuming this is relative to project root
-        documents_for_faiss: List[Document] = [] # Use Langchain Document objects
-
-        if not kb_dir.exists() or not kb_dir.is_dir():
-            print(f"Knowledge base directory {kb_dir.resolve()} not found or is not a directory.")
-            # In a real app, might raise an error or handle this more gracefully
-            self.knowledge_base = None # Ensure it's None if loading fails
-=======
 import re # Keep re for any potential fallback or minor string cleaning if needed
 import json # ADDED for JSON parsing
+import logging
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, List, Optional # Ensure Optional is imported
+from typing import Callable, Dict, Any, List, Optional, Tuple # Ensure Optional is imported
 
 # Langchain imports - ensure these are compatible with current langchain version
 # For OpenAI, it's likely from langchain_openai now
@@ -53,22 +19,220 @@ from typing import Dict, Any, List, Optional # Ensure Optional is imported
 # If using newer langchain:
 from langchain_openai import OpenAI, OpenAIEmbeddings
 
-from langchain.vectorstores.faiss import FAISS
-from langchain.prompts import PromptTemplate
-from langchain.docstore.document import Document
 
+from app.core import metrics
 from app.core.config import settings
+from app.core.generation_policy import AttemptBudget, DeadlineExceeded, GenerationPolicy
+from app.core.knowledge_index import KnowledgeIndex, Partition, RetrievalScope
+from app.core.knowledge_loader import KnowledgeBaseLoader, LoadResult
+from app.core.lenient_json import loads_object
+from app.core.lexical_index import reciprocal_rank_fusion
+from app.core.llm_scheduler import GenerationScheduler
+from app.core.prompt_builder import BuiltPrompt, PromptBuilder, PromptSection, TokenCounter, tiktoken_counter
+from app.core.single_flight import SingleFlight
+from app.core.stub_llm import StubLLM, HashingEmbeddings
+from app.core.tracing import tracer
 # Assuming StoryScene and StoryChoice schemas are updated as per Plan Step 1 (new plan)
 from app.schemas.game_schemas import StoryScene, StoryChoice
 
+logger = logging.getLogger(__name__)
+
+_PLOT_VALUE_START = re.compile(r'"plot"\s*:\s*"')
+
+# Stands in for the character's name in prompts shared across names (STORY_COALESCE_ACROSS_NAMES);
+# each player's copy of the output gets their own name in its place
+CHARACTER_NAME_TOKEN = "[[NAME]]"
+
+# Prompt for JSON story output. Literal braces are doubled for str.format.
+STORY_PROMPT_TEMPLATE = """
+You are an AI storyteller for a text-based cultivation (Xianxia) game.
+Your task is to generate the next part of the story based on the provided information.
+The user is playing as: {character_info}
+Other details about them: {character_extras}
+Current in-game date: {current_date}
+The story so far: {summary}
+Most recent events, oldest first:
+{history}
+Relevant background knowledge from the game world:
+{context}
+
+Please generate the output as a single, valid JSON object. Do NOT write any text outside this JSON object.
+The JSON object must have the following structure:
+{{
+  "plot": "A short, engaging plot description for the current scene. This should be 2-3 sentences long.",
+  "choices": [
+    {{"id": "choice_1", "text": "A brief text for the first choice (10-15 words max)."}},
+    {{"id": "choice_2", "text": "A brief text for the second choice (10-15 words max)."}},
+    {{"id": "choice_3", "text": "A brief text for the third choice (10-15 words max)."}}
+  ],
+  "duration_days": <an integer between 1 and 7, representing the number of in-game days this plot segment will take>
+}}
+
+Ensure the plot is concise and leads to the choices. The choices should be distinct actions the player can take.
+Example for "plot": "You arrive at the Whispering Glade, sunlight filtering through ancient trees. A faint spiritual energy emanates from a moss-covered shrine in the center."
+Example for "duration_days": 3
+
+Current JSON output:
+"""
+
+# Prompt for condensing older story events into the rolling summary (summarize_story)
+SUMMARY_PROMPT_TEMPLATE = """
+You keep the chronicle of a text-based cultivation (Xianxia) game.
+Rewrite the chronicle so far and the new events below into one updated chronicle of at most 150 words.
+Keep names, places, sects, cultivation breakthroughs, promises and unresolved threads; drop scenery and repetition.
+Write plain prose in the language of the events. Do not write anything else.
+
+Chronicle so far: {summary}
+
+New events, oldest first:
+{events}
+
+Updated chronicle:
+"""
+
+# Repair re-prompt for story output that can't be parsed (_repair_story_output). Only the broken output is
+# sent, not the story context, so it costs a fraction of the story prompt.
+REPAIR_PROMPT_TEMPLATE = """
+The text below was meant to be one JSON object with a "plot" string, a "choices" list of exactly 3 objects
+with "id" and "text" strings, and an integer "duration_days" from 1 to 7, but it is malformed or cut off.
+Reply with only the corrected JSON object. Keep the plot and choice texts as they are, and complete any that were cut off.
+
+{output}
+"""
+
+# Character fields that describe them in the story; anything else plugins added goes in character_extras
+CHARACTER_PROMPT_FIELDS = ("name", "level", "cultivation_stage", "experience", "identity", "attributes")
+# Bookkeeping fields that mean nothing to the storyteller
+CHARACTER_OMITTED_FIELDS = ("id", "user_id", "identity_id", "created_at", "updated_at")
+
+# Trimmed lowest priority first when a story prompt is over PROMPT_TOKEN_BUDGET
+PROMPT_PRIORITY_RECENT_EVENTS = 80
+PROMPT_PRIORITY_SUMMARY = 60
+PROMPT_PRIORITY_CONTEXT = 40
+PROMPT_PRIORITY_CHARACTER_EXTRAS = 20
+PROMPT_MIN_TOKENS = 150 # History, summary and context keep this much until all three are down to it
+
+def format_story_events(events: List[Dict[str, Any]]) -> str:
+    """One line per story event: date, plot and the action taken, without the choices not taken."""
+    lines = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        line = f"- [{event.get('date_after_event') or event.get('date_before_event') or '?'}] {event.get('plot', '')}"
+        action = event.get("action_taken")
+        if isinstance(action, dict) and action.get("text"):
+            line += f" (Chose: {action['text']})"
+        lines.append(line)
+    return "\n".join(lines)
+
+class PlotStreamExtractor:
+    """
+    Pulls the decoded value of the "plot" field out of the LLM's JSON output while it
+    streams in, so the plot can be shown token by token before the object is complete.
+    """
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: Optional[int] = None # Index of the next undecoded plot character
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk of raw output and returns the plot text it completed (may be empty)."""
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if self._pos is None:
+            match = _PLOT_VALUE_START.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, out = self._buffer, self._pos, []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch == "\\":
+                if i + 1 >= len(buf):
+                    break # Escape split across chunks; wait for the rest
+                escape = buf[i + 1]
+                if escape == "u":
+                    if i + 6 > len(buf):
+                        break
+                    try:
+                        out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(self._ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return "".join(out)
+
+class _TokenStream:
+    """
+    Passes streamed text on to emit with every `token` replaced by `value`. The tail of a piece that
+    could be the start of a token is held back until the next piece (or flush) shows whether it is.
+    """
+
+    def __init__(self, emit: Callable[[str], None], token: str, value: str):
+        self._emit = emit
+        self._token = token
+        self._value = value
+        self._pending = ""
+
+    def __call__(self, delta: str) -> None:
+        text = (self._pending + delta).replace(self._token, self._value)
+        held = next((n for n in range(min(len(text), len(self._token) - 1), 0, -1) if self._token.startswith(text[-n:])), 0)
+        self._pending = text[len(text) - held:]
+        if len(text) > held:
+            self._emit(text[:len(text) - held])
+
+    def flush(self) -> None:
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = ""
+
 class RAGSystem:
     """简化的RAG系统 - Modified for JSON output"""
 
     def __init__(self):
-        self.knowledge_base: Optional[FAISS] = None
+        self.knowledge_base: Optional[KnowledgeIndex] = None # Replaced whole on reload, never modified in place
+        self.kb_dir = Path("knowledge_base")
+        self.kb_loader: Optional[KnowledgeBaseLoader] = None
+        self._kb_load_lock = threading.Lock()
+        self.prompt_builder: Optional[PromptBuilder] = None
+        self._story_flights: SingleFlight[Tuple[str, bool]] = SingleFlight() # (raw output, streamed)
+        self.scheduler: Optional[GenerationScheduler] = None # Batches non-streamed LLM calls if LLM_BATCHING is on
+        self.policy = GenerationPolicy.from_settings() # Deadline, hedging and retries of story LLM calls
+        self._repair_flights: SingleFlight[str] = SingleFlight() # Repaired output, shared by the generations of a coalesced call
+        # Served in place of the default error scene when it returns one (app/services/scene_pool.py sets it)
+        self.fallback_scenes: Optional[Callable[[Dict[str, Any]], Optional[StoryScene]]] = None
+        # Metric children bound once; the backend label doesn't change for the life of the process
+        self._llm_latency = metrics.LLM_REQUEST_DURATION.labels(settings.LLM_BACKEND)
+        self._prompt_tokens = metrics.LLM_TOKENS.labels(settings.LLM_BACKEND, "prompt")
+        self._completion_tokens = metrics.LLM_TOKENS.labels(settings.LLM_BACKEND, "completion")
+        if settings.LLM_BACKEND == "stub":
+            # Deterministic local stand-in, used by the benchmark harness and for offline development.
+            self.llm = StubLLM(latency_ms=settings.STUB_LLM_LATENCY_MS, batch_prompt_ms=settings.STUB_LLM_BATCH_PROMPT_MS,
+                               max_concurrency=settings.STUB_LLM_MAX_CONCURRENCY)
+            self.embeddings = HashingEmbeddings()
+            self._start_scheduler()
+            self.prompt_builder = PromptBuilder(STORY_PROMPT_TEMPLATE, self._token_counter(), settings.PROMPT_TOKEN_BUDGET)
+            self.load_knowledge_base()
+            return
+
         if not settings.OPENAI_API_KEY:
             # In a real app, this might be a fatal error preventing startup.
-            print("CRITICAL: OPENAI_API_KEY not set. RAGSystem will not function.")
+            logger.critical("OPENAI_API_KEY not set. RAGSystem will not function.")
             self.llm = None # Ensure LLM is None if key is missing
             self.embeddings = None
             # Attempt to load KB even without LLM, it might be useful for other things or if key is set later.
@@ -79,182 +243,79 @@ class RAGSystem:
             self.llm = OpenAI(temperature=0.7, openai_api_key=settings.OPENAI_API_KEY)
             self.embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
         except Exception as e:
-            print(f"CRITICAL: Failed to initialize OpenAI components: {e}. RAGSystem may not function.")
+            logger.critical("Failed to initialize OpenAI components: %s. RAGSystem may not function.", e)
             self.llm = None
             self.embeddings = None
             return
 
+        self._start_scheduler()
+        self.prompt_builder = PromptBuilder(STORY_PROMPT_TEMPLATE, self._token_counter(), settings.PROMPT_TOKEN_BUDGET)
         self.load_knowledge_base() # Load KB after LLM/Embeddings are potentially initialized
 
-    def load_knowledge_base(self):
-        """加载知识库 (Unchanged from previous version, but ensure embeddings are available)"""
-        if not self.embeddings:
-            print("Knowledge base loading skipped: OpenAIEmbeddings not initialized.")
-            self.knowledge_base = None
-            return
-
-        kb_dir = Path("knowledge_base")
-        documents_for_faiss: List[Document] = []
+    def _start_scheduler(self) -> None:
+        if settings.LLM_BATCHING:
+            self.scheduler = GenerationScheduler.from_settings(self.llm)
 
-        if not kb_dir.exists() or not kb_dir.is_dir():
-            print(f"Knowledge base directory {kb_dir.resolve()} not found or is not a directory.")
-            self.knowledge_base = None
->>>>>>> origin/haa
-            return
+    def shutdown(self) -> None:
+        """Sends LLM calls still queued for a batch and stops the story attempt workers. Called at application shutdown."""
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+        self.policy.shutdown()
 
-        doc_count = 0
-        for file_path in kb_dir.glob("**/*.md"):
+    def _token_counter(self) -> TokenCounter:
+        """tiktoken's PROMPT_TOKENIZER encoding, or the LLM's own token count if that can't be loaded (e.g. offline)."""
+        if settings.LLM_BACKEND != "stub":
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-<<<<<<< HEAD
-                    # Add file path as metadata, useful for context or debugging
-=======
->>>>>>> origin/haa
-                    metadata = {"source": str(file_path.relative_to(kb_dir))}
-                    documents_for_faiss.append(Document(page_content=content, metadata=metadata))
-                    doc_count +=1
+                return tiktoken_counter(settings.PROMPT_TOKENIZER)
             except Exception as e:
-                print(f"Error reading or processing file {file_path}: {e}")
-
-        if documents_for_faiss:
+                logger.warning("Tokenizer %s unavailable (%s); counting prompt tokens with the LLM's tokenizer.", settings.PROMPT_TOKENIZER, e)
+        return TokenCounter(settings.LLM_BACKEND, count=self.llm.get_num_tokens)
+
+    def load_knowledge_base(self, kb_dir: Optional[Path] = None) -> Optional[LoadResult]:
+        """
+        加载知识库 (kb_dir is relative to the project root unless absolute; by default the last one loaded).
+        Every entry becomes one document, tagged with its stage, region and faction and indexed
+        both in FAISS and in the lexical (BM25) index, partitioned by those tags.
+
+        Also used to reload: only new or changed entries are embedded, the new index is built while
+        queries keep using the current one, and then replaces it. If loading fails the current index stays.
+        """
+        if not self.embeddings:
+            logger.warning("Knowledge base loading skipped: OpenAIEmbeddings not initialized.")
+            return None
+
+        with self._kb_load_lock: # One load at a time; queries don't take this lock
+            if kb_dir is not None:
+                self.kb_dir = kb_dir
+            if not self.kb_dir.exists() or not self.kb_dir.is_dir():
+                logger.warning("Knowledge base directory %s not found or is not a directory.", self.kb_dir.resolve())
+                return None
+            if self.kb_loader is None:
+                self.kb_loader = KnowledgeBaseLoader(self.embeddings)
             try:
-                self.knowledge_base = FAISS.from_documents(documents_for_faiss, self.embeddings)
-                print(f"Knowledge base loaded successfully with {doc_count} documents.")
+                index, result = self.kb_loader.load(self.kb_dir)
             except Exception as e:
-                print(f"Error creating FAISS index: {e}")
-                self.knowledge_base = None
-        else:
-            print("No documents found to load into knowledge base.")
-            self.knowledge_base = None
-
-<<<<<<< HEAD
-    def generate_story(self, game_state: Dict[str, Any], character: Dict[str, Any]) -> StoryScene:
-        """生成剧情内容"""
-        if self.knowledge_base is None:
-            # Fallback if KB didn't load
-            return StoryScene(
-                description="The world feels hazy and indistinct, as if waiting to be fully imagined. (Knowledge Base Error)",
-                choices=[
-                    StoryChoice(id="choice_1", text="Try to focus..."),
-                    StoryChoice(id="choice_2", text="Wait for clarity..."),
-                    StoryChoice(id="choice_3", text="Ponder the void..."),
-                ]
-            )
-
-        # Ensure required fields are present in inputs
-        char_name = character.get("name", "Unnamed Hero")
-        char_stage = character.get("cultivation_stage", "Mortal") # Use .get for safety
-        current_scene_info = game_state.get("current_scene_id", "an unknown place") # Use .get for safety
-
-        # 构建查询上下文
-        query = f"Character: {char_name}, Stage: {char_stage}, Current Scene: {current_scene_info}"
-
-        # 检索相关信息
-        # FAISS.similarity_search returns List[Document]
-        relevant_docs_list: List[Document] = self.knowledge_base.similarity_search(query, k=3)
-        context = "\n".join([doc.page_content for doc in relevant_docs_list])
-
-        # 构建提示
-        prompt_template_str = """
-You are a text-based cultivation game's AI storyteller. Based on the following information, generate an engaging story description and provide 3 choices.
-
-Character Information: {character_info}
-
-Game History (last 3 events): {history}
-
-Relevant Background Knowledge: {context}
-
-Please generate a story description (100-200 words) and three choices (each 20-30 words).
-Format the output EXACTLY like this:
-Story: [Your generated story description here]
-Choice 1: [Your first choice text here]
-Choice 2: [Your second choice text here]
-Choice 3: [Your third choice text here]
-"""
-        prompt = PromptTemplate(
-            template=prompt_template_str,
-            input_variables=["character_info", "history", "context"]
-        )
-
-        # 生成内容
-        story_history_list = game_state.get("story_history", [])
-        story_history_str = str(story_history_list[-3:]) if story_history_list else "Game start"
-
-
-        inputs = {
-            "character_info": str(character), # Convert whole character dict to string
-            "history": story_history_str,
-            "context": context
-        }
-
-        raw_llm_output = self.llm(prompt.format(**inputs))
-
-        # 解析结果
-        story_text = "Error: Could not parse story."
-        choice_texts = ["Retry", "Explore", "Rest"] # Default choices on parsing error
-
-        try:
-            story_match = re.search(r"Story:(.*?)Choice 1:", raw_llm_output, re.DOTALL | re.IGNORECASE)
-            if story_match:
-                story_text = story_match.group(1).strip()
-
-            parsed_choices = []
-            for i in range(1, 4):
-                choice_match = re.search(rf"Choice {i}:(.*?)(Choice {i+1}:|\Z)", raw_llm_output, re.DOTALL | re.IGNORECASE)
-                if choice_match:
-                    parsed_choices.append(choice_match.group(1).strip())
-                else:
-                    # If a specific choice isn't found with the new format, stop trying to parse this way
-                    # and let the fallback logic handle it.
-                    break
-
-            if len(parsed_choices) == 3:
-                 choice_texts = parsed_choices
-            elif not story_match and not parsed_choices: # If nothing matches with new format, try old split
-                parts = raw_llm_output.split("选择")
-                parsed_story_text = parts[0].strip().replace("剧情：", "").strip()
-                if parsed_story_text : story_text = parsed_story_text # Update story if old parsing finds something
-
-                temp_choices = []
-                for i in range(1, min(4, len(parts))): # Iterate up to 3 choices
-                    choice_part = parts[i].strip()
-                    # Extract text after colon (Chinese or English)
-                    if "：" in choice_part:
-                        choice_part_text = choice_part.split("：", 1)[1].strip()
-                    elif ":" in choice_part:
-                        choice_part_text = choice_part.split(":", 1)[1].strip()
-                    else: # If no colon, take the whole part (might be just text)
-                        choice_part_text = choice_part
-                    if choice_part_text: temp_choices.append(choice_part_text)
-
-                if len(temp_choices) >= 1: # Use if old parsing finds at least one choice
-                    choice_texts = temp_choices[:3]
-                    # Fill remaining choices if less than 3 found by old parsing
-                    while len(choice_texts) < 3:
-                        choice_texts.append(f"Fallback Action {len(choice_texts) + 1}")
-
-
-        except Exception as e:
-            print(f"Error parsing LLM output: {e}\nOutput was: {raw_llm_output}")
-            # story_text and choice_texts will use their default error values set before try block
-
-        final_choices = []
-        for i, text in enumerate(choice_texts[:3]): # Ensure max 3 choices
-            final_choices.append(StoryChoice(id=f"choice_{i+1}", text=text))
-
-        # This loop is to ensure exactly 3 choices if parsing yielded fewer than 3.
-        # The parsing logic itself now tries to provide 3 fallbacks if direct parsing fails.
-        while len(final_choices) < 3:
-            final_choices.append(StoryChoice(id=f"choice_{len(final_choices)+1}", text=f"Consider option {len(final_choices)+1}"))
-
-        return StoryScene(
-            description=story_text,
-            choices=final_choices
-        )
-=======
-    def _get_default_error_scene(self, error_message: str = "Error generating story.") -> StoryScene:
-        """Provides a fallback StoryScene in case of errors."""
+                logger.exception("Error loading the knowledge base: %s", e)
+                metrics.KB_LOADS["error"].inc()
+                return None
+
+            previous = self.knowledge_base
+            self.knowledge_base = index # Retrievals already running finish on the index they started with
+            metrics.KB_LOADS["ok"].inc()
+            if previous is not None and previous.version != result.version:
+                metrics.KB_INDEX_VERSION.labels(previous.version).set(0)
+            metrics.KB_INDEX_VERSION.labels(result.version).set(1)
+            if index is None:
+                logger.warning("No documents found to load into knowledge base.")
+            else:
+                logger.info("Knowledge base %s loaded with %d entries in %d partitions (%d embedded, %d files unchanged) in %.2fs.",
+                            result.version, result.entries, len(index.partitions), result.embedded, result.files_unchanged, result.seconds)
+            return result
+
+    def _get_default_error_scene(self, error_message: str = "Error generating story.", reason: Optional[str] = None) -> StoryScene:
+        """Provides a fallback StoryScene in case of errors. `reason` is counted in story_generation_fallbacks_total."""
+        if reason is not None:
+            metrics.STORY_FALLBACK_COUNTERS[reason].inc()
         return StoryScene(
             scene_id="error_scene",
             plot=f"{error_message} The path ahead is unclear, but you must choose a way forward.",
@@ -266,128 +327,358 @@ Choice 3: [Your third choice text here]
             duration_days=1 # Default duration for an error/fallback scene
         )
 
-    def generate_story(self, game_state: Dict[str, Any], character: Dict[str, Any]) -> StoryScene:
-        """生成剧情内容 as JSON"""
+    def generate_story(self, game_state: Dict[str, Any], character: Dict[str, Any],
+                       on_plot_delta: Optional[Callable[[str], None]] = None, lane: str = "interactive") -> StoryScene:
+        """
+        生成剧情内容 as JSON.
+        If on_plot_delta is given, the LLM output is streamed and the callback receives
+        the plot text piece by piece as it is generated.
+        lane="background" is for generations no player waits on (the scene pool's): they are batched in the
+        scheduler's background lane, never hedged, and get the default error scene itself when they fail.
+        """
+        with tracer.start_span("rag.generate_story", {"rag.history_length": game_state.get("history_total", len(game_state.get("story_history") or []))}) as span:
+            story_scene = self._generate_story(game_state, character, on_plot_delta, lane)
+            fallback = story_scene.scene_id == "error_scene"
+            span.set_attribute("rag.fallback", fallback)
+            if fallback and lane == "interactive" and self.fallback_scenes is not None:
+                pooled = self.fallback_scenes(character)
+                if pooled is not None: # Still "error_scene", so callers and clients can tell
+                    span.set_attribute("rag.fallback_pooled", True)
+                    story_scene = pooled.model_copy(update={"scene_id": story_scene.scene_id})
+            return story_scene
+
+    def _generate_story(self, game_state: Dict[str, Any], character: Dict[str, Any],
+                        on_plot_delta: Optional[Callable[[str], None]] = None, lane: str = "interactive") -> StoryScene:
         if self.llm is None:
-            print("LLM not initialized. Returning default error scene.")
-            return self._get_default_error_scene("LLM (AI Storyteller) is currently unavailable.")
+            logger.error("LLM not initialized. Returning default error scene.")
+            return self._get_default_error_scene("LLM (AI Storyteller) is currently unavailable.", reason="llm_unavailable")
+        budget = self.policy.budget() # STORY_DEADLINE_SECONDS counts from here
 
-        if self.knowledge_base is None:
-            print("Knowledge base not loaded. Using very limited context for story generation.")
+        kb = self.knowledge_base # The same index for the whole retrieval, even if a reload swaps it meanwhile
+        if kb is None:
+            logger.warning("Knowledge base not loaded. Using very limited context for story generation.")
             context = "No specific background knowledge available for this scene."
         else:
-            char_name = character.get("name", "The Wanderer")
-            char_stage = character.get("cultivation_stage", "an early stage")
-            current_scene_desc = game_state.get("current_scene_id", "an unknown location")
-            query = f"Character: {char_name}, Cultivation Stage: {char_stage}, Current Location/Situation: {current_scene_desc}"
+            with tracer.start_span("rag.build_query"):
+                query = self._build_query(game_state, character)
+                entity_text = self._entity_text(game_state)
+                scope = kb.metadata.scope(game_state, character)
             try:
-                relevant_docs_list: List[Document] = self.knowledge_base.similarity_search(query, k=2) # k=2 for brevity
-                context = "\n".join([doc.page_content for doc in relevant_docs_list])
-                if not context.strip(): # Ensure context is not empty
-                    context = "General knowledge about the world applies here."
+                context = self._retrieve_context(query, scope, kb, entity_text)
             except Exception as e:
-                print(f"Error during similarity search: {e}. Using generic context.")
+                logger.warning("Error during similarity search: %s. Using generic context.", e)
                 context = "The winds of fate are swirling, obscuring detailed knowledge."
 
-
-        # NEW Prompt Engineering for JSON output
-        prompt_template_str = """
-You are an AI storyteller for a text-based cultivation (Xianxia) game.
-Your task is to generate the next part of the story based on the provided information.
-The user is playing as: {character_info}
-Current in-game date: {current_date}
-Recent game history (last 1-2 events): {history}
-Relevant background knowledge from the game world:
-{context}
-
-Please generate the output as a single, valid JSON object. Do NOT write any text outside this JSON object.
-The JSON object must have the following structure:
-{{
-  "plot": "A short, engaging plot description for the current scene. This should be 2-3 sentences long.",
-  "choices": [
-    {{"id": "choice_1", "text": "A brief text for the first choice (10-15 words max)."}},
-    {{"id": "choice_2", "text": "A brief text for the second choice (10-15 words max)."}},
-    {{"id": "choice_3", "text": "A brief text for the third choice (10-15 words max)."}}
-  ],
-  "duration_days": <an integer between 1 and 7, representing the number of in-game days this plot segment will take>
-}}
-
-Ensure the plot is concise and leads to the choices. The choices should be distinct actions the player can take.
-Example for "plot": "You arrive at the Whispering Glade, sunlight filtering through ancient trees. A faint spiritual energy emanates from a moss-covered shrine in the center."
-Example for "duration_days": 3
-
-Current JSON output:
-"""
-
-        prompt = PromptTemplate(
-            template=prompt_template_str,
-            input_variables=["character_info", "current_date", "history", "context"]
-        )
-
-        story_history_for_prompt = str(game_state.get("story_history", [])[-2:]) if game_state.get("story_history") else "This is the beginning of your journey."
-        current_date_for_prompt = game_state.get("current_date", "An unknown day")
-
-        inputs = {
-            "character_info": json.dumps(character),
-            "current_date": current_date_for_prompt,
-            "history": story_history_for_prompt,
-            "context": context
-        }
+        with tracer.start_span("rag.build_prompt") as span:
+            prompt = self._build_prompt(game_state, character, context)
+            prompt_text = prompt.text
+            span.set_attribute("rag.prompt_chars", len(prompt_text))
+            span.set_attribute("rag.prompt_tokens", prompt.tokens)
+            if prompt.trimmed:
+                span.set_attribute("rag.prompt_trimmed", ",".join(prompt.trimmed))
 
         try:
-            raw_llm_output = self.llm(prompt.format(**inputs))
+            with tracer.start_span("rag.llm_call", {"llm.backend": settings.LLM_BACKEND}) as span:
+                raw_llm_output, shared = self._call_story_llm(prompt_text, character, on_plot_delta, budget, lane)
+                span.set_attribute("llm.output_chars", len(raw_llm_output))
+                span.set_attribute("llm.coalesced", shared)
+        except DeadlineExceeded as e:
+            logger.error("LLM call timed out: %s", e, extra={"llm_backend": settings.LLM_BACKEND})
+            return self._get_default_error_scene("The AI Storyteller is taking too long.", reason="deadline")
         except Exception as e:
-            print(f"Error calling LLM: {e}")
-            return self._get_default_error_scene("There was an issue with the AI Storyteller.")
+            logger.error("Error calling LLM: %s", e, extra={"llm_backend": settings.LLM_BACKEND})
+            return self._get_default_error_scene("There was an issue with the AI Storyteller.", reason="llm_error")
 
-        # NEW JSON Parsing Logic
         try:
-            match = re.search(r"```json\s*([\s\S]*?)\s*```", raw_llm_output)
-            if match:
-                json_str = match.group(1)
-            else:
-                json_start_index = raw_llm_output.find('{')
-                json_end_index = raw_llm_output.rfind('}')
-                if json_start_index != -1 and json_end_index != -1 and json_end_index > json_start_index:
-                    json_str = raw_llm_output[json_start_index : json_end_index+1]
-                else:
-                    json_str = raw_llm_output
-
-            parsed_output = json.loads(json_str)
-
-            if not all(k in parsed_output for k in ["plot", "choices", "duration_days"]):
-                raise ValueError("Missing one or more required keys in JSON output (plot, choices, duration_days).")
-            if not isinstance(parsed_output["choices"], list) or len(parsed_output["choices"]) != 3:
-                raise ValueError("JSON 'choices' must be a list of 3 items.")
-            for choice in parsed_output["choices"]:
-                if not all(k in choice for k in ["id", "text"]):
-                    raise ValueError("Each choice object must have 'id' and 'text' keys.")
-
-            duration = parsed_output.get("duration_days", 1) # Default to 1 if missing
-            if not isinstance(duration, int) : # Check if it's not an int (e.g. float, string)
-                 try: duration = int(duration) # Try to cast
-                 except ValueError: duration = 1 # Fallback if cast fails
-            parsed_output["duration_days"] = min(max(1, duration), 7)
-
-
-            story_choices = [StoryChoice(id=str(c.get("id","choice_fallback")), text=str(c.get("text", "---"))) for c in parsed_output["choices"]]
-
-            return StoryScene(
-                plot=str(parsed_output["plot"]),
-                choices=story_choices,
-                duration_days=int(parsed_output["duration_days"])
+            with tracer.start_span("rag.parse_output"):
+                return self._parse_llm_output(raw_llm_output)
+        except ValueError as e: # json.JSONDecodeError included
+            parse_error = e
+        except Exception as e:
+            self._log_unparseable_output("An unexpected error occurred while processing LLM response", e, raw_llm_output)
+            return self._get_default_error_scene("An unforeseen twist in the tale (unexpected AI response error).", reason="unexpected_error")
+
+        story_scene = self._repair_story_output(raw_llm_output, budget)
+        if story_scene is not None:
+            return story_scene
+        if isinstance(parse_error, json.JSONDecodeError):
+            self._log_unparseable_output("Failed to decode JSON from LLM output", parse_error, raw_llm_output)
+            return self._get_default_error_scene("The story's path became muddled (AI response format error).", reason="json_error")
+        self._log_unparseable_output("Invalid JSON structure from LLM", parse_error, raw_llm_output)
+        return self._get_default_error_scene("The story's details were unclear (AI response structure error).", reason="structure_error")
+
+    def _repair_story_output(self, raw_llm_output: str, budget: AttemptBudget) -> Optional[StoryScene]:
+        """
+        The scene from a repair re-prompt (REPAIR_PROMPT_TEMPLATE) for output _parse_llm_output rejected, if
+        STORY_REPAIR is on and the budget has an attempt and time left. None if it can't be repaired either.
+        """
+        if not settings.STORY_REPAIR or not budget.can_attempt():
+            return None
+        prompt_text = REPAIR_PROMPT_TEMPLATE.format(output=raw_llm_output)
+        key = hashlib.sha1(raw_llm_output.encode("utf-8")).digest() # Followers of a coalesced call got the same output
+        with tracer.start_span("rag.repair_output", {"llm.backend": settings.LLM_BACKEND}) as span:
+            try:
+                repaired, shared = self._repair_flights.do(
+                    key, lambda emit: self.policy.call(budget, lambda on_delta: self._call_llm(prompt_text), kind="repair", hedge=False),
+                )
+                span.set_attribute("llm.coalesced", shared)
+                return self._parse_llm_output(repaired)
+            except Exception as e:
+                span.set_attribute("rag.repair_failed", True)
+                logger.warning("Repairing the LLM output failed: %s", e, extra={"llm_backend": settings.LLM_BACKEND})
+                return None
+
+    def summarize_story(self, previous_summary: Optional[str], events: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Folds story events into the rolling summary and returns the new summary, cut to
+        STORY_SUMMARY_MAX_CHARS. None if the LLM is unavailable or fails; the caller tries again later.
+        """
+        if self.llm is None:
+            return None
+        prompt_text = SUMMARY_PROMPT_TEMPLATE.format(
+            summary=previous_summary or "(none yet)",
+            events=format_story_events(events),
+        )
+        with tracer.start_span("rag.summarize_story", {"rag.summary_events": len(events)}):
+            try:
+                summary = self._call_llm(prompt_text, lane="background").strip()
+            except Exception as e:
+                logger.warning("Story summarization failed: %s", e, extra={"llm_backend": settings.LLM_BACKEND})
+                metrics.STORY_SUMMARIES["error"].inc()
+                return None
+        if not summary:
+            metrics.STORY_SUMMARIES["error"].inc()
+            return None
+        metrics.STORY_SUMMARIES["ok"].inc()
+        return summary[:settings.STORY_SUMMARY_MAX_CHARS]
+
+    def _log_unparseable_output(self, message: str, error: Exception, raw_llm_output: str) -> None:
+        # A short preview at WARNING; the full output only when DEBUG is enabled for this module
+        logger.warning("%s: %s", message, error,
+                       extra={"output_chars": len(raw_llm_output), "output_preview": raw_llm_output[:200]})
+        logger.debug("LLM raw output was:\n%s", raw_llm_output)
+
+    # --- Pipeline stages of generate_story. Kept separate so each can be timed (benchmarks/rag_micro.py). ---
+
+    @staticmethod
+    def _name_as_token(character: Dict[str, Any]) -> bool:
+        """Whether prompts name the character with CHARACTER_NAME_TOKEN, so that they coalesce across names."""
+        return bool(settings.STORY_COALESCE and settings.STORY_COALESCE_ACROSS_NAMES and character.get("name"))
+
+    def _build_query(self, game_state: Dict[str, Any], character: Dict[str, Any]) -> str:
+        """Builds the retrieval query from the character, current scene and the latest plot."""
+        char_name = CHARACTER_NAME_TOKEN if self._name_as_token(character) else character.get("name", "The Wanderer")
+        char_stage = character.get("cultivation_stage", "an early stage")
+        current_scene_desc = game_state.get("current_scene_id", "an unknown location")
+        query = f"Character: {char_name}, Cultivation Stage: {char_stage}, Current Location/Situation: {current_scene_desc}"
+        history = game_state.get("story_history") or []
+        if history and isinstance(history[-1], dict) and history[-1].get("plot"):
+            # The places, sects and people the story is currently about
+            query += f", Recent events: {str(history[-1]['plot'])[:200]}"
+        return query
+
+    def _entity_text(self, game_state: Dict[str, Any]) -> str:
+        """
+        The scene and latest plot: the part of the query whose entity names say what the story is about.
+        The character's own stage is in every query, so matching it would put the stage entry first every time.
+        """
+        text = str(game_state.get("current_scene_id") or "")
+        history = game_state.get("story_history") or []
+        if history and isinstance(history[-1], dict) and history[-1].get("plot"):
+            text += f" {str(history[-1]['plot'])[:200]}"
+        return text
+
+    def _embed_query(self, query: str) -> List[float]:
+        return self.embeddings.embed_query(query)
+
+    def _search(self, kb: KnowledgeIndex, query_vector: List[float], k: int, partitions: List[Partition]) -> List[int]:
+        return [entry_id for entry_id, _ in kb.search(query_vector, k, partitions)]
+
+    def _lexical_search(self, kb: KnowledgeIndex, query: str, k: int, partitions: List[Partition]) -> List[int]:
+        return [entry_id for entry_id, _ in kb.lexical_search(query, k, partitions)]
+
+    def _retrieve_context(self, query: str, scope: Optional[RetrievalScope] = None, kb: Optional[KnowledgeIndex] = None,
+                          entity_text: Optional[str] = None) -> str:
+        """
+        The RAG_TOP_K most relevant knowledge-base entries in scope, joined. Only the partitions the
+        scope admits are searched; without a scope, every partition is.
+        Entries named in entity_text (sects, places, stages, NPCs; see _entity_text) come first. If at least
+        RAG_LEXICAL_MIN_ENTITIES of them are not stages, the lexical path fills in with the best BM25 matches,
+        up to RAG_TOP_K entries, with no embedding call. Otherwise the rest come from fusing the vector and BM25 rankings with
+        reciprocal rank fusion.
+        Without entity_text, no entries are matched by name.
+        """
+        kb = kb or self.knowledge_base
+        k = settings.RAG_TOP_K
+        partitions = kb.select(scope)
+        metrics.RETRIEVAL_SCANNED.observe(sum(len(partition) for partition in partitions))
+        entity_ids = kb.match_entities(entity_text, scope) if entity_text and settings.RAG_LEXICAL_FAST_PATH else []
+        with tracer.start_span("rag.lexical_search", {"rag.k": settings.RAG_CANDIDATES, "rag.partitions": len(partitions)}):
+            start = time.perf_counter()
+            lexical_ids = self._lexical_search(kb, query, settings.RAG_CANDIDATES, partitions)
+            metrics.RETRIEVAL_LEXICAL.observe(time.perf_counter() - start)
+
+        # A stage names how strong, not what the scene is about, so stages alone don't settle the context
+        named = sum(1 for entry_id in entity_ids if not kb.metadata.is_stage(kb.names[entry_id]))
+        if entity_ids and named >= settings.RAG_LEXICAL_MIN_ENTITIES:
+            metrics.RETRIEVAL_PATHS["lexical"].inc()
+            ranked = list(dict.fromkeys(entity_ids + lexical_ids))
+        else:
+            metrics.RETRIEVAL_PATHS["hybrid"].inc()
+            with tracer.start_span("rag.embed_query"):
+                start = time.perf_counter()
+                query_vector = self._embed_query(query)
+                metrics.RETRIEVAL_EMBED.observe(time.perf_counter() - start)
+            with tracer.start_span("rag.similarity_search", {"rag.k": settings.RAG_CANDIDATES, "rag.partitions": len(partitions)}):
+                start = time.perf_counter()
+                vector_ids = self._search(kb, query_vector, settings.RAG_CANDIDATES, partitions)
+                metrics.RETRIEVAL_SEARCH.observe(time.perf_counter() - start)
+            # Named entries keep their place at the top; the fused ranking fills the rest
+            ranked = list(dict.fromkeys(entity_ids + reciprocal_rank_fusion([vector_ids, lexical_ids], k=settings.RAG_RRF_K)))
+
+        context = "\n".join(kb.texts[entry_id] for entry_id in ranked[:k])
+        if not context.strip(): # Ensure context is not empty
+            context = "General knowledge about the world applies here."
+        return context
+
+    def _build_prompt(self, game_state: Dict[str, Any], character: Dict[str, Any], context: str) -> BuiltPrompt:
+        """The story prompt, trimmed by section priority to PROMPT_TOKEN_BUDGET tokens."""
+        # Events up to summarized_events are in the rolling summary; the ones after it are sent as they are
+        history = game_state.get("story_history") or []
+        unsummarized = game_state.get("history_total", len(history)) - (game_state.get("summarized_events") or 0)
+        recent_events = history[-min(unsummarized, settings.EVENT_HISTORY_WINDOW):] if unsummarized > 0 else []
+
+        character_info = {k: character[k] for k in CHARACTER_PROMPT_FIELDS if character.get(k) is not None}
+        name_as_token = self._name_as_token(character)
+        if name_as_token:
+            character_info["name"] = CHARACTER_NAME_TOKEN
+        character_info_text = json.dumps(character_info, ensure_ascii=False, default=str)
+        if name_as_token:
+            character_info_text += f" (write their name as {CHARACTER_NAME_TOKEN}, exactly)"
+        character_extras = {k: v for k, v in character.items()
+                            if k not in CHARACTER_PROMPT_FIELDS and k not in CHARACTER_OMITTED_FIELDS and v is not None}
+
+        return self.prompt_builder.build([
+            PromptSection("character_info", character_info_text, priority=100, required=True),
+            PromptSection("current_date", str(game_state.get("current_date") or "An unknown day"), priority=100, required=True),
+            PromptSection("history", format_story_events(recent_events) if recent_events else "This is the beginning of your journey.",
+                          priority=PROMPT_PRIORITY_RECENT_EVENTS, trim="lines", min_tokens=PROMPT_MIN_TOKENS),
+            PromptSection("summary", game_state.get("story_summary") or "Nothing of note has happened yet.",
+                          priority=PROMPT_PRIORITY_SUMMARY, min_tokens=PROMPT_MIN_TOKENS),
+            PromptSection("context", context, priority=PROMPT_PRIORITY_CONTEXT, min_tokens=PROMPT_MIN_TOKENS),
+            PromptSection("character_extras", json.dumps(character_extras, ensure_ascii=False, default=str) if character_extras else "None",
+                          priority=PROMPT_PRIORITY_CHARACTER_EXTRAS),
+        ])
+
+    def _call_story_llm(self, prompt_text: str, character: Dict[str, Any], on_plot_delta: Optional[Callable[[str], None]] = None,
+                        budget: Optional[AttemptBudget] = None, lane: str = "interactive") -> Tuple[str, bool]:
+        """
+        The story LLM call under the generation policy's deadline, hedging and retries, shared with concurrent
+        generations of the same prompt (STORY_COALESCE). Returns (raw output, shared), shared being True if
+        another generation made the call. CHARACTER_NAME_TOKEN in the prompt is this character's name in the
+        output and in the streamed plot.
+        """
+        budget = budget or self.policy.budget()
+
+        def call(emit: Optional[Callable[[str], None]]) -> str:
+            return self.policy.call(budget, lambda on_delta: self._call_llm(prompt_text, on_delta, lane), emit,
+                                    hedge=lane == "interactive")
+
+        # _build_prompt put the token in for the name; each player gets their own name back, streamed or not
+        name = str(character.get("name") or "")
+        named = CHARACTER_NAME_TOKEN in prompt_text
+        name_stream = _TokenStream(on_plot_delta, CHARACTER_NAME_TOKEN, name) if named and on_plot_delta is not None else None
+        on_delta = name_stream or on_plot_delta
+        if not settings.STORY_COALESCE:
+            raw_llm_output, shared = call(on_delta), False
+        else:
+            key = hashlib.sha1(" ".join(prompt_text.split()).encode("utf-8")).digest() # Whitespace-insensitive
+            streamed = on_delta is not None
+            (raw_llm_output, leader_streamed), shared = self._story_flights.do(
+                key, lambda emit: (call(emit if streamed else None), streamed), on_delta=on_delta,
             )
+            if shared:
+                metrics.STORY_GENERATIONS_COALESCED.inc()
+            if shared and streamed and not leader_streamed: # Nothing was streamed: the plot comes in one piece
+                plot = PlotStreamExtractor().feed(raw_llm_output)
+                if plot:
+                    on_delta(plot)
+        if name_stream is not None:
+            name_stream.flush()
+        if named: # As JSON string content
+            raw_llm_output = raw_llm_output.replace(CHARACTER_NAME_TOKEN, json.dumps(name, ensure_ascii=False)[1:-1])
+        return raw_llm_output, shared
+
+    def _call_llm(self, prompt_text: str, on_plot_delta: Optional[Callable[[str], None]] = None, lane: str = "interactive") -> str:
+        """
+        One completion. Streamed if on_plot_delta is given; otherwise, with LLM_BATCHING, batched by the
+        scheduler in `lane` ("interactive" or "background") with other queued calls.
+        """
+        start = time.perf_counter()
+        if on_plot_delta is None and self.scheduler is not None:
+            text = self.scheduler.generate(prompt_text, lane)
+            usage = {} # A batch's usage report covers all of its prompts
+        elif on_plot_delta is None:
+            result = self.llm.generate([prompt_text])
+            text = result.generations[0][0].text
+            usage = (result.llm_output or {}).get("token_usage") or {}
+        else:
+            extractor = PlotStreamExtractor()
+            chunks = []
+            for chunk in self.llm.stream(prompt_text):
+                chunks.append(chunk)
+                delta = extractor.feed(chunk)
+                if delta:
+                    on_plot_delta(delta)
+            text = "".join(chunks)
+            usage = {} # Streaming responses carry no usage report
+        self._llm_latency.observe(time.perf_counter() - start)
+
+        # OpenAI reports usage; backends that don't are counted with the LLM's own tokenizer
+        self._prompt_tokens.inc(usage.get("prompt_tokens") or self.llm.get_num_tokens(prompt_text))
+        self._completion_tokens.inc(usage.get("completion_tokens") or self.llm.get_num_tokens(text))
+        return text
+
+    def _parse_llm_output(self, raw_llm_output: str) -> StoryScene:
+        """
+        Extracts the JSON object from the raw LLM output and validates it into a StoryScene.
+        Common defects (trailing commas, unquoted keys, truncated output...) are repaired on the way
+        and counted by kind in story_output_repairs_total, so a sloppy reply still yields its scene.
+        Raises json.JSONDecodeError or ValueError on output past repair.
+        """
+        parsed_output, repairs = loads_object(raw_llm_output)
+        if not isinstance(parsed_output, dict):
+            raise ValueError("JSON output must be an object.")
+        plot = parsed_output.get("plot")
+        if plot is None or not str(plot).strip():
+            raise ValueError("Missing required key 'plot' in JSON output.")
+
+        choices = parsed_output.get("choices")
+        if not isinstance(choices, list) or len(choices) < 3:
+            raise ValueError("JSON 'choices' must be a list of 3 items.")
+        if len(choices) > 3:
+            repairs.add("extra_choices")
+        story_choices = []
+        for number, choice in enumerate(choices[:3], start=1):
+            if isinstance(choice, str): # A bare choice text
+                choice = {"text": choice}
+            if not isinstance(choice, dict) or not choice.get("text"):
+                raise ValueError("Each choice object must have 'id' and 'text' keys.")
+            if "id" not in choice:
+                repairs.add("choice_id")
+            story_choices.append(StoryChoice(id=str(choice.get("id", f"choice_{number}")), text=str(choice["text"])))
 
-        except json.JSONDecodeError as e:
-            print(f"Failed to decode JSON from LLM output: {e}")
-            print(f"LLM Raw Output was:\n{raw_llm_output}")
-            return self._get_default_error_scene("The story's path became muddled (AI response format error).")
-        except ValueError as e:
-            print(f"Invalid JSON structure from LLM: {e}")
-            print(f"LLM Raw Output was:\n{raw_llm_output}")
-            return self._get_default_error_scene("The story's details were unclear (AI response structure error).")
-        except Exception as e:
-            print(f"An unexpected error occurred while processing LLM response: {e}")
-            print(f"LLM Raw Output was:\n{raw_llm_output}")
-            return self._get_default_error_scene("An unforeseen twist in the tale (unexpected AI response error).")
->>>>>>> origin/haa
+        try:
+            duration = int(parsed_output["duration_days"]) # Floats and numeric strings are cast
+        except (KeyError, TypeError, ValueError, OverflowError): # OverflowError: Infinity, or 1e999
+            repairs.add("duration")
+            duration = 1
+
+        if repairs:
+            metrics.STORY_OUTPUT_PARSES["repaired"].inc()
+            for repair in repairs:
+                metrics.STORY_OUTPUT_REPAIRS[repair].inc()
+            logger.debug("Repaired LLM output (%s)", ", ".join(sorted(repairs)))
+        else:
+            metrics.STORY_OUTPUT_PARSES["clean"].inc()
+        return StoryScene(plot=str(plot), choices=story_choices, duration_days=min(max(1, duration), 7))
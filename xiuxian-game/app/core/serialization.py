@@ -0,0 +1,37 @@
+# app/core/serialization.py
+"""
+orjson-backed JSON for responses and JSON columns.
+
+story_history grows by one event per turn and is serialized on every write and
+parsed on every read. orjson does both several times faster than the stdlib.
+
+  * dumps / loads are set as the engine's json_serializer / json_deserializer
+    (app/db/session.py), so they handle the JSON columns.
+  * ORJSONResponse is the app's default response class.
+  * model_response() renders a pydantic model with model_dump_json. Endpoints
+    that return large models return it directly, which skips FastAPI building an
+    intermediate dict from the response model and re-encoding it.
+"""
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+
+__all__ = ["dumps", "loads", "ORJSONResponse", "model_response"]
+
+# Non-string dict keys are stringified the way json.dumps does it, so existing game_data keeps working
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(value: Any) -> str:
+    # SQLAlchemy's json_serializer must return str
+    return orjson.dumps(value, option=_DUMPS_OPTIONS).decode()
+
+
+loads = orjson.loads
+
+
+def model_response(model: BaseModel, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """The model as a JSON response. The route's response_model still documents it."""
+    return Response(content=model.model_dump_json(), status_code=status_code, headers=headers, media_type="application/json")
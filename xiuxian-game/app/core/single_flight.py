@@ -0,0 +1,97 @@
+# app/core/single_flight.py
+"""
+Single-flight execution: concurrent calls with the same key share one run.
+
+The first caller for a key (the leader) runs the function. Callers that arrive
+with the same key while it runs (followers) wait for it and get its result, or
+its exception, instead of running it again. A flight ends when the leader
+returns, so calls that are merely identical but not concurrent each run.
+
+Functions can stream partial output through the `emit` callable they are given.
+Every emitted piece goes to the leader's on_delta callback and to the callbacks
+of all followers, including followers that join late: they first get everything
+emitted so far. Each follower's callback runs in the follower's own thread, so a
+slow consumer (a websocket client) never holds up the run or the other callers.
+If the leader's own callback raises, the run goes on for the followers and the
+leader gets the exception when it ends. With share_deltas=False followers get
+no pieces at all, for output that would need rewriting for them.
+"""
+import threading
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+Emit = Callable[[str], None]
+
+
+class _Flight:
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.deltas: List[str] = []
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def do(self, key: Hashable, func: Callable[[Emit], T], on_delta: Optional[Emit] = None, share_deltas: bool = True) -> Tuple[T, bool]:
+        """
+        func(emit)'s result, run once for all concurrent callers with this key. Returns (result, shared),
+        shared being True for followers. Raises the exception the run raised.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            return self._follow(flight, on_delta if share_deltas else None), True
+
+        callback_errors: List[BaseException] = []
+
+        def emit(delta: str) -> None:
+            with flight.changed:
+                flight.deltas.append(delta)
+                flight.changed.notify_all()
+            if on_delta is not None and not callback_errors:
+                try:
+                    on_delta(delta)
+                except BaseException as e: # The leader's consumer went away; the followers' haven't
+                    callback_errors.append(e)
+
+        try:
+            flight.result = func(emit)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key] # Later callers start a new flight
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+        if callback_errors:
+            raise callback_errors[0]
+        return flight.result, False
+
+    @staticmethod
+    def _follow(flight: _Flight, on_delta: Optional[Emit]) -> T:
+        seen = 0
+        while True:
+            with flight.changed:
+                while not flight.done and (on_delta is None or seen == len(flight.deltas)):
+                    flight.changed.wait()
+                new = flight.deltas[seen:] if on_delta is not None else []
+                seen += len(new)
+                done = flight.done # Everything it emitted is in `new` by now
+            for delta in new: # Outside the lock: the callback may block
+                on_delta(delta)
+            if done:
+                break
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
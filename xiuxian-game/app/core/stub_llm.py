@@ -0,0 +1,139 @@
+# app/core/stub_llm.py
+"""
+Deterministic local stand-ins for the OpenAI LLM and embeddings.
+
+Selected with LLM_BACKEND="stub". They need no network access or API key, so the
+app can be benchmarked and developed offline. Output depends only on the input
+text, which keeps benchmark runs reproducible across commits.
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
+from pydantic import PrivateAttr
+
+_PLOTS = [
+    "晨雾笼罩着青云山脚，你在溪边发现一株泛着灵光的草药，远处隐约传来剑鸣之声。",
+    "坊市中人声鼎沸，一名神秘老者在角落摆摊，摊上的残破玉简似乎蕴含着某种功法。",
+    "夜色渐深，你盘膝而坐，体内灵气缓缓流转，却忽然察觉洞府外有人窥探。",
+    "宗门大比将至，同门师兄约你切磋，言语间却透露出对你修炼进度的试探。",
+    "你循着古籍记载来到一处荒废的洞府，石门上的禁制残纹仍在微微闪烁。",
+]
+
+_CHOICES = [
+    ["采下草药仔细研究", "循着剑鸣前去查看", "留在原地打坐调息"],
+    ["上前询问玉简来历", "暗中观察老者举动", "转身离开继续闲逛"],
+    ["收敛气息出洞查探", "布下简易阵法防御", "继续修炼不予理会"],
+    ["答应切磋以试身手", "婉言推辞专心闭关", "向长老打听大比规则"],
+    ["尝试破解残存禁制", "在洞府外围搜寻线索", "记下位置改日再来"],
+]
+
+_TOKEN_PATTERN = re.compile(r"[一-鿿]|[A-Za-z0-9_]+")
+_EVENT_LINE = re.compile(r"^- \[[^\]]*\] (.{1,24})", re.MULTILINE)
+
+
+class StubLLM(LLM):
+    """
+    Returns a well-formed StoryScene JSON object chosen by hashing the prompt. Prompts that
+    don't ask for choices (the story summary prompt) get the opening words of each event line.
+    A batch of prompts (generate([...])) takes latency_ms plus batch_prompt_ms per extra prompt,
+    as on a model server that decodes the batch's sequences together. With max_concurrency, calls
+    beyond that many at once wait for a free slot, as on a server with a fixed number of GPUs.
+    """
+
+    latency_ms: float = 0.0
+    batch_prompt_ms: float = 0.0
+    max_concurrency: int = 0 # 0: unlimited
+    _slots: Optional[threading.BoundedSemaphore] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        if self.max_concurrency > 0:
+            self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def _busy(self, milliseconds: float) -> None:
+        """Simulated generation time, spent holding one of the server's slots."""
+        if milliseconds <= 0:
+            return
+        if self._slots is None:
+            time.sleep(milliseconds / 1000.0)
+            return
+        with self._slots:
+            time.sleep(milliseconds / 1000.0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self._busy(self.latency_ms)
+        return self._render(prompt)
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> LLMResult:
+        self._busy(self.latency_ms + self.batch_prompt_ms * (len(prompts) - 1))
+        return LLMResult(generations=[[Generation(text=self._render(prompt))] for prompt in prompts])
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        # The simulated latency is spread over the chunks, like tokens arriving from a real model
+        text = self._render(prompt)
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+        for piece in pieces:
+            self._busy(self.latency_ms / len(pieces))
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield GenerationChunk(text=piece)
+
+    def _render(self, prompt: str) -> str:
+        if '"choices"' not in prompt:
+            return "；".join(_EVENT_LINE.findall(prompt)) or "平静无事。"
+        digest = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16)
+        variant = digest % len(_PLOTS)
+        scene = {
+            "plot": _PLOTS[variant],
+            "choices": [
+                {"id": f"choice_{i + 1}", "text": text} for i, text in enumerate(_CHOICES[variant])
+            ],
+            "duration_days": digest % 7 + 1,
+        }
+        return "```json\n" + json.dumps(scene, ensure_ascii=False, indent=2) + "\n```"
+
+    def get_num_tokens(self, text: str) -> int:
+        # Words and CJK characters; avoids the base class loading a GPT-2 tokenizer
+        return len(_TOKEN_PATTERN.findall(text))
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    # CJK text repeats a small alphabet of characters, so caching the digest makes large corpora cheap to embed
+    return int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16)
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-tokens feature hashing. CJK characters count as individual tokens."""
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = _token_hash(token)
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
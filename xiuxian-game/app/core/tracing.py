@@ -0,0 +1,380 @@
+# app/core/tracing.py
+"""
+Lightweight request-phase tracing with OpenTelemetry-compatible output.
+
+Spans carry W3C trace/span ids and are exported in the OTLP/JSON layout
+(resourceSpans -> scopeSpans -> spans), so the files and HTTP payloads can be
+read by an OpenTelemetry collector or any OTLP-aware tool. Incoming
+`traceparent` headers are honoured, so traces continue across services.
+
+Sampling is decided once per trace (TRACE_SAMPLE_RATE). Unsampled traces use a
+shared no-op span, which keeps the cost of instrumented code close to zero.
+Finished spans are queued and exported in batches by a daemon thread, so
+exporting never blocks a request.
+
+Usage:
+    with tracer.start_span("rag.llm_call", {"llm.backend": "openai"}) as span:
+        ...
+        span.set_attribute("llm.output_chars", len(text))
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A timed operation. Use Tracer.start_span rather than creating spans directly."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind",
+                 "start_ns", "end_ns", "attributes", "status_code", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], kind: int,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def is_recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def update_name(self, name: str) -> None:
+        self.name = name
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NonRecordingSpan:
+    """Stand-in for spans of unsampled traces. Every operation is a no-op."""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str = "0" * 32, span_id: str = "0" * 16):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def update_name(self, name: str) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+
+_NOOP_SPAN = _NonRecordingSpan()
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Any:
+    """The active span in this context, or a no-op span if none."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Parses a W3C traceparent header into (trace_id, parent_span_id, sampled)."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 0x01)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+# --- Exporters ---
+
+class FileSpanExporter:
+    """Appends one OTLP/JSON `resourceSpans` document per batch to a file (JSON lines)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+class OTLPHttpSpanExporter:
+    """POSTs OTLP/JSON batches to a collector (or the stand-in in benchmarks/trace_collector.py)."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class BatchSpanProcessor:
+    """Queues finished spans and exports them in batches from a daemon thread."""
+
+    def __init__(self, exporters: List[Any], service_name: str, max_queue_size: int = 10000,
+                 max_batch_size: int = 512, schedule_delay: float = 1.0):
+        self.exporters = exporters
+        self.service_name = service_name
+        self.max_batch_size = max_batch_size
+        self.schedule_delay = schedule_delay
+        self.dropped_spans = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped_spans += 1  # Never block a request on telemetry
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            stop = False
+            try:
+                item = self._queue.get(timeout=self.schedule_delay)
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+                    while len(batch) < self.max_batch_size:
+                        item = self._queue.get_nowait()
+                        if item is None:
+                            stop = True
+                            break
+                        batch.append(item)
+            except queue.Empty:
+                pass
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _export(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+            }]
+        }
+        for exporter in self.exporters:
+            try:
+                exporter.export(payload)
+            except Exception as e:
+                logger.warning("Trace export to %s failed: %s", type(exporter).__name__, e)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Flushes queued spans and stops the export thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+# --- Tracer ---
+
+class Tracer:
+    def __init__(self, enabled: bool, sample_rate: float, processor: Optional[BatchSpanProcessor]):
+        self.enabled = enabled and processor is not None
+        self.sample_rate = sample_rate
+        self.processor = processor
+
+    @contextmanager
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                   kind: int = SPAN_KIND_INTERNAL, traceparent: Optional[str] = None) -> Iterator[Any]:
+        """
+        Starts a child of the current span, or a new trace if there is none.
+        `traceparent` (W3C header) continues a trace started by a caller.
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is not None and not parent.is_recording:
+            yield parent  # The trace was not sampled; children are not recorded either
+            return
+
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote is not None:
+                trace_id, parent_span_id, sampled = remote
+            else:
+                trace_id, parent_span_id = os.urandom(16).hex(), None
+                sampled = random.random() < self.sample_rate
+            if not sampled:
+                token = _current_span.set(_NonRecordingSpan(trace_id))
+                try:
+                    yield _current_span.get()
+                finally:
+                    _current_span.reset(token)
+                return
+            span = Span(name, trace_id, parent_span_id, kind, attributes)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def start_detached_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                            kind: int = SPAN_KIND_INTERNAL) -> Optional[Span]:
+        """
+        Starts a child of the current span without making it current. The caller must
+        pass it to end_span. Used where start and end happen in separate callbacks
+        (SQLAlchemy cursor events). Returns None when nothing is being recorded.
+        """
+        if not self.enabled:
+            return None
+        parent = _current_span.get()
+        if parent is None or not parent.is_recording:
+            return None
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+    def end_span(self, span: Span) -> None:
+        span.end_ns = time.time_ns()
+        self.processor.on_end(span)
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+def _build_tracer() -> Tracer:
+    exporters: List[Any] = []
+    if settings.TRACE_EXPORT_PATH:
+        exporters.append(FileSpanExporter(settings.TRACE_EXPORT_PATH))
+    if settings.TRACE_EXPORT_ENDPOINT:
+        exporters.append(OTLPHttpSpanExporter(settings.TRACE_EXPORT_ENDPOINT))
+    processor = BatchSpanProcessor(exporters, service_name=settings.TRACE_SERVICE_NAME) if exporters else None
+    return Tracer(enabled=settings.TRACING_ENABLED, sample_rate=settings.TRACE_SAMPLE_RATE, processor=processor)
+
+
+tracer = _build_tracer()
+
+
+# --- SQLAlchemy instrumentation ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = tracer.start_detached_span(
+        "db.query",
+        {"db.system": conn.dialect.name, "db.statement": statement[:500], "db.executemany": executemany},
+        kind=SPAN_KIND_CLIENT,
+    )
+    if span is not None and context is not None:
+        context._trace_span = span
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        context._trace_span = None
+        span.set_attribute("db.rowcount", cursor.rowcount)
+        tracer.end_span(span)
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        context._trace_span = None
+        span.record_exception(exception_context.original_exception)
+        tracer.end_span(span)
+
+
+def instrument_engine(engine) -> None:
+    """Records a `db.query` span for every statement executed through the engine."""
+    from sqlalchemy import event
+
+    if not tracer.enabled or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -1,15 +1,43 @@
 # app/crud/crud_character.py
-from sqlalchemy.orm import Session
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 
 from app.models.character_models import Character, CharacterAttribute, Identity
 from app.schemas.character_schemas import CharacterCreate, CharacterUpdate, CharacterAttributeCreate # Added CharacterAttributeCreate
 
-def get_character(db: Session, character_id: int) -> Optional[Character]:
-    return db.query(Character).filter(Character.id == character_id).first()
+# CharacterDetailed (and so every game endpoint) walks attributes and identity. Both are to-one,
+# so they are joined into the character's SELECT instead of each costing a lazy SELECT later.
+CHARACTER_DETAIL_OPTIONS = (joinedload(Character.attributes), joinedload(Character.identity))
 
-def get_characters_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Character]:
-    return db.query(Character).filter(Character.user_id == user_id).offset(skip).limit(limit).all()
+def get_character(db: Session, character_id: int, with_details: bool = True) -> Optional[Character]:
+    """
+    Loads a character. with_details=False skips the attribute/identity joins, for callers that
+    only check ownership and never serialize the character.
+    """
+    query = db.query(Character)
+    if with_details:
+        query = query.options(*CHARACTER_DETAIL_OPTIONS)
+    return query.filter(Character.id == character_id).first()
+
+# Columns of schemas.CharacterSimple. List endpoints select only these, so no ORM objects
+# (or their attributes/identity relationships) are built for a listing.
+CHARACTER_SUMMARY_COLUMNS = (Character.id, Character.name, Character.level, Character.cultivation_stage)
+
+def get_character_summaries_by_user(
+    db: Session, user_id: int, limit: int = 100, skip: int = 0, after_id: Optional[int] = None
+) -> List[Row]:
+    """
+    Character summary rows for a user in id order. Page with after_id (keyset: the last id of the
+    previous page) rather than skip where possible; skip is kept for the offset-based endpoint.
+    """
+    query = db.query(*CHARACTER_SUMMARY_COLUMNS).filter(Character.user_id == user_id)
+    if after_id is not None:
+        query = query.filter(Character.id > after_id)
+    query = query.order_by(Character.id)
+    if skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 def create_character(db: Session, character_in: CharacterCreate, user_id: int) -> Character:
     db_character = Character(
@@ -33,10 +61,10 @@ def create_character(db: Session, character_in: CharacterCreate, user_id: int) -
         db_attributes = CharacterAttribute(character_id=db_character.id)
         db.add(db_attributes)
 
+    character_id = db_character.id # Read before the commit expires it
     db.commit()
-    db.refresh(db_character)
-    # db.refresh(db_attributes) # attributes are related, refreshing character should load them if relationship is set up correctly
-    return db_character
+    # Reload with the detail joins; a plain refresh would leave attributes to a second, lazy SELECT
+    return get_character(db, character_id=character_id)
 
 def update_character(db: Session, character: Character, character_update: CharacterUpdate) -> Character:
     update_data = character_update.model_dump(exclude_unset=True) # Pydantic V2
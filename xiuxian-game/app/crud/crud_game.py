@@ -1,24 +1,20 @@
 # app/crud/crud_game.py
+from sqlalchemy import and_, or_
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-<<<<<<< HEAD
-=======
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime
+import logging
 import re # Import re for parsing "Day X"
->>>>>>> origin/haa
 
+from app.models.character_models import Character
 from app.models.game_models import GameState, GameSave
 # Note: Schemas like GameStateCreate are for API input, not direct DB creation here.
 # CRUD functions typically take model instances or primitive types for creation/update.
 
+logger = logging.getLogger(__name__)
+
 def create_game_state(db: Session, character_id: int, initial_scene_id: Optional[str] = "start", initial_history: Optional[List[Dict[str,Any]]] = None) -> GameState:
-<<<<<<< HEAD
-    """Creates a new game state for a character."""
-    db_game_state = GameState(
-        character_id=character_id,
-        current_scene_id=initial_scene_id,
-        story_history=initial_history if initial_history is not None else [], # Ensure list
-        game_data={} # Start with empty game_data
-=======
     """Creates a new game state for a character, initializing current_date."""
     db_game_state = GameState(
         character_id=character_id,
@@ -26,7 +22,6 @@ def create_game_state(db: Session, character_id: int, initial_scene_id: Optional
         story_history=initial_history if initial_history is not None else [],
         game_data={},
         current_date="Day 1"  # ADDED: Initialize current_date
->>>>>>> origin/haa
     )
     db.add(db_game_state)
     db.commit()
@@ -44,41 +39,69 @@ def get_active_game_state_for_character(db: Session, character_id: int) -> Optio
     """
     return db.query(GameState).filter(GameState.character_id == character_id).order_by(GameState.updated_at.desc()).first()
 
-def update_game_state(
-    db: Session,
+def get_active_game_state_version(db: Session, character_id: int, user_id: int) -> Optional[Row]:
+    """
+    (id, version) of the character's active game state, if the character belongs to user_id.
+    Reads no JSON columns; used to answer conditional GETs.
+    """
+    return (
+        db.query(GameState.id, GameState.version)
+        .join(Character, Character.id == GameState.character_id)
+        .filter(GameState.character_id == character_id, Character.user_id == user_id)
+        .order_by(GameState.updated_at.desc())
+        .first()
+    )
+
+def advance_date(current_date: Optional[str], days: int) -> str:
+    """Returns the "Day X" date `days` days after current_date."""
+    current_date_str = current_date if current_date else "Day 0" # Default if None
+    day_match = re.match(r"Day (\d+)", current_date_str)
+    if day_match:
+        try:
+            current_day_num = int(day_match.group(1))
+            return f"Day {current_day_num + days}"
+        except ValueError:
+            logger.warning("Could not parse day number from current_date '%s'. Date not advanced.", current_date_str)
+            return current_date_str
+    # If format is unexpected, we'll start from `days`.
+    logger.warning("current_date '%s' not in 'Day X' format. Advancing from Day 0 implicitly.", current_date_str)
+    return f"Day {days}"
+
+def apply_story_event(
     game_state: GameState,
     story_event: Dict[str, Any],
     new_scene_id: Optional[str],
-<<<<<<< HEAD
-    game_data_updates: Optional[Dict[str, Any]] = None
+    game_data_updates: Optional[Dict[str, Any]] = None,
+    advance_days: Optional[int] = None
 ) -> GameState:
     """
-    Updates a game state: appends to story history, changes current scene,
-    and merges updates into game_data.
+    Applies a turn to a game state in memory, without committing: appends to story history,
+    changes current scene, updates game_data, and advances in-game date if specified.
     """
     current_history = game_state.story_history
-    # Ensure story_history is a list, even if it was None/null from DB (though model default is list)
     if not isinstance(current_history, list):
         current_history = []
-    # Ensure all elements in current_history are dicts, if not, this might indicate corruption or wrong data type.
-    # For robustness, one might filter or log, but here we assume it's a list of dicts or an empty list.
     game_state.story_history = current_history + [story_event]
 
-    if new_scene_id is not None: # Only update if a new_scene_id is explicitly provided
+    if new_scene_id is not None:
         game_state.current_scene_id = new_scene_id
 
     current_game_data = game_state.game_data
-    # Ensure game_data is a dict, even if it was None/null from DB (though model default is dict)
     if not isinstance(current_game_data, dict):
         current_game_data = {}
     if game_data_updates:
-        game_state.game_data = {**current_game_data, **game_data_updates} # Merge updates
+        game_state.game_data = {**current_game_data, **game_data_updates}
+
+    # ADDED: Logic to advance current_date
+    if advance_days is not None and advance_days > 0:
+        game_state.current_date = advance_date(game_state.current_date, advance_days)
+    return game_state
 
-    # updated_at should be handled by onupdate in the model, but explicit add signals change.
-    # Forcing update of updated_at if model's onupdate is not working or not set for all ORMs/cases
-    # from datetime import datetime
-    # game_state.updated_at = datetime.utcnow() # Uncomment if explicit update is needed
-=======
+def update_game_state(
+    db: Session,
+    game_state: GameState,
+    story_event: Dict[str, Any],
+    new_scene_id: Optional[str],
     game_data_updates: Optional[Dict[str, Any]] = None,
     advance_days: Optional[int] = None  # ADDED parameter
 ) -> GameState:
@@ -86,41 +109,7 @@ def update_game_state(
     Updates a game state: appends to story history, changes current scene,
     updates game_data, and advances in-game date if specified.
     """
-    current_history = game_state.story_history
-    if not isinstance(current_history, list):
-        current_history = []
-    game_state.story_history = current_history + [story_event]
-
-    if new_scene_id is not None:
-        game_state.current_scene_id = new_scene_id
-
-    current_game_data = game_state.game_data
-    if not isinstance(current_game_data, dict):
-        current_game_data = {}
-    if game_data_updates:
-        game_state.game_data = {**current_game_data, **game_data_updates}
-
-    # ADDED: Logic to advance current_date
-    if advance_days is not None and advance_days > 0:
-        current_date_str = game_state.current_date if game_state.current_date else "Day 0" # Default if None
-        day_match = re.match(r"Day (\d+)", current_date_str)
-        if day_match:
-            try:
-                current_day_num = int(day_match.group(1))
-                new_day_num = current_day_num + advance_days
-                game_state.current_date = f"Day {new_day_num}"
-            except ValueError:
-                print(f"Warning: Could not parse day number from current_date '{current_date_str}'. Date not advanced.")
-                # Optionally, set to a default or log error more formally
-        else:
-            # If current_date is not in "Day X" format, and we need to advance,
-            # we could try to initialize it or log a warning.
-            # For simplicity, if format is unexpected, we'll start from advance_days.
-            print(f"Warning: current_date '{current_date_str}' not in 'Day X' format. Advancing from Day 0 implicitly.")
-            game_state.current_date = f"Day {advance_days}"
-
-
->>>>>>> origin/haa
+    apply_story_event(game_state, story_event, new_scene_id, game_data_updates, advance_days)
     db.add(game_state)
     db.commit()
     db.refresh(game_state)
@@ -151,9 +140,27 @@ def get_game_save(db: Session, game_save_id: int) -> Optional[GameSave]:
     """Retrieves a specific game save by its ID."""
     return db.query(GameSave).filter(GameSave.id == game_save_id).first()
 
-def get_game_saves_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[GameSave]:
-    """Retrieves a list of game saves for a specific user, ordered by creation date."""
-    return db.query(GameSave).filter(GameSave.user_id == user_id).order_by(GameSave.created_at.desc()).offset(skip).limit(limit).all()
+# Columns of schemas.GameSaveInDB; listing saves never loads the GameSave relationships
+GAME_SAVE_LIST_COLUMNS = (
+    GameSave.id, GameSave.user_id, GameSave.character_id, GameSave.game_state_id,
+    GameSave.save_name, GameSave.save_slot, GameSave.created_at,
+)
+
+def get_game_save_rows_by_user(
+    db: Session, user_id: int, limit: int = 100, skip: int = 0, before: Optional[Tuple[datetime, int]] = None
+) -> List[Row]:
+    """
+    Game save rows for a user, newest first (created_at desc, id desc). `before` is the
+    (created_at, id) key of the last row of the previous page, for keyset paging.
+    """
+    query = db.query(*GAME_SAVE_LIST_COLUMNS).filter(GameSave.user_id == user_id)
+    if before is not None:
+        created_at, save_id = before
+        query = query.filter(or_(GameSave.created_at < created_at, and_(GameSave.created_at == created_at, GameSave.id < save_id)))
+    query = query.order_by(GameSave.created_at.desc(), GameSave.id.desc())
+    if skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 # Note: Delete operations for GameState or GameSave can be added later if required.
 # For MVP, they are not explicitly listed in the API endpoints.
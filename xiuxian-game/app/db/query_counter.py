@@ -0,0 +1,75 @@
+# app/db/query_counter.py
+"""
+Counts SQL statements issued through the engine.
+
+Counters are scoped with a ContextVar, so concurrent requests only see their own
+statements. FastAPI runs sync endpoints in a threadpool with a copy of the
+request context, which means a counter opened in middleware still sees the
+statements executed by the endpoint and its dependencies.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    """Accumulates the statements executed while it is active."""
+
+    def __init__(self, record_statements: bool = False):
+        self.count = 0
+        self.record_statements = record_statements
+        self.statements: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"<QueryCounter(count={self.count})>"
+
+
+_active_counters: ContextVar[Tuple[QueryCounter, ...]] = ContextVar("db_query_counters", default=())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters.get():
+        counter.count += 1
+        if counter.record_statements:
+            counter.statements.append(statement)
+
+
+def install_query_counter(engine: Engine) -> None:
+    """Attach the statement counter to an engine. Safe to call more than once."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def count_queries(record_statements: bool = False) -> Iterator[QueryCounter]:
+    """Count the statements executed inside the block. Counters may be nested."""
+    counter = QueryCounter(record_statements=record_statements)
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+class QueryCountMismatch(AssertionError):
+    pass
+
+
+@contextmanager
+def expect_queries(expected: int, exact: bool = True, label: str = "block") -> Iterator[QueryCounter]:
+    """
+    Asserts the block issues `expected` statements (at most `expected` with exact=False).
+    The error lists the statements, which is usually enough to spot the lazy load that crept in.
+
+        with expect_queries(2, label="GET /characters/{id}"):
+            client.get(f"/api/v1/characters/{character_id}", headers=headers)
+    """
+    with count_queries(record_statements=True) as counter:
+        yield counter
+    if counter.count > expected or (exact and counter.count != expected):
+        statements = "\n".join(f"  {i}. {' '.join(s.split())[:200]}" for i, s in enumerate(counter.statements, 1))
+        bound = "" if exact else "at most "
+        raise QueryCountMismatch(f"{label}: expected {bound}{expected} SQL statements, got {counter.count}:\n{statements}")
@@ -2,12 +2,28 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session # Session is imported for type hinting
 from app.core.config import settings
+from app.db.query_counter import install_query_counter
+from app.core.tracing import instrument_engine
+from app.core.metrics import instrument_pool
+from app.core import serialization
 
 # Ensure SQLALCHEMY_DATABASE_URI is a string for create_engine
 if settings.SQLALCHEMY_DATABASE_URI is None:
     raise ValueError("SQLALCHEMY_DATABASE_URI is not set. Please check your .env file or environment variables.")
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), pool_pre_ping=True)
+database_uri = str(settings.SQLALCHEMY_DATABASE_URI)
+# SQLite (local benchmarking) needs to allow the connection to be used from FastAPI's threadpool
+connect_args = {"check_same_thread": False} if database_uri.startswith("sqlite") else {}
+
+engine = create_engine(
+    database_uri, pool_pre_ping=True, connect_args=connect_args,
+    # story_history / game_data columns are (de)serialized with orjson rather than the stdlib json
+    json_serializer=serialization.dumps, json_deserializer=serialization.loads,
+)
+install_query_counter(engine)
+instrument_engine(engine) # No-op unless TRACING_ENABLED
+if settings.METRICS_ENABLED:
+    instrument_pool(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Dependency to get DB session
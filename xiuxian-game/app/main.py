@@ -1,8 +1,9 @@
 # app/main.py
 from fastapi import FastAPI, Request, status # Add Request, status
-from fastapi.responses import JSONResponse # Add JSONResponse
+from fastapi.responses import JSONResponse, Response # Add JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager # For lifespan manager
+import logging
 
 from app.core.config import settings
 from app.db.session import engine # Assuming engine is exposed from session.py
@@ -10,39 +11,54 @@ from app.models.base import Base # To create tables
 from app.api.v1.endpoints import auth as api_auth # Router for auth
 from app.api.v1.endpoints import characters as api_characters # Router for characters
 from app.api.v1.endpoints import game as api_game # Router for game
+from app.api.v1.endpoints import game_ws as api_game_ws # WebSocket game channel
+from app.api.v1.endpoints import admin as api_admin # Operator endpoints (ADMIN_TOKEN)
 from app.core.rag_system import RAGSystem
 from app.core.plugin_system import PluginManager
+from app.api.middleware import PrometheusMiddleware, QueryCountHeaderMiddleware, TracingMiddleware
+from app.core import metrics
+from app.core.tracing import tracer
+from app.core.serialization import ORJSONResponse
+from app.services.knowledge_watcher import knowledge_watcher
+from app.services.scene_pool import scene_pool
+from app.services.session_cache import session_cache
+from app.utils.logger import setup_logging, shutdown_logging
 # Import custom exceptions if defined and to be handled globally
 # from app.utils.exceptions import GameException, NotFoundError, ValidationError
 
+setup_logging() # Before anything logs, so every record goes through the queue handler
+logger = logging.getLogger(__name__)
+
 # Lifespan manager for startup and shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Startup ---
-    print("Application startup...")
+    logger.info("Application startup...")
 
     # 1. Create database tables (for MVP, use create_all. Production should use Alembic)
-    print("Initializing database...")
+    logger.info("Initializing database...")
     try:
         Base.metadata.create_all(bind=engine)
-        print("Database tables created successfully (if they didn't exist).")
+        logger.info("Database tables created successfully (if they didn't exist).")
     except Exception as e:
-        print(f"Error creating database tables: {e}")
+        logger.exception("Error creating database tables: %s", e)
         # Depending on severity, you might want to prevent app startup
 
     # 2. Initialize RAG System
-    print("Initializing RAG System...")
+    logger.info("Initializing RAG System...")
     try:
         rag_system_instance = RAGSystem()
         app.state.rag_system = rag_system_instance
-        print("RAG System initialized successfully.")
+        knowledge_watcher.start(rag_system_instance) # Reloads knowledge_base/ changes without a restart
+        scene_pool.start(rag_system_instance) # Pre-generates opening and fallback scenes
+        logger.info("RAG System initialized successfully.")
     except Exception as e:
-        print(f"Error initializing RAG System: {e}")
+        logger.exception("Error initializing RAG System: %s", e)
         app.state.rag_system = None # Ensure it's None if init fails
         # Consider if app should start if RAG fails
 
     # 3. Initialize Plugin Manager and load plugins
-    print("Initializing Plugin Manager and loading plugins...")
+    logger.info("Initializing Plugin Manager and loading plugins...")
     try:
         # Ensure 'plugins' dir is relative to the project root.
         # If main.py is in app/, plugins_dir should be "../plugins" if PluginManager expects it relative to its own location
@@ -50,28 +66,40 @@ async def lifespan(app: FastAPI):
         plugin_manager_instance = PluginManager(plugins_dir="plugins")
         plugin_manager_instance.load_plugins()
         app.state.plugin_manager = plugin_manager_instance
-        print("Plugin Manager initialized and plugins loaded successfully.")
+        logger.info("Plugin Manager initialized and plugins loaded successfully.")
     except Exception as e:
-        print(f"Error initializing Plugin Manager or loading plugins: {e}")
+        logger.exception("Error initializing Plugin Manager or loading plugins: %s", e)
         app.state.plugin_manager = None # Ensure it's None if init fails
 
+    if settings.METRICS_ENABLED:
+        metrics.prebind_routes(app)
+
     yield # Application runs here
 
     # --- Shutdown ---
-    print("Application shutdown...")
+    logger.info("Application shutdown...")
     if hasattr(app.state, 'plugin_manager') and app.state.plugin_manager:
-        print("Unloading plugins...")
+        logger.info("Unloading plugins...")
         try:
             app.state.plugin_manager.unload_plugins()
-            print("Plugins unloaded successfully.")
+            logger.info("Plugins unloaded successfully.")
         except Exception as e:
-            print(f"Error unloading plugins: {e}")
+            logger.exception("Error unloading plugins: %s", e)
+    knowledge_watcher.shutdown()
+    scene_pool.shutdown() # Releases the pooled scenes this worker holds
+    session_cache.shutdown() # Write turns still held by the write-behind cache
+    if getattr(app.state, "rag_system", None) is not None:
+        app.state.rag_system.shutdown() # Send LLM calls still waiting for a batch
+    tracer.shutdown() # Flush spans still queued for export
+    metrics.mark_process_dead() # Multiprocess mode: drop this worker's live gauges
+    shutdown_logging() # Flush queued log records
     # Other cleanup tasks can go here (e.g., closing DB connections if not handled by SQLAlchemy engine)
 
 # Create FastAPI app instance with lifespan manager
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=ORJSONResponse, # orjson instead of json.dumps for every response
     lifespan=lifespan
 )
 
@@ -85,12 +113,20 @@ app.add_middleware(
     allow_methods=["*"], # Allows all methods
     allow_headers=["*"], # Allows all headers
 )
+if settings.DB_QUERY_COUNT_HEADER:
+    # Per-request SQL statement counts for the benchmark harness (benchmarks/load_test.py)
+    app.add_middleware(QueryCountHeaderMiddleware)
+if settings.METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware)
+if tracer.enabled:
+    # Added last so it is outermost and the root span covers the other middlewares
+    app.add_middleware(TracingMiddleware)
 
 # --- Global Exception Handlers (Optional for MVP, but good practice) ---
 # Example: Catching all other exceptions
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
-    print(f"Unhandled exception: {exc} (Path: {request.url.path})") # Log the full error and path
+    logger.error("Unhandled exception: %s (Path: %s)", exc, request.url.path, exc_info=exc) # Log the full error and path
     # In production, avoid sending detailed error like str(exc) to client
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -118,6 +154,8 @@ async def generic_exception_handler(request: Request, exc: Exception):
 app.include_router(api_auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["Authentication"])
 app.include_router(api_characters.router, prefix=f"{settings.API_V1_STR}/characters", tags=["Characters"])
 app.include_router(api_game.router, prefix=f"{settings.API_V1_STR}/game", tags=["Game"])
+app.include_router(api_admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["Admin"])
+app.include_router(api_game_ws.router, prefix="/ws", tags=["Game WebSocket"]) # ws://host/ws/game/{character_id}, as in api-specification.md
 
 
 # --- Root endpoint (optional) ---
@@ -125,5 +163,12 @@ app.include_router(api_game.router, prefix=f"{settings.API_V1_STR}/game", tags=[
 async def read_root():
     return {"message": f"Welcome to {settings.PROJECT_NAME} API. Docs at /docs or /redoc."}
 
+# --- Prometheus metrics ---
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        body, content_type = metrics.render_latest()
+        return Response(content=body, media_type=content_type)
+
 # For Uvicorn to run this app (if running `uvicorn app.main:app`):
 # The file is `app/main.py`, so the command `uvicorn app.main:app --reload` from the project root should work.
@@ -2,7 +2,7 @@
 from .base import CustomBase, Base  # Expose CustomBase and original Base if needed
 from .user_models import User
 from .character_models import Character, CharacterAttribute, Identity
-from .game_models import GameState, GameSave
+from .game_models import GameState, GameSave, PregeneratedScene
 
 # You can also define __all__ here if you want to control `from app.models import *`
 __all__ = [
@@ -14,4 +14,5 @@ __all__ = [
     "Identity",
     "GameState",
     "GameSave",
+    "PregeneratedScene",
 ]
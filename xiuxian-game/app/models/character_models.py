@@ -1,5 +1,5 @@
 # app/models/character_models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime # Correct import for datetime
 from app.models.base import CustomBase # Use CustomBase
@@ -43,14 +43,18 @@ class Character(CustomBase):
     game_states = relationship("GameState", back_populates="character", cascade="all, delete-orphan")
     game_saves = relationship("GameSave", back_populates="character", cascade="all, delete-orphan")
 
+    # Keyset pagination of a user's characters (crud_character.get_character_summaries_by_user)
+    __table_args__ = (Index("ix_characters_user_id_id", "user_id", "id"),)
+
     def __repr__(self) -> str:
         return f"<Character(name='{self.name}', user_id={self.user_id})>"
 
 class CharacterAttribute(CustomBase):
     __tablename__ = "character_attributes"
 
-    # character_id is primary key and foreign key for one-to-one
-    character_id = Column(Integer, ForeignKey("characters.id"), primary_key=True)
+    # Unique foreign key for one-to-one. The inherited `id` stays the sole primary key:
+    # making character_id part of the key too left `id` without autoincrement, so inserts failed.
+    character_id = Column(Integer, ForeignKey("characters.id"), unique=True, nullable=False)
     strength = Column(Integer, default=10)
     agility = Column(Integer, default=10)
     intelligence = Column(Integer, default=10)
@@ -1,5 +1,5 @@
 # app/models/game_models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime # Correct import for datetime
 from app.models.base import CustomBase
@@ -13,23 +13,24 @@ class GameState(CustomBase): # Ensure GameState is defined before GameSave
     current_scene_id = Column(String, nullable=True)
     story_history = Column(JSON, default=list)
     game_data = Column(JSON, default=dict)
-<<<<<<< HEAD
-=======
 
     current_date = Column(String, nullable=True) # ADDED: For in-game date, e.g., "Day 1"
+    # Rolling summary of story_history[:summarized_events], kept up to date by GameSession.summarize
+    story_summary = Column(Text, nullable=True)
+    summarized_events = Column(Integer, nullable=False, default=0)
+    # Bumped on every write. ORM updates check it (version_id_col) and so does the
+    # write-behind flush in app/services/session_cache.py, so concurrent writers can't overwrite each other.
+    version = Column(Integer, nullable=False, default=1)
 
->>>>>>> origin/haa
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     character = relationship("Character", back_populates="game_states")
 
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self) -> str:
-<<<<<<< HEAD
-        return f"<GameState(character_id={self.character_id}, scene='{self.current_scene_id}')>"
-=======
         # Assuming self.id is available from CustomBase after instance creation and DB flush/commit
         return f"<GameState(id={getattr(self, 'id', None)}, char_id={self.character_id}, date='{self.current_date}')>"
->>>>>>> origin/haa
 
 class GameSave(CustomBase):
     __tablename__ = "game_saves"
@@ -44,5 +45,28 @@ class GameSave(CustomBase):
     character = relationship("Character", back_populates="game_saves") # MODIFIED/ADDED back_populates
     game_state = relationship("GameState") # MODIFIED/ADDED
 
+    # Keyset pagination of a user's saves, newest first (crud_game.get_game_save_rows_by_user)
+    __table_args__ = (Index("ix_game_saves_user_id_created_at_id", "user_id", "created_at", "id"),)
+
     def __repr__(self) -> str:
         return f"<GameSave(name='{self.save_name}', gs_id={self.game_state_id})>"
+
+class PregeneratedScene(CustomBase):
+    """An opening scene generated ahead of time by the scene pool (app/services/scene_pool.py)."""
+    __tablename__ = "pregenerated_scenes"
+    identity_id = Column(Integer, ForeignKey("identities.id"), nullable=True) # None: for characters without an identity
+    cultivation_stage = Column(String, nullable=False)
+    plot = Column(Text, nullable=False) # Names the character scene_pool.PLACEHOLDER_NAME, replaced when drawn
+    choices = Column(JSON, nullable=False) # [{"id": ..., "text": ...}]
+    duration_days = Column(Integer, nullable=False, default=1)
+    # The worker serving the scene, and when it last confirmed it is alive. Rows of a worker silent for
+    # SCENE_POOL_CLAIM_TTL_SECONDS are claimed by the others. Drawing a scene deletes its row, and only the
+    # draw whose DELETE removed it serves the scene.
+    owner = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_pregenerated_scenes_identity_id_stage_owner", "identity_id", "cultivation_stage", "owner"),)
+
+    def __repr__(self) -> str:
+        return f"<PregeneratedScene(id={getattr(self, 'id', None)}, identity_id={self.identity_id}, stage='{self.cultivation_stage}')>"
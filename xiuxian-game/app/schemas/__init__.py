@@ -1,5 +1,5 @@
 # app/schemas/__init__.py
-from .base_schemas import BaseRequest, BaseResponse
+from .base_schemas import BaseRequest, BaseResponse, CursorPagination, Page
 from .token_schemas import Token, TokenData
 from .user_schemas import User, UserCreate, UserUpdate, UserInDBBase
 from .character_schemas import (
@@ -8,21 +8,23 @@ from .character_schemas import (
     CharacterBase, CharacterCreate, CharacterUpdate, CharacterInDBBase, CharacterSimple, CharacterDetailed
 )
 from .game_schemas import (
-    GameStateBase, GameStateCreate, GameStateUpdate, GameStateInDB,
+    GameStateBase, GameStateCreate, GameStateUpdate, GameStateInDB, GameStateView,
     GameSaveBase, GameSaveCreate, GameSaveUpdate, GameSaveInDB,
     GameStartRequest, GameChoiceRequest, StoryChoice, StoryScene,
     GameLoadRequest # ADDED GameLoadRequest here
 )
+from .admin_schemas import KnowledgeBaseStatus, KnowledgeBaseReload
 
 __all__ = [
-    "BaseRequest", "BaseResponse",
+    "BaseRequest", "BaseResponse", "CursorPagination", "Page",
     "Token", "TokenData",
     "User", "UserCreate", "UserUpdate", "UserInDBBase",
     "IdentityBase", "IdentityCreate", "IdentityUpdate", "IdentityInDB",
     "CharacterAttributeBase", "CharacterAttributeCreate", "CharacterAttributeUpdate", "CharacterAttributeInDB",
     "CharacterBase", "CharacterCreate", "CharacterUpdate", "CharacterInDBBase", "CharacterSimple", "CharacterDetailed",
-    "GameStateBase", "GameStateCreate", "GameStateUpdate", "GameStateInDB",
+    "GameStateBase", "GameStateCreate", "GameStateUpdate", "GameStateInDB", "GameStateView",
     "GameSaveBase", "GameSaveCreate", "GameSaveUpdate", "GameSaveInDB",
     "GameStartRequest", "GameChoiceRequest", "StoryChoice", "StoryScene",
     "GameLoadRequest", # ADDED GameLoadRequest here
+    "KnowledgeBaseStatus", "KnowledgeBaseReload",
 ]
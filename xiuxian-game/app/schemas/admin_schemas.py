@@ -0,0 +1,21 @@
+# app/schemas/admin_schemas.py
+from pydantic import BaseModel
+from typing import Optional
+
+class KnowledgeBaseStatus(BaseModel):
+    version: Optional[str] = None # None until a knowledge base with entries has loaded
+    entries: int = 0
+    partitions: int = 0
+    directory: str
+
+class KnowledgeBaseReload(BaseModel):
+    version: str
+    entries: int
+    embedded: int # Entries sent to the embedder; unchanged ones reuse their vectors
+    files_added: int
+    files_changed: int
+    files_removed: int
+    files_unchanged: int
+    seconds: float
+    from_store: bool = False # Mapped from the shared index store instead of built by this worker
+    resumed: int = 0 # Entries whose vectors came from an interrupted load's embedding checkpoints
@@ -1,6 +1,6 @@
 # app/schemas/base_schemas.py
 from pydantic import BaseModel
-from typing import Optional, Any, Generic, TypeVar, List # Added List for PaginatedResponse example
+from typing import Optional, Any, Generic, TypeVar, List
 
 DataType = TypeVar('DataType')
 
@@ -12,9 +12,14 @@ class BaseResponse(BaseModel, Generic[DataType]):
     message: str = "Operation successful"
     data: Optional[DataType] = None
 
-# Example of a paginated response, can be added later if needed.
-# class PaginatedResponse(BaseResponse[DataType], Generic[DataType]):
-#     page: int
-#     page_size: int
-#     total_items: int
-#     items: List[DataType]
+class CursorPagination(BaseModel):
+    # The pagination block of api-specification.md's 分页响应格式, for keyset (cursor) paging:
+    # pages are addressed by an opaque cursor rather than a page number, so there is no total/pages.
+    size: int
+    has_next: bool
+    has_prev: bool
+    next_cursor: Optional[str] = None # Pass as ?cursor= to fetch the next page
+
+class Page(BaseModel, Generic[DataType]):
+    items: List[DataType]
+    pagination: CursorPagination
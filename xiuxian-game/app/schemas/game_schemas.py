@@ -22,6 +22,8 @@ class GameStateBase(BaseModel):
     story_history: List[Dict[str, Any]] = []
     game_data: Dict[str, Any] = {}
     current_date: Optional[str] = None # ADDED: e.g., "Day 1"
+    story_summary: Optional[str] = None # Condensed story_history[:summarized_events]
+    summarized_events: int = 0
 
 # --- GameStateCreate schema (Illustrative - ensure it exists and inherits from GameStateBase if needed) ---
 class GameStateCreate(GameStateBase):
@@ -44,6 +46,11 @@ class GameStateInDB(GameStateBase): # Inherits current_date from GameStateBase
     class Config:
         from_attributes = True
 
+# --- GameStateView: GameStateInDB as /game/state returns it, with only the latest events ---
+class GameStateView(GameStateInDB):
+    history_total: int # Events in the whole history; story_history holds the last few of them
+    history_cursor: Optional[str] = None # Pass to /game/history as `cursor` for the events before story_history
+
 # --- Other game-related schemas (GameSaveBase, GameSaveCreate, GameSaveInDB, GameStartRequest, GameChoiceRequest, GameLoadRequest) ---
 # These generally remain unchanged by this specific subtask, but ensure they are present as per previous steps.
 class GameSaveBase(BaseModel):
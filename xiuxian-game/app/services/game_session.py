@@ -0,0 +1,227 @@
+# app/services/game_session.py
+"""
+A player's game kept hot between turns.
+
+GameSession holds the Character and active GameState rows (detached from any
+DB session) together with their serialized forms, the dicts handed to plugins
+and the RAG system. A turn therefore neither reloads nor re-validates them.
+Plugins and the RAG system see only the latest EVENT_HISTORY_WINDOW story
+events (windowed_game_state), so their payloads don't grow with the game;
+older events reach the prompt through the rolling summary (summarize).
+make_choice applies the turn in memory only; persisting it is left to the
+write-behind cache in app.services.session_cache.
+"""
+import copy
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.core.config import settings
+from app.core.plugin_system import PluginManager
+from app.core.rag_system import RAGSystem
+from app.models.character_models import Character
+from app.models.game_models import GameState
+
+logger = logging.getLogger(__name__)
+
+
+def windowed_game_state(game_state_data: Dict[str, Any], size: int) -> Dict[str, Any]:
+    """
+    A shallow copy of a serialized game state with only the last `size` story events.
+    history_total records how many events the whole history has.
+    """
+    history = game_state_data.get("story_history") or []
+    view = dict(game_state_data)
+    view["story_history"] = history[-size:] if size > 0 else []
+    view["history_total"] = len(history)
+    return view
+
+
+class GameSession:
+    def __init__(self, character: Character, game_state: GameState):
+        self.character = character
+        self.game_state = game_state
+        self.character_id: int = character.id
+        self.user_id: int = character.user_id
+        self.character_data: Dict[str, Any] = schemas.CharacterDetailed.model_validate(character).model_dump()
+        self.game_state_data: Dict[str, Any] = schemas.GameStateInDB.model_validate(game_state).model_dump()
+
+        # version counts turns applied in memory; flushed_version is the row's version in the DB
+        self.version: int = game_state.version
+        self.flushed_version: int = game_state.version
+        self.last_access = time.monotonic()
+
+        self.turn_lock = threading.Lock() # Held for a whole turn, so one player's turns don't interleave
+        self.state_lock = threading.Lock() # Held briefly while the state is changed or snapshotted
+        self.flush_lock = threading.Lock() # One flush of this session in flight at a time
+        self.summary_lock = threading.Lock() # One summarization of this session in flight at a time
+
+    @classmethod
+    def load(cls, db: Session, character_id: int, user_id: int) -> Optional["GameSession"]:
+        """
+        Loads the character and its active game state and detaches them from db.
+        None if either is missing or the character is not owned by user_id.
+        """
+        character = crud.crud_character.get_character(db, character_id=character_id)
+        if not character or character.user_id != user_id:
+            return None
+        game_state = crud.crud_game.get_active_game_state_for_character(db, character_id=character.id)
+        if not game_state:
+            return None
+        session = cls(character, game_state) # Serializing loads the relationships before detaching
+        db.expunge(game_state)
+        db.expunge(character)
+        return session
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.flushed_version
+
+    def current_scene(self) -> Optional[schemas.StoryScene]:
+        """The scene the player is currently choosing from, rebuilt from the last story event."""
+        history = self.game_state_data.get("story_history") or []
+        if not history or not isinstance(history[-1], dict) or "plot" not in history[-1]:
+            return None
+        last_event = history[-1]
+        return schemas.StoryScene(
+            scene_id=last_event.get("scene_id", self.game_state_data.get("current_scene_id")),
+            plot=last_event["plot"],
+            choices=[schemas.StoryChoice(**c) for c in last_event.get("choices_presented", []) if isinstance(c, dict)],
+            duration_days=last_event.get("duration_applied_days"),
+        )
+
+    def find_choice(self, choice_id: str) -> Dict[str, Any]:
+        made_choice = {"id": choice_id, "text": f"Choice text for {choice_id} (not found in history)"}
+        history = self.game_state_data.get("story_history") or []
+        if history and isinstance(history[-1], dict) and isinstance(history[-1].get("choices_presented"), list):
+            found = next((c for c in history[-1]["choices_presented"] if isinstance(c, dict) and c.get("id") == choice_id), None)
+            if found:
+                return found
+            logger.warning("Choice ID '%s' not found in previous scene for char %s.", choice_id, self.character_id)
+        return made_choice
+
+    def history_window(self, size: int, before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int, int]:
+        """
+        Up to `size` story events ending just before index `before` (default: the latest), oldest first.
+        Returns the events, the index of the first of them and the length of the whole history.
+        """
+        with self.state_lock:
+            history = self.game_state_data.get("story_history") or []
+        total = len(history) # apply_story_event replaces the list rather than appending, so it can be read unlocked
+        end = total if before is None else max(0, min(before, total))
+        start = max(0, end - size)
+        return history[start:end], start, total
+
+    def _event_payload(self, **extra: Any) -> Dict[str, Any]:
+        # Plugins may mutate what they receive. Give them copies of the small dicts; the history
+        # window is a new list of shared events, which are never changed once appended.
+        game_state_view = windowed_game_state(self.game_state_data, settings.EVENT_HISTORY_WINDOW)
+        game_state_view["game_data"] = copy.deepcopy(self.game_state_data.get("game_data") or {})
+        return {"character": copy.deepcopy(self.character_data), "game_state": game_state_view, "messages": [], **extra}
+
+    def make_choice(
+        self,
+        choice_id: str,
+        rag_sys: RAGSystem,
+        plugin_mgr: PluginManager,
+        on_plot_delta: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[schemas.StoryScene, Dict[str, Any], List[str]]:
+        """
+        Plays one turn in memory: plugins (choice_made), story generation, state update, plugins (scene_generated).
+        Callers hold turn_lock and hand the session to the cache for flushing afterwards.
+        Returns the new scene, the choice that was taken and the plugin messages.
+        """
+        self.last_access = time.monotonic()
+        made_choice = self.find_choice(choice_id)
+        event_data = plugin_mgr.emit_event("choice_made", self._event_payload(choice=made_choice))
+
+        char_dict_for_rag = event_data.get("character", self.character_data)
+        gs_dict_for_rag = event_data.get("game_state", self.game_state_data)
+        scene = rag_sys.generate_story(game_state=gs_dict_for_rag, character=char_dict_for_rag, on_plot_delta=on_plot_delta)
+
+        duration = scene.duration_days if scene.duration_days is not None else 1
+        story_event = {
+            "scene_id": scene.scene_id,
+            "plot": scene.plot,
+            "choices_presented": [c.model_dump() for c in scene.choices],
+            "action_taken": made_choice,
+            "messages": event_data.get("messages", []),
+            "event_type": "choice_made",
+            "duration_applied_days": duration,
+            "date_before_event": self.game_state.current_date,
+        }
+        with self.state_lock:
+            crud.crud_game.apply_story_event(
+                self.game_state, story_event,
+                new_scene_id=scene.scene_id,
+                game_data_updates=event_data.get("game_state", {}).get("game_data"),
+                advance_days=duration,
+            )
+            story_event["date_after_event"] = self.game_state.current_date # Same dict as the one appended to the history
+            # Set here rather than by the column's onupdate, so the flushed row gets the time of the turn
+            self.game_state.updated_at = self.game_state_data["updated_at"] = datetime.utcnow()
+            self.version += 1
+            self._sync_game_state_data()
+
+        scene_event_data = plugin_mgr.emit_event("scene_generated", self._event_payload(scene=scene.model_dump()))
+        messages = [m for m in event_data.get("messages", []) + scene_event_data.get("messages", []) if isinstance(m, str)]
+        return scene, made_choice, messages
+
+    def _sync_game_state_data(self) -> None:
+        """Brings the serialized game state in line with the row after a turn, without re-validating the history."""
+        # apply_story_event assigns a new list, so sharing it with the row is safe
+        self.game_state_data["story_history"] = self.game_state.story_history
+        self.game_state_data["current_scene_id"] = self.game_state.current_scene_id
+        self.game_state_data["current_date"] = self.game_state.current_date
+        self.game_state_data["game_data"] = self.game_state.game_data
+
+    def summary_due(self) -> bool:
+        unsummarized = len(self.game_state.story_history or []) - (self.game_state.summarized_events or 0)
+        return unsummarized >= settings.STORY_SUMMARY_KEEP_RECENT + settings.STORY_SUMMARY_EVERY
+
+    def summarize(self, rag_sys: RAGSystem) -> bool:
+        """
+        Folds the unsummarized events older than the latest STORY_SUMMARY_KEEP_RECENT into the rolling
+        summary, if enough have built up (summary_due). Runs outside turn_lock: the LLM call holds no
+        lock, and the result is dropped if another summarization got there first.
+        Returns True if the summary changed; the caller then schedules a flush.
+        """
+        with self.state_lock:
+            if not self.summary_due():
+                return False
+            history = self.game_state.story_history
+            start = self.game_state.summarized_events or 0
+            # A game loaded far behind its summary catches up a few batches per call rather than in one huge prompt
+            end = min(len(history) - settings.STORY_SUMMARY_KEEP_RECENT, start + 4 * settings.STORY_SUMMARY_EVERY)
+            previous_summary = self.game_state.story_summary
+
+        summary = rag_sys.summarize_story(previous_summary, history[start:end])
+        if summary is None:
+            return False
+        with self.state_lock:
+            if (self.game_state.summarized_events or 0) != start:
+                return False
+            self.game_state.story_summary = self.game_state_data["story_summary"] = summary
+            self.game_state.summarized_events = self.game_state_data["summarized_events"] = end
+            self.version += 1
+        logger.debug("Summarized story events %d-%d for character %s.", start, end, self.character_id)
+        return True
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """The current in-memory version and the column values to write for it."""
+        with self.state_lock:
+            return self.version, {
+                "story_history": self.game_state.story_history,
+                "current_scene_id": self.game_state.current_scene_id,
+                "game_data": self.game_state.game_data,
+                "current_date": self.game_state.current_date,
+                "story_summary": self.game_state.story_summary,
+                "summarized_events": self.game_state.summarized_events,
+                "updated_at": self.game_state.updated_at,
+            }
+
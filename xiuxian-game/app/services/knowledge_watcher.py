@@ -0,0 +1,100 @@
+# app/services/knowledge_watcher.py
+"""
+Reloads the knowledge base when knowledge_base/ changes, in every worker.
+
+Each worker polls the directory every KB_WATCH_INTERVAL_SECONDS: one stat() per
+*.md file plus the trigger file. When anything changed it calls
+RAGSystem.load_knowledge_base on this thread, which embeds only new or changed
+entries and swaps the new index in; requests keep using the old index meanwhile.
+
+POST /api/v1/admin/knowledge-base/reindex reloads the worker that receives it
+and touches the trigger file (KB_REINDEX_TRIGGER in the knowledge-base
+directory), so the other workers' watchers reload on their next poll even if
+no file's size or mtime changed. A reload that finds every file unchanged keeps
+the current index. Workers that load the same files end up with the same index
+version (rag_index_version{version} counts them).
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.knowledge_loader import LoadResult
+from app.core.rag_system import RAGSystem
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseWatcher:
+    def __init__(self, interval: float, trigger_name: str):
+        self.interval = interval
+        self.trigger_name = trigger_name
+        self._rag_system: Optional[RAGSystem] = None
+        self._signature: Optional[Tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, rag_system: RAGSystem) -> None:
+        """Starts polling rag_system's knowledge-base directory. A no-op if the interval is 0."""
+        self._rag_system = rag_system
+        self._signature = self._scan()
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def reindex(self) -> Optional[LoadResult]:
+        """Reloads this worker now and tells the other workers to reload. None if loading failed."""
+        if self._rag_system is None:
+            return None
+        signature = self._scan()
+        result = self._rag_system.load_knowledge_base()
+        if result is not None:
+            trigger = self._rag_system.kb_dir / self.trigger_name
+            try:
+                trigger.touch()
+            except OSError as e:
+                logger.warning("Could not touch the reindex trigger file: %s. Other workers reload on their next file change.", e)
+            # The touch itself is no change for this worker's next poll; a file edited during the load still is
+            touched = self._scan()
+            if touched is not None and self._without(touched, trigger) == self._without(signature, trigger):
+                signature = touched
+            self._signature = signature
+        return result
+
+    def _scan(self) -> Optional[Tuple]:
+        kb_dir: Path = self._rag_system.kb_dir
+        try:
+            paths = sorted(kb_dir.glob("**/*.md")) + [kb_dir / self.trigger_name]
+            return tuple((str(path), stat.st_mtime_ns, stat.st_size) for path, stat in ((p, p.stat()) for p in paths if p.exists()))
+        except OSError as e:
+            # A file removed between glob and stat; the next poll sees a settled directory
+            logger.debug("Knowledge-base scan failed: %s", e)
+            return None
+
+    @staticmethod
+    def _without(signature: Optional[Tuple], path: Path) -> Optional[Tuple]:
+        return None if signature is None else tuple(entry for entry in signature if entry[0] != str(path))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            signature = self._scan()
+            if signature is None or signature == self._signature:
+                continue
+            logger.info("Knowledge base changed; reloading.")
+            result = self._rag_system.load_knowledge_base()
+            if result is not None:
+                self._signature = signature # On failure, the next poll retries
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+knowledge_watcher = KnowledgeBaseWatcher(
+    interval=settings.KB_WATCH_INTERVAL_SECONDS,
+    trigger_name=settings.KB_REINDEX_TRIGGER,
+)
@@ -0,0 +1,296 @@
+# app/services/scene_pool.py
+"""
+Pre-generated opening scenes, so /game/start needs no LLM call.
+
+A new game's opening prompt depends on little besides the character's identity
+and cultivation stage, so scenes for each (identity, stage) pair are generated
+ahead of time on a background thread and stored in the pregenerated_scenes
+table. They are generated for a stand-in character named PLACEHOLDER_NAME,
+which is replaced by the player's character name when a scene is drawn.
+
+  draw      /game/start takes the next scene for the character's pair from
+            memory and deletes its row: one DELETE statement, no LLM call. The
+            scene is served only if that statement deleted the row, so a scene
+            another worker has taken over and served is skipped. A pair that
+            drops below SCENE_POOL_LOW_WATERMARK wakes the thread to refill it;
+            on a miss the endpoint generates the scene as before.
+  fallback  RAGSystem.generate_story serves a pooled scene for the character's
+            pair in place of the default error scene (RAGSystem.fallback_scenes).
+            The scene isn't used up, so fallbacks cycle through the pair's scenes.
+
+The pool is off unless SCENE_POOL_ENABLED is set. Every worker then runs its
+own pool and keeps up to SCENE_POOL_TARGET scenes per pair, for every identity
+in the database plus characters without one, at each SCENE_POOL_STAGES stage,
+so a deployment holds (and pays to generate) workers x pairs x target scenes.
+Rows carry the worker that holds them (owner). A worker refills a pair by
+first claiming unowned rows, then rows whose owner hasn't checked in
+(claimed_at) for SCENE_POOL_CLAIM_TTL_SECONDS, such as those of a worker that
+crashed, and only then generates new ones. Scenes generated before a restart are used after it,
+and at shutdown a worker releases the rows it still holds.
+
+Pool generations run through the scheduler's background lane and are never
+hedged, so they don't compete with players' generations for the hedge budget.
+A generation that fails ends that pair's refill until the next pass rather than
+retrying against a struggling backend.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.rag_system import RAGSystem
+from app.db.session import engine
+from app.models.character_models import Identity
+from app.models.game_models import PregeneratedScene
+from app.schemas.character_schemas import CharacterAttributeBase
+from app.schemas.game_schemas import StoryChoice, StoryScene
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_NAME = "无名氏" # The stand-in character's name in pooled scenes
+# A new game's state as the RAG system sees it (crud_game.create_game_state, through windowed_game_state)
+OPENING_STATE: Dict[str, Any] = {"current_scene_id": "start", "current_date": "Day 1", "story_history": [], "history_total": 0, "game_data": {}}
+
+_scenes = PregeneratedScene.__table__
+_identities = Identity.__table__
+
+Key = Tuple[Optional[int], str] # (identity_id, cultivation_stage)
+
+
+class ScenePool:
+    def __init__(self, enabled: bool, stages: List[str], target: int, low_watermark: int, refill_interval: float, claim_ttl: float):
+        self.enabled = enabled
+        self.stages = list(stages)
+        self.target = target
+        self.low_watermark = low_watermark
+        self.refill_interval = refill_interval
+        self.claim_ttl = claim_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._scenes: Dict[Key, Deque[Tuple[int, StoryScene]]] = {} # Scenes this worker holds, by pair, oldest first
+        self._wanted: Set[Key] = set() # Pairs to refill now
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._rag_system: Optional[RAGSystem] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._heartbeat_at = 0.0
+
+    def start(self, rag_system: RAGSystem) -> None:
+        """Starts filling the pool and serves fallbacks from it. A no-op if disabled or without an LLM."""
+        if not self.enabled or rag_system.llm is None or self._thread is not None:
+            return
+        self._rag_system = rag_system
+        self._stopping = False
+        rag_system.fallback_scenes = self.fallback
+        self._thread = threading.Thread(target=self._run, name="scene-pool", daemon=True)
+        self._thread.start()
+
+    # --- Serving ---
+
+    @property
+    def serving(self) -> bool:
+        """Whether the pool is started; when it isn't, there is nothing to draw and no miss to count."""
+        return self._thread is not None
+
+    def draw(self, character: Dict[str, Any]) -> Optional[StoryScene]:
+        """An opening scene for the serialized character, used up; None if the pool has none for its identity and stage."""
+        key = self._key(character)
+        while True:
+            with self._lock:
+                scenes = self._scenes.get(key)
+                if not scenes:
+                    if self._thread is not None and key[1] in self.stages:
+                        self._wanted.add(key) # E.g. an identity created since the last pass
+                        self._wakeup.notify()
+                    metrics.SCENE_POOL_DRAWS[("opening", "miss")].inc()
+                    return None
+                row_id, scene = scenes.popleft()
+                if len(scenes) < self.low_watermark:
+                    self._wanted.add(key)
+                    self._wakeup.notify()
+            metrics.SCENE_POOL_SIZE.dec()
+            # The row is the claim: of the workers holding a scene (one whose claim expired and the one that took it
+            # over), only the one whose DELETE removes the row serves it
+            with engine.begin() as conn:
+                taken = conn.execute(delete(_scenes).where(_scenes.c.id == row_id)).rowcount == 1
+            if taken:
+                metrics.SCENE_POOL_DRAWS[("opening", "hit")].inc()
+                return self._personalize(scene, character)
+
+    def fallback(self, character: Dict[str, Any]) -> Optional[StoryScene]:
+        """A pooled scene for the serialized character, left in the pool; None if there is none for its identity and stage."""
+        with self._lock:
+            scenes = self._scenes.get(self._key(character))
+            if not scenes:
+                metrics.SCENE_POOL_DRAWS[("fallback", "miss")].inc()
+                return None
+            scene = scenes[0][1]
+            scenes.rotate(-1) # The next fallback gets another scene
+        metrics.SCENE_POOL_DRAWS[("fallback", "hit")].inc()
+        return self._personalize(scene, character)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(scenes) for scenes in self._scenes.values())
+
+    @staticmethod
+    def _key(character: Dict[str, Any]) -> Key:
+        return character.get("identity_id"), str(character.get("cultivation_stage") or "")
+
+    @staticmethod
+    def _personalize(scene: StoryScene, character: Dict[str, Any]) -> StoryScene:
+        name = str(character.get("name") or "")
+        if not name:
+            return scene
+        return StoryScene(
+            scene_id=scene.scene_id,
+            plot=scene.plot.replace(PLACEHOLDER_NAME, name),
+            choices=[StoryChoice(id=choice.id, text=choice.text.replace(PLACEHOLDER_NAME, name)) for choice in scene.choices],
+            duration_days=scene.duration_days,
+        )
+
+    # --- Refilling ---
+
+    def _run(self) -> None:
+        next_pass = 0.0 # Every pair at startup
+        while True:
+            with self._lock:
+                while not self._stopping and not self._wanted and time.monotonic() < next_pass:
+                    self._wakeup.wait(next_pass - time.monotonic())
+                if self._stopping:
+                    return
+                wanted, self._wanted = self._wanted, set()
+            try:
+                self._heartbeat()
+                if time.monotonic() >= next_pass:
+                    wanted |= set(self._pairs())
+                    next_pass = time.monotonic() + self.refill_interval
+                for key in wanted:
+                    if self._stopping:
+                        return
+                    self._refill(key)
+            except Exception as e:
+                logger.exception("Scene pool refill failed: %s", e)
+                next_pass = time.monotonic() + self.refill_interval
+
+    def _pairs(self) -> List[Key]:
+        with engine.connect() as conn:
+            identity_ids = [None] + list(conn.execute(select(_identities.c.id).order_by(_identities.c.id)).scalars())
+        return [(identity_id, stage) for identity_id in identity_ids for stage in self.stages]
+
+    def _refill(self, key: Key) -> None:
+        """Brings the pair up to SCENE_POOL_TARGET scenes: unowned and expired rows first, then new generations."""
+        with self._lock:
+            missing = self.target - len(self._scenes.get(key) or ())
+        if missing <= 0:
+            return
+        missing -= self._claim(key, missing)
+        if missing <= 0:
+            return
+        character = self._stand_in(key)
+        if character is None: # The identity was deleted
+            return
+        while missing > 0 and not self._stopping:
+            self._heartbeat()
+            scene = self._rag_system.generate_story(dict(OPENING_STATE), character, lane="background")
+            if self._stopping:
+                return
+            if scene.scene_id == "error_scene":
+                metrics.SCENE_POOL_GENERATIONS["failed"].inc()
+                return # Try again on the next pass
+            metrics.SCENE_POOL_GENERATIONS["ok"].inc()
+            with engine.begin() as conn:
+                row_id = conn.execute(insert(_scenes).values(
+                    identity_id=key[0], cultivation_stage=key[1], plot=scene.plot,
+                    choices=[choice.model_dump() for choice in scene.choices], duration_days=scene.duration_days or 1,
+                    owner=self.owner, claimed_at=datetime.utcnow(), created_at=datetime.utcnow(),
+                )).inserted_primary_key[0]
+            self._add(key, [(row_id, scene)])
+            missing -= 1
+
+    def _claim(self, key: Key, limit: int) -> int:
+        """Takes over up to `limit` stored scenes of the pair that no live worker holds. Returns how many."""
+        now = datetime.utcnow()
+        claimable = or_(_scenes.c.owner.is_(None), _scenes.c.claimed_at < now - timedelta(seconds=self.claim_ttl))
+        identity = _scenes.c.identity_id.is_(None) if key[0] is None else _scenes.c.identity_id == key[0]
+        of_pair = and_(identity, _scenes.c.cultivation_stage == key[1])
+        with engine.begin() as conn:
+            ids = list(conn.execute(select(_scenes.c.id).where(of_pair, claimable).order_by(_scenes.c.id).limit(limit)).scalars())
+            if not ids:
+                return 0
+            # Rows another worker claimed since the select are skipped: the update only takes still-claimable ones
+            conn.execute(update(_scenes).where(_scenes.c.id.in_(ids), claimable).values(owner=self.owner, claimed_at=now))
+            rows = conn.execute(
+                select(_scenes.c.id, _scenes.c.plot, _scenes.c.choices, _scenes.c.duration_days)
+                .where(_scenes.c.id.in_(ids), _scenes.c.owner == self.owner).order_by(_scenes.c.id)
+            ).all()
+        self._add(key, [(row.id, StoryScene(plot=row.plot, choices=[StoryChoice(**choice) for choice in row.choices],
+                                            duration_days=row.duration_days)) for row in rows])
+        return len(rows)
+
+    def _stand_in(self, key: Key) -> Optional[Dict[str, Any]]:
+        """The serialized new character the pair's scenes are generated for, as /game/start serializes one."""
+        identity = None
+        if key[0] is not None:
+            with engine.connect() as conn:
+                row = conn.execute(select(_identities.c.id, _identities.c.name, _identities.c.description, _identities.c.starting_benefits)
+                                   .where(_identities.c.id == key[0])).first()
+            if row is None:
+                return None
+            identity = dict(row._mapping)
+        return {
+            "name": PLACEHOLDER_NAME, "identity_id": key[0], "level": 1, "cultivation_stage": key[1], "experience": 0,
+            "identity": identity, "attributes": CharacterAttributeBase().model_dump(),
+        }
+
+    def _add(self, key: Key, scenes: List[Tuple[int, StoryScene]]) -> None:
+        with self._lock:
+            self._scenes.setdefault(key, deque()).extend(scenes)
+        metrics.SCENE_POOL_SIZE.inc(len(scenes))
+
+    def _heartbeat(self) -> None:
+        """Refreshes claimed_at on this worker's rows often enough that no other worker takes them over."""
+        if time.monotonic() - self._heartbeat_at < self.claim_ttl / 3:
+            return
+        with engine.begin() as conn:
+            conn.execute(update(_scenes).where(_scenes.c.owner == self.owner).values(claimed_at=datetime.utcnow()))
+        self._heartbeat_at = time.monotonic()
+
+    def shutdown(self) -> None:
+        """Stops refilling and releases the scenes this worker holds to the other workers."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is None:
+            return
+        self._thread.join(timeout=10) # A generation in progress may outlast this; its scene is dropped
+        self._thread = None
+        with self._lock:
+            held = sum(len(scenes) for scenes in self._scenes.values())
+            self._scenes.clear()
+        try:
+            with engine.begin() as conn:
+                conn.execute(update(_scenes).where(_scenes.c.owner == self.owner).values(owner=None, claimed_at=None))
+        except Exception as e:
+            logger.warning("Could not release pooled scenes: %s. Other workers claim them after SCENE_POOL_CLAIM_TTL_SECONDS.", e)
+        metrics.SCENE_POOL_SIZE.dec(held)
+
+
+scene_pool = ScenePool(
+    enabled=settings.SCENE_POOL_ENABLED,
+    stages=settings.SCENE_POOL_STAGES,
+    target=settings.SCENE_POOL_TARGET,
+    low_watermark=settings.SCENE_POOL_LOW_WATERMARK,
+    refill_interval=settings.SCENE_POOL_REFILL_INTERVAL_SECONDS,
+    claim_ttl=settings.SCENE_POOL_CLAIM_TTL_SECONDS,
+)
@@ -0,0 +1,306 @@
+# app/services/session_cache.py
+"""
+In-process cache of active GameSessions with write-behind persistence.
+
+Turns are applied to the cached session in memory (GameSession.make_choice)
+and the request returns without touching the database. A background thread
+writes each dirty session's latest state within WRITE_BEHIND_DELAY_SECONDS of
+its first unflushed turn.
+
+Ordering and consistency:
+  * Every flush writes a full snapshot with a compare-and-set on the row's
+    version column (UPDATE ... WHERE id = :id AND version = :flushed), and
+    flushes of one session never overlap. A newer state is never overwritten
+    by an older one, and a crash loses at most the unflushed delay window.
+  * Endpoints that read game state from the database flush the character's
+    session first (flush), and endpoints that replace the active game state
+    drop it (discard). Shutdown flushes everything.
+  * Sessions with a turn in progress (turn_lock held) are never evicted. A
+    turn applied to a session that was dropped meanwhile (by discard or a
+    version check) is still flushed: the dirty set holds the sessions
+    themselves, not character ids, and the compare-and-set decides whether
+    the turn still applies.
+  * With several workers, SESSION_VERSION_CHECK compares the cached game
+    state id and version with the active row on each lookup (one two-column
+    query) and reloads if another worker wrote it. Behind sticky routing (every character always
+    on the same worker) turn it off and a cached turn issues no query at all.
+    A flush that still loses the compare-and-set evicts the session: the
+    database wins.
+
+Rolling story summaries are brought up to date the same way: after a turn,
+summarize_behind runs GameSession.summarize on a small thread pool and marks
+the session dirty when the summary changes, so the extra LLM call every
+STORY_SUMMARY_EVERY turns never delays a response.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.rag_system import RAGSystem
+from app.db.session import engine
+from app.models.game_models import GameState
+from app.services.game_session import GameSession
+
+logger = logging.getLogger(__name__)
+
+_game_states = GameState.__table__
+
+
+class SessionCache:
+    def __init__(self, max_sessions: int, idle_seconds: float, flush_delay: float, version_check: bool, summary_workers: int = 2):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.flush_delay = flush_delay
+        self.version_check = version_check
+
+        self._sessions: "OrderedDict[int, GameSession]" = OrderedDict() # character_id -> session, LRU order
+        # Session -> monotonic time of its first unflushed turn. Keyed by the session itself, not the character,
+        # so a turn applied to a session evicted meanwhile (its turn started before) is still written
+        self._dirty: Dict[GameSession, float] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._hits, self._misses = metrics.cache_counters("game_session")
+        self._summary_executor = ThreadPoolExecutor(max_workers=summary_workers, thread_name_prefix="story-summary")
+
+    # --- Lookup ---
+
+    def peek(self, db: Session, character_id: int, user_id: int) -> Optional[GameSession]:
+        """The cached session for the character if there is a current one owned by user_id. Never loads."""
+        with self._lock:
+            session = self._sessions.get(character_id)
+            if session is not None:
+                self._sessions.move_to_end(character_id)
+        if session is None:
+            return None
+
+        if self.version_check:
+            current = self._is_current(db, session)
+            db.commit() # Don't hold the pooled connection for the rest of the turn
+            if not current:
+                self.discard(character_id, flush=False)
+                return None
+
+        self._hits.inc()
+        if session.user_id != user_id:
+            return None
+        session.last_access = time.monotonic()
+        return session
+
+    def get(self, db: Session, character_id: int, user_id: int) -> Optional[GameSession]:
+        """The cached session for the character, loading it on a miss. None if not found or not owned by user_id."""
+        session = self.peek(db, character_id, user_id)
+        if session is not None:
+            return session
+
+        self._misses.inc()
+        session = GameSession.load(db, character_id=character_id, user_id=user_id)
+        if session is None:
+            return None
+        db.commit() # End the read transaction; the rows are detached now
+        with self._lock:
+            existing = self._sessions.get(character_id)
+            if existing is not None: # Another request loaded it meanwhile; keep theirs
+                return existing if existing.user_id == user_id else None
+            self._sessions[character_id] = session
+            evicted = self._pop_over_capacity()
+        for old in evicted:
+            self._flush_session(old)
+        return session
+
+    def _is_current(self, db: Session, session: GameSession) -> bool:
+        # Same ordering as get_active_game_state_for_character, so a game started or loaded on
+        # another worker (a different active row) is noticed too
+        with session.flush_lock: # A flush in flight has written the row but not yet recorded its version
+            row = (
+                db.query(GameState.id, GameState.version)
+                .filter(GameState.character_id == session.character_id)
+                .order_by(GameState.updated_at.desc())
+                .first()
+            )
+            current = row is not None and tuple(row) == (session.game_state.id, session.flushed_version)
+        if not current:
+            if session.dirty:
+                logger.error("Game state %s was written by another worker; dropping %d unflushed turn(s) for character %s.",
+                             session.game_state.id, session.version - session.flushed_version, session.character_id)
+            else:
+                logger.info("Active game state for character %s changed in the database; reloading.", session.character_id)
+        return current
+
+    def _pop_over_capacity(self):
+        """Least recently used sessions over max_sessions, skipping any with a turn in progress. Called with _lock held."""
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return []
+        evicted = []
+        for cid, old in list(self._sessions.items()):
+            if len(evicted) == excess:
+                break
+            if old.turn_lock.locked():
+                continue
+            del self._sessions[cid]
+            self._dirty.pop(old, None) # Flushed by the caller
+            evicted.append(old)
+        return evicted
+
+    # --- Writes ---
+
+    def mark_dirty(self, session: GameSession) -> None:
+        """Schedules a flush of the session within flush_delay seconds, whether or not it is still cached."""
+        with self._lock:
+            if session not in self._dirty:
+                self._dirty[session] = time.monotonic()
+                self._wakeup.notify()
+        if self._thread is None:
+            self._start()
+
+    def flush(self, character_id: int) -> None:
+        """Writes the character's session now, if it has unflushed turns. For read-after-write endpoints."""
+        with self._lock:
+            session = self._sessions.get(character_id)
+            if session is not None:
+                self._dirty.pop(session, None)
+        if session is not None:
+            self._flush_session(session)
+
+    def discard(self, character_id: int, flush: bool = True) -> None:
+        """Drops the character's session, flushing it first unless flush=False."""
+        with self._lock:
+            session = self._sessions.pop(character_id, None)
+            if session is not None:
+                self._dirty.pop(session, None)
+        if session is not None and flush:
+            self._flush_session(session)
+
+    def flush_all(self) -> None:
+        with self._lock:
+            sessions = list(self._dirty)
+            self._dirty.clear()
+        for session in sessions:
+            self._flush_session(session)
+
+    def _flush_session(self, session: GameSession) -> bool:
+        """Writes the session's latest snapshot. Returns False if it had to be retried or evicted."""
+        with session.flush_lock:
+            if not session.dirty:
+                return True
+            version, values = session.snapshot()
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    result = conn.execute(
+                        update(_game_states)
+                        .where(_game_states.c.id == session.game_state.id, _game_states.c.version == session.flushed_version)
+                        .values(version=version, **values)
+                    )
+            except Exception as e:
+                logger.exception("Write-behind flush of character %s failed: %s", session.character_id, e)
+                metrics.WRITE_BEHIND_FLUSHES["error"].inc()
+                self._reschedule(session)
+                return False
+            metrics.WRITE_BEHIND_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+            if result.rowcount != 1:
+                metrics.WRITE_BEHIND_FLUSHES["conflict"].inc()
+                logger.error("Write-behind conflict on game state %s (expected version %s); evicting character %s.",
+                             session.game_state.id, session.flushed_version, session.character_id)
+                with self._lock:
+                    if self._sessions.get(session.character_id) is session:
+                        del self._sessions[session.character_id]
+                return False
+
+            metrics.WRITE_BEHIND_FLUSHES["ok"].inc()
+            session.flushed_version = version
+            session.game_state.version = version
+        if session.dirty: # Another turn landed while writing
+            self._reschedule(session)
+        return True
+
+    def _reschedule(self, session: GameSession) -> None:
+        with self._lock:
+            self._dirty.setdefault(session, time.monotonic())
+
+    # --- Rolling summary ---
+
+    def summarize_behind(self, session: GameSession, rag_sys: RAGSystem) -> None:
+        """Brings the session's rolling story summary up to date in the background, if it is due."""
+        if self._stopping or not session.summary_due():
+            return
+        if not session.summary_lock.acquire(blocking=False): # Already being summarized
+            return
+        try:
+            self._summary_executor.submit(self._summarize, session, rag_sys)
+        except RuntimeError: # Shutting down
+            session.summary_lock.release()
+
+    def _summarize(self, session: GameSession, rag_sys: RAGSystem) -> None:
+        try:
+            while session.summarize(rag_sys):
+                self.mark_dirty(session)
+        except Exception as e:
+            logger.exception("Story summarization of character %s failed: %s", session.character_id, e)
+        finally:
+            session.summary_lock.release()
+
+    # --- Background flusher ---
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                sessions = [session for session, since in self._dirty.items() if now - since >= self.flush_delay]
+                for session in sessions:
+                    del self._dirty[session]
+                if not sessions:
+                    next_due = min(self._dirty.values(), default=now + self.flush_delay) + self.flush_delay
+                    self._wakeup.wait(timeout=max(0.01, min(next_due - now, self.flush_delay)))
+                    idle = self._pop_idle()
+                else:
+                    idle = []
+            for session in sessions:
+                self._flush_session(session)
+            for session in idle:
+                self._flush_session(session)
+
+    def _pop_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [cid for cid, s in self._sessions.items()
+                if s.last_access < cutoff and s not in self._dirty and not s.turn_lock.locked()]
+        return [self._sessions.pop(cid) for cid in idle]
+
+    def shutdown(self) -> None:
+        """Stops the flusher and summarizers and writes every unflushed turn and summary."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._summary_executor.shutdown(wait=True, cancel_futures=True)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush_all()
+
+
+session_cache = SessionCache(
+    max_sessions=settings.SESSION_CACHE_MAX_SESSIONS,
+    idle_seconds=settings.SESSION_CACHE_IDLE_SECONDS,
+    flush_delay=settings.WRITE_BEHIND_DELAY_SECONDS,
+    version_check=settings.SESSION_VERSION_CHECK,
+    summary_workers=settings.STORY_SUMMARY_WORKERS,
+)
@@ -0,0 +1,54 @@
+# app/utils/etag.py
+"""
+ETags and conditional GETs (If-None-Match -> 304 Not Modified).
+
+ETags are built from cheap version data, never from the body, so a matching
+If-None-Match is answered before anything large is loaded or serialized:
+
+  * a game state: its id and version column (bumped by every ORM update of the
+    row and by every write-behind turn; see GameState.version)
+  * a list of saves: the ids on the page. Saves are never edited, so the ids
+    change whenever the page does. The ids come from the listing's own
+    column-only query, so a 304 skips serialization and the body, not a query.
+"""
+import zlib
+from typing import Any, Iterable, Optional
+
+from fastapi import Response
+
+# Responses carry an ETag and ask clients to revalidate rather than reuse them unchecked
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def rows_etag(kind: str, ids: Iterable[int]) -> str:
+    """ETag for a page of immutable rows, from their ids in order."""
+    ids = list(ids)
+    return make_etag(kind, len(ids), format(zlib.crc32(",".join(map(str, ids)).encode()), "08x"))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (RFC 9110 13.1.2), which is what If-None-Match uses."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
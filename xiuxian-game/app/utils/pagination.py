@@ -0,0 +1,56 @@
+# app/utils/pagination.py
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the sort key of the last item on a page (e.g. (created_at, id)),
+JSON-encoded and base64url'd. The next page is fetched with
+"WHERE (sort key) < cursor ORDER BY sort key LIMIT size + 1", which costs the
+same however deep the client pages, unlike OFFSET. The extra row tells us
+whether there is a next page.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from app.schemas.base_schemas import CursorPagination
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> Tuple[Any, ...]:
+    """Decodes a cursor whose key has the given value types. Raises ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    key = []
+    for value, value_type in zip(values, types):
+        if value_type is datetime and isinstance(value, str):
+            key.append(datetime.fromisoformat(value))
+        elif value_type is int and isinstance(value, int) and not isinstance(value, bool):
+            key.append(value)
+        else:
+            raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def keyset_page(rows: List[Any], size: int, cursor: Optional[str], sort_key: Callable[[Any], Sequence[Any]]) -> Tuple[List[Any], CursorPagination]:
+    """
+    Splits rows fetched with LIMIT size + 1 into the page and its pagination block.
+    sort_key returns the row's key in the same order the query sorts and filters by.
+    """
+    has_next = len(rows) > size
+    items = rows[:size]
+    return items, CursorPagination(
+        size=size,
+        has_next=has_next,
+        has_prev=cursor is not None,
+        next_cursor=encode_cursor(sort_key(items[-1])) if has_next else None,
+    )
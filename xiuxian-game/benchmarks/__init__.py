@@ -0,0 +1 @@
+# This file makes benchmarks a package, so the scripts can be run with `python -m benchmarks.<name>`.
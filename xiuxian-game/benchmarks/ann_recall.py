@@ -0,0 +1,159 @@
+# benchmarks/ann_recall.py
+"""
+Recall and latency of each RAG_INDEX_TYPE against the exact flat index.
+
+Embeds a synthetic corpus (the rag_micro fixture, --scale copies of
+knowledge_base/) and indexes all of it as one partition, the way a large
+partition is indexed at load time (build_partition_index) and searched
+(search_partition_index, which re-ranks IVF-PQ candidates), once per index type.
+Queries are the descriptions of randomly chosen entries, without their names.
+For every index type and search setting (IVF nprobe, HNSW efSearch, IVF-PQ re-ranking
+depth RAG_PQ_RERANK) it reports:
+
+  build s   time to train and fill the index
+  MB        serialized index size (what the shared store maps)
+  recall    share of the k results that are among the exact k nearest. A result tied
+            with the exact k-th distance counts too, since the synthetic copies of an
+            entry are near-duplicates
+  p50/p95   single-query search latency in microseconds
+
+Embeddings come from the configured backend: the hashing stub by default, whose
+geometry is not a real model's, so re-run with real embeddings before settling
+on a setting for a deployment.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.ann_recall
+    python -m benchmarks.ann_recall --scale 1000 --queries 500
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile
+from benchmarks.rag_micro import build_synthetic_corpus
+from app.core.config import settings
+from app.core.knowledge_index import build_partition_index, configure_search, search_partition_index
+from app.core.rag_system import RAGSystem
+
+# (RAG_INDEX_TYPE, search settings to sweep)
+SWEEPS = [
+    ("flat", [{}]),
+    ("ivf_flat", [{"nprobe": n} for n in (1, 4, 16, 64)]),
+    ("ivf_pq", [{"nprobe": n, "rerank": r} for n, r in ((4, 4), (16, 4), (64, 4), (16, 16))]),
+    ("hnsw", [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+]
+
+
+def make_queries(rag: RAGSystem, count: int, seed: int) -> np.ndarray:
+    """Embeddings of the descriptions ("名称: 描述" without the name) of `count` random entries."""
+    kb = rag.knowledge_base
+    rng = random.Random(seed)
+    texts = []
+    for entry_id in rng.sample(range(len(kb)), min(count, len(kb))):
+        text = kb.texts[entry_id]
+        texts.append(text.split(":", 1)[-1].split("：", 1)[-1].strip() or text)
+    return np.asarray([rag.embeddings.embed_query(text) for text in texts], dtype=np.float32)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=100, help="synthetic corpus multiplier")
+    parser.add_argument("--queries", type=int, default=200, help="queries per setting")
+    parser.add_argument("--k", type=int, default=settings.RAG_CANDIDATES, help="results per query (default RAG_CANDIDATES)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/ann_recall_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # RAGSystem loads the relative knowledge_base/ directory on construction
+    settings.KB_INDEX_STORE = False # Only the vectors are needed; don't write a store for the throwaway corpus
+    rag = RAGSystem()
+    with tempfile.TemporaryDirectory(prefix=f"xiuxian-kb-{args.scale}x-") as tmp_dir:
+        build_synthetic_corpus(Path(tmp_dir), args.scale)
+        rag.load_knowledge_base(Path(tmp_dir))
+        vectors = np.ascontiguousarray(rag.knowledge_base.vectors, dtype=np.float32)
+        queries = make_queries(rag, args.queries, args.seed)
+
+    squared_norms = np.einsum("ij,ij->i", vectors, vectors)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    exact_distances, _ = exact.search(queries, args.k)
+    kth = exact_distances[:, -1:] * (1 + 1e-5) + 1e-6 # Results this close count as found
+
+    rows: List[Dict[str, Any]] = []
+    original_type, original_rerank = settings.RAG_INDEX_TYPE, settings.RAG_PQ_RERANK
+    for index_type, sweep in SWEEPS:
+        settings.RAG_INDEX_TYPE = index_type
+        started = time.perf_counter()
+        index = build_partition_index(vectors)
+        build_seconds = time.perf_counter() - started
+        size_mb = len(faiss.serialize_index(index)) / 2 ** 20
+        for search_settings in sweep:
+            settings.RAG_PQ_RERANK = search_settings.get("rerank", original_rerank)
+            configure_search(index, nprobe=search_settings.get("nprobe"), ef_search=search_settings.get("ef_search"))
+            samples: List[float] = []
+            found_ids = np.empty((len(queries), args.k), dtype=np.int64)
+            for row, query in enumerate(queries):
+                start = time.perf_counter()
+                _, ids = search_partition_index(index, vectors, squared_norms, query[None, :], args.k)
+                samples.append((time.perf_counter() - start) * 1e6)
+                found_ids[row] = -1
+                found_ids[row, :len(ids)] = ids
+            # Exact distances of what was returned, so near-duplicate ties count as hits
+            valid = found_ids >= 0
+            true_distances = np.where(valid, ((vectors[np.maximum(found_ids, 0)] - queries[:, None, :]) ** 2).sum(axis=2), np.inf)
+            recall = float(((true_distances <= kth) & valid).sum() / found_ids.size)
+            samples.sort()
+            rows.append({
+                "index_type": index_type,
+                "search": search_settings,
+                "build_seconds": round(build_seconds, 3),
+                "size_mb": round(size_mb, 2),
+                "recall": round(recall, 4),
+                "p50_us": round(percentile(samples, 50), 1),
+                "p95_us": round(percentile(samples, 95), 1),
+            })
+    settings.RAG_INDEX_TYPE, settings.RAG_PQ_RERANK = original_type, original_rerank
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "ann_recall",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "scale": args.scale,
+            "entries": int(vectors.shape[0]),
+            "dimension": int(vectors.shape[1]),
+            "queries": int(len(queries)),
+            "k": args.k,
+        },
+        "results": rows,
+    }
+
+    print(f"{vectors.shape[0]} entries x {vectors.shape[1]} dimensions, {len(queries)} queries, recall@{args.k}\n")
+    print(f"{'index':<10}{'search':<20}{'build s':>9}{'MB':>8}{'recall':>8}{'p50 us':>10}{'p95 us':>10}")
+    for row in rows:
+        search = ",".join(f"{key}={value}" for key, value in row["search"].items()) or "exact"
+        print(f"{row['index_type']:<10}{search:<20}{row['build_seconds']:>9.2f}{row['size_mb']:>8.1f}{row['recall']:>8.3f}"
+              f"{row['p50_us']:>10.1f}{row['p95_us']:>10.1f}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"ann_recall_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
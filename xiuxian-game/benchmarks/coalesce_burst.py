@@ -0,0 +1,164 @@
+# benchmarks/coalesce_burst.py
+"""
+A burst of concurrent story generations with identical inputs, with and without coalescing.
+
+--players threads call RAGSystem.generate_story at the same moment, as a guild
+starting the same event would. Two bursts:
+
+  identical  every player has the same character and game state
+  names      the players differ only in their character's name, which only
+             STORY_COALESCE_ACROSS_NAMES lets them share
+
+Each burst runs with coalescing off (STORY_COALESCE=false), on, and on across
+names. The stub LLM's latency is --latency-ms per call. With --stream every
+player streams its plot the way the WebSocket channel does, and the benchmark
+checks that each one received its whole plot.
+
+  llm calls  story LLM calls made for the burst
+  coalesced  generations that shared another generation's call
+  wall ms    time until the last player had a scene
+  p50/p95 ms per-player generation latency
+  consistent players whose scene matches what an uncoalesced run gives them
+             (and whose streamed text, with --stream, is their plot). Across
+             names, players share one scene with their own name in it by design,
+             so only the streamed text is checked there
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.coalesce_burst
+    python -m benchmarks.coalesce_burst --players 50 --latency-ms 500 --stream
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import REGISTRY
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile
+from benchmarks.rag_micro import CHARACTER, make_history
+from app.core.config import settings
+from app.core.rag_system import RAGSystem
+
+# (label, STORY_COALESCE, STORY_COALESCE_ACROSS_NAMES)
+MODES = [("off", False, False), ("on", True, False), ("across_names", True, True)]
+
+
+def run_burst(rag: RAGSystem, characters: List[Dict[str, Any]], game_state: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+    barrier = threading.Barrier(len(characters))
+    latencies: List[float] = [0.0] * len(characters)
+    scenes: List[Any] = [None] * len(characters)
+    streamed: List[List[str]] = [[] for _ in characters]
+
+    def play(player: int) -> None:
+        barrier.wait()
+        start = time.perf_counter()
+        scenes[player] = rag.generate_story(dict(game_state), dict(characters[player]),
+                                            on_plot_delta=streamed[player].append if stream else None)
+        latencies[player] = (time.perf_counter() - start) * 1000
+
+    calls_before = rag.llm_calls
+    threads = [threading.Thread(target=play, args=(player,)) for player in range(len(characters))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_ms = (time.perf_counter() - started) * 1000
+    latencies.sort()
+    return {
+        "llm_calls": rag.llm_calls - calls_before,
+        "wall_ms": round(wall_ms, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "scenes": scenes,
+        "streamed": ["".join(pieces) for pieces in streamed] if stream else None,
+    }
+
+
+def _coalesced() -> float:
+    return REGISTRY.get_sample_value("story_generations_coalesced_total") or 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=20, help="concurrent generations per burst")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub LLM latency per call")
+    parser.add_argument("--stream", action="store_true", help="stream every player's plot, as the WebSocket channel does")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/coalesce_burst_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # RAGSystem loads the relative knowledge_base/ directory on construction
+    rag = RAGSystem()
+    rag.llm.latency_ms = args.latency_ms
+    rag.llm_calls = 0
+    call_llm = rag._call_llm
+    calls_lock = threading.Lock()
+
+    def counting_call_llm(prompt_text: str, on_plot_delta: Optional[Any] = None, lane: str = "interactive") -> str:
+        with calls_lock:
+            rag.llm_calls += 1
+        return call_llm(prompt_text, on_plot_delta, lane)
+
+    rag._call_llm = counting_call_llm
+    game_state = {"current_scene_id": "青云山脚", "current_date": "Day 3", "story_history": make_history(10), "game_data": {}}
+    bursts = {
+        "identical": [CHARACTER] * args.players,
+        "names": [dict(CHARACTER, name=f"{CHARACTER['name']}{player}") for player in range(args.players)],
+    }
+
+    original = settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES
+    rows: List[Dict[str, Any]] = []
+    for burst, characters in bursts.items():
+        expected = None
+        for mode, coalesce, across_names in MODES:
+            settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES = coalesce, across_names
+            coalesced_before = _coalesced()
+            result = run_burst(rag, characters, game_state, args.stream)
+            scenes = result.pop("scenes")
+            streamed = result.pop("streamed")
+            plots = [(scene.plot, [choice.text for choice in scene.choices], scene.duration_days) for scene in scenes]
+            if expected is None:
+                expected = plots # Coalescing off: what each player gets on their own
+            consistent = sum(
+                (plot == want or mode == "across_names") and (streamed is None or streamed[player] == scene.plot)
+                for player, (plot, want, scene) in enumerate(zip(plots, expected, scenes))
+            )
+            rows.append({"burst": burst, "mode": mode, **result, "coalesced": int(_coalesced() - coalesced_before),
+                         "consistent": consistent})
+    settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES = original
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "coalesce_burst",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "players": args.players,
+            "latency_ms": args.latency_ms,
+            "stream": args.stream,
+        },
+        "results": rows,
+    }
+
+    print(f"{args.players} players per burst, stub LLM {args.latency_ms:g} ms per call{', streaming' if args.stream else ''}\n")
+    print(f"{'burst':<11}{'mode':<14}{'llm calls':>10}{'coalesced':>11}{'wall ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'consistent':>12}")
+    for row in rows:
+        print(f"{row['burst']:<11}{row['mode']:<14}{row['llm_calls']:>10}{row['coalesced']:>11}{row['wall_ms']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['consistent']:>8}/{args.players}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"coalesce_burst_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# benchmarks/embed_throughput.py
+"""
+Knowledge-base embedding throughput by batch size and concurrency, and resuming an interrupted load.
+
+Loads a synthetic corpus (the rag_micro fixture, --scale copies of knowledge_base/)
+with a fresh KnowledgeBaseLoader. The embedder is the hashing stub behind a
+simulated remote API: every call waits --latency-ms plus --per-text-ms per text,
+and fails with probability --failure-rate as a rate-limited call would. So the
+numbers show how batching and concurrency hide per-call latency, not how fast the
+stub hashes.
+
+  calls     embedder calls, including failed ones
+  retried   failed calls that were retried after a backoff
+  load s    wall time of the whole load (parse, embed, index)
+  entries/s entries embedded per second of load
+
+Then it interrupts a load after --interrupt-after embedder calls and runs it again.
+The second load takes the finished batches from the store's checkpoints and embeds
+only the rest.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.embed_throughput
+    python -m benchmarks.embed_throughput --scale 100 --failure-rate 0.05
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.load_test import SERVICE_DIR, git_commit
+from benchmarks.rag_micro import build_synthetic_corpus
+from app.core.config import settings
+from app.core.knowledge_loader import KnowledgeBaseLoader
+from app.core.stub_llm import HashingEmbeddings
+
+# (KB_EMBED_BATCH_SIZE, KB_EMBED_CONCURRENCY)
+SWEEP = [(16, 1), (64, 1), (256, 1), (64, 4), (256, 4), (64, 8)]
+
+
+class Interrupted(BaseException):
+    """Stands in for the process being stopped mid-load; not an Exception, so it isn't retried."""
+
+
+class RemoteEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings with the latency and failures of a remote embedding API."""
+
+    def __init__(self, latency_ms: float, per_text_ms: float, failure_rate: float, seed: int, interrupt_after: int = 0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.failure_rate = failure_rate
+        self.interrupt_after = interrupt_after # Calls before Interrupted is raised; 0 never
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+            fail = self._random.random() < self.failure_rate
+            self.failures += fail
+        if self.interrupt_after and calls > self.interrupt_after:
+            raise Interrupted()
+        time.sleep((self.latency_ms + self.per_text_ms * len(texts)) / 1000) # Network wait: releases the GIL like real I/O
+        if fail:
+            raise RuntimeError("429 rate limited")
+        return super().embed_documents(texts)
+
+
+def run_load(kb_dir: Path, embeddings: RemoteEmbeddings) -> Dict[str, Any]:
+    started = time.perf_counter()
+    _, result = KnowledgeBaseLoader(embeddings).load(kb_dir)
+    seconds = time.perf_counter() - started
+    return {
+        "entries": result.entries,
+        "embedded": result.embedded,
+        "resumed": result.resumed,
+        "calls": embeddings.calls,
+        "retried": embeddings.failures, # Each is retried: a batch would need KB_EMBED_MAX_RETRIES failures in a row to fail the load
+        "load_seconds": round(seconds, 3),
+        "entries_per_second": round(result.embedded / seconds, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10, help="synthetic corpus multiplier")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated latency of every embedder call")
+    parser.add_argument("--per-text-ms", type=float, default=0.05, help="simulated extra latency per text in a call")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="share of embedder calls that fail and are retried")
+    parser.add_argument("--interrupt-after", type=int, default=10, help="embedder calls before the resume test's first load is stopped")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/embed_throughput_<sha>.json)")
+    args = parser.parse_args()
+
+    settings.KB_EMBED_RETRY_BASE_SECONDS = 0.05 # Keep the simulated rate-limit backoff short
+    settings.KB_EMBED_PROGRESS_SECONDS = 0
+    rows: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix=f"xiuxian-kb-{args.scale}x-") as tmp_dir:
+        kb_dir = Path(tmp_dir) / "knowledge_base"
+        build_synthetic_corpus(kb_dir, args.scale)
+
+        settings.KB_INDEX_STORE = False # Every configuration embeds the whole corpus
+        for batch_size, concurrency in SWEEP:
+            settings.KB_EMBED_BATCH_SIZE, settings.KB_EMBED_CONCURRENCY = batch_size, concurrency
+            embeddings = RemoteEmbeddings(args.latency_ms, args.per_text_ms, args.failure_rate, args.seed)
+            rows.append({"batch_size": batch_size, "concurrency": concurrency, **run_load(kb_dir, embeddings)})
+
+        settings.KB_INDEX_STORE = True
+        settings.KB_INDEX_DIR = str(Path(tmp_dir) / "store")
+        settings.KB_EMBED_BATCH_SIZE, settings.KB_EMBED_CONCURRENCY = 64, 4
+        try:
+            run_load(kb_dir, RemoteEmbeddings(args.latency_ms, args.per_text_ms, 0.0, args.seed, interrupt_after=args.interrupt_after))
+        except Interrupted:
+            pass
+        resume = run_load(kb_dir, RemoteEmbeddings(args.latency_ms, args.per_text_ms, 0.0, args.seed))
+        settings.KB_INDEX_DIR = None
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "embed_throughput",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "scale": args.scale,
+            "latency_ms": args.latency_ms,
+            "per_text_ms": args.per_text_ms,
+            "failure_rate": args.failure_rate,
+            "interrupt_after": args.interrupt_after,
+        },
+        "results": rows,
+        "resume": resume,
+    }
+
+    print(f"{rows[0]['entries']} entries; embedder calls take {args.latency_ms:g} ms + {args.per_text_ms:g} ms per text, "
+          f"{args.failure_rate:.0%} fail\n")
+    print(f"{'batch':>6}{'concurrency':>13}{'calls':>7}{'retried':>9}{'load s':>9}{'entries/s':>11}")
+    for row in rows:
+        print(f"{row['batch_size']:>6}{row['concurrency']:>13}{row['calls']:>7}{row['retried']:>9}{row['load_seconds']:>9.2f}{row['entries_per_second']:>11.1f}")
+    print(f"\ninterrupted after {args.interrupt_after} calls, then reloaded: {resume['resumed']} entries resumed from checkpoints, "
+          f"{resume['embedded']} embedded in {resume['calls']} calls, {resume['load_seconds']:.2f}s")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"embed_throughput_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
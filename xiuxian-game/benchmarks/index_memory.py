@@ -0,0 +1,144 @@
+# benchmarks/index_memory.py
+"""
+Per-worker memory of the knowledge-base index, with and without the shared store.
+
+Writes a synthetic corpus (the rag_micro fixture, --scale copies of knowledge_base/),
+then starts N worker processes at once for each N in --workers. Each one
+constructs a RAGSystem over the corpus, as a uvicorn worker does at startup, runs
+a few retrievals and reports its load time and memory from /proc (Linux only):
+
+  anon  private memory (RssAnon): grows with the index when it is held in-process
+  pss   proportional set size: shared pages are split between the processes mapping them
+  total the workers' summed PSS, i.e. what the host pays for all of them
+
+With KB_INDEX_STORE on, the first worker builds and writes the store while the
+others wait on its lock and map it; the index itself then costs the host once. The
+"memory" rows run the same workers with KB_INDEX_STORE=false, each building its
+own index.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.index_memory
+    python -m benchmarks.index_memory --scale 1000 --workers 1,4
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.load_test import SERVICE_DIR, git_commit
+from benchmarks.rag_micro import CHARACTER, HYBRID_QUERY, SYNTHETIC_REGION, build_synthetic_corpus
+
+
+def _proc_memory_kb() -> Dict[str, int]:
+    status = dict(line.split(":", 1) for line in Path("/proc/self/status").read_text().splitlines() if ":" in line)
+    rollup = dict(line.split(":", 1) for line in Path("/proc/self/smaps_rollup").read_text().splitlines()[1:] if ":" in line)
+    return {
+        "anon_kb": int(status["RssAnon"].split()[0]),
+        "file_kb": int(status["RssFile"].split()[0]),
+        "pss_kb": int(rollup["Pss"].split()[0]),
+    }
+
+
+def run_worker(kb_dir: Path) -> Dict[str, Any]:
+    """One worker: load the corpus and retrieve from it. Runs in its own process."""
+    from app.core.rag_system import RAGSystem
+
+    baseline = _proc_memory_kb()
+    started = time.perf_counter()
+    rag = RAGSystem() # Loads the real knowledge base first, as a worker would...
+    result = rag.load_knowledge_base(kb_dir) # ...then the corpus under test
+    load_seconds = time.perf_counter() - started
+    state = {"current_scene_id": "青云山脚", "game_data": {"region": SYNTHETIC_REGION.format(0)}}
+    scope = rag.knowledge_base.metadata.scope(state, CHARACTER)
+    for query, entity_text in ((HYBRID_QUERY, None), (rag._build_query(state, CHARACTER), rag._entity_text(state))):
+        rag._retrieve_context(query, scope, entity_text=entity_text)
+        rag._retrieve_context(query, entity_text=entity_text) # Unscoped: touches every partition
+    # Measure only once every worker is up, so shared pages are split between all of them
+    print("ready", flush=True)
+    sys.stdin.readline()
+    memory = _proc_memory_kb()
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "from_store": result.from_store,
+        "embedded": result.embedded,
+        **{key: memory[key] - baseline[key] for key in memory},
+    }
+
+
+def run_workers(kb_dir: Path, count: int, use_store: bool) -> List[Dict[str, Any]]:
+    env = dict(os.environ, KB_INDEX_STORE="true" if use_store else "false", KB_WATCH_INTERVAL_SECONDS="0")
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.index_memory", "--worker", str(kb_dir)], cwd=SERVICE_DIR, env=env,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(count)
+    ]
+    for process in processes:
+        while process.stdout.readline().strip() != "ready":
+            pass
+    return [json.loads(process.communicate("measure\n")[0].strip().splitlines()[-1]) for process in processes]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=100, help="synthetic corpus multiplier")
+    parser.add_argument("--workers", default="1,2,4", help="worker counts to start at once")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/index_memory_<sha>.json)")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS) # Internal: run one worker on this corpus
+    args = parser.parse_args()
+
+    if args.worker:
+        os.chdir(SERVICE_DIR.parent) # RAGSystem loads the relative knowledge_base/ directory on construction
+        print(json.dumps(run_worker(Path(args.worker))))
+        return 0
+
+    worker_counts = [int(n) for n in args.workers.split(",") if n]
+    runs: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix=f"xiuxian-kb-{args.scale}x-") as tmp_dir:
+        kb_dir = Path(tmp_dir) / "knowledge_base"
+        build_synthetic_corpus(kb_dir, args.scale)
+        for use_store in (False, True):
+            for count in worker_counts:
+                if use_store:
+                    # Every count starts from an empty store, so one of its workers builds it
+                    shutil.rmtree(kb_dir / ".index", ignore_errors=True)
+                workers = run_workers(kb_dir, count, use_store)
+                runs.append({"mode": "store" if use_store else "memory", "workers": count, "results": workers})
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "index_memory",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "scale": args.scale,
+        },
+        "runs": runs,
+    }
+
+    # With the store, the median worker is one that mapped the index rather than built it (once there are 3 or more)
+    print(f"{'mode':<8}{'workers':>8}{'built':>7}{'load s':>9}{'anon MB':>9}{'pss MB':>9}{'total MB':>10}   (load: slowest; anon, pss: median worker)")
+    for run in runs:
+        results = run["results"]
+        print(f"{run['mode']:<8}{run['workers']:>8}{sum(not r['from_store'] for r in results):>7}"
+              f"{max(r['load_seconds'] for r in results):>9.2f}{statistics.median_low(r['anon_kb'] for r in results) / 1024:>9.1f}"
+              f"{statistics.median_low(r['pss_kb'] for r in results) / 1024:>9.1f}{sum(r['pss_kb'] for r in results) / 1024:>10.1f}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"index_memory_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
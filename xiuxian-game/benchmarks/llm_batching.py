@@ -0,0 +1,169 @@
+# benchmarks/llm_batching.py
+"""
+Story generation throughput and latency with and without micro-batched LLM calls.
+
+--players threads each generate --turns stories back to back (a closed loop:
+a player sends its next request once its last scene is back), while
+--summarizers threads each summarize every --summary-interval-ms in the background lane. The stub LLM
+stands in for a self-hosted model server. It runs at most --server-slots calls at
+once, and each call takes --latency-ms plus --batch-prompt-ms per extra prompt in
+its batch. The players differ by name, so story coalescing doesn't merge their
+calls.
+
+It runs once with LLM_BATCHING off (one LLM call per prompt) and once per
+LLM_BATCH_MAX_WAIT_MS in --max-waits with it on, and reports:
+
+  stories/s   story generations completed per second
+  p50/p95 ms  story generation latency (interactive lane)
+  summary p50 summary latency (background lane)
+  llm calls   completion calls made, each carrying one batch
+  batch       mean prompts per call
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.llm_batching
+    python -m benchmarks.llm_batching --players 32 --latency-ms 500 --max-waits 2,10,50
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from prometheus_client import REGISTRY
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile
+from benchmarks.rag_micro import CHARACTER, make_history
+from app.core.config import settings
+from app.core.rag_system import RAGSystem
+
+
+def _batches() -> Dict[str, float]:
+    return {
+        "calls": REGISTRY.get_sample_value("llm_batch_size_count") or 0.0,
+        "prompts": REGISTRY.get_sample_value("llm_batch_size_sum") or 0.0,
+    }
+
+
+def run(args: argparse.Namespace, batching: bool, max_wait_ms: float) -> Dict[str, Any]:
+    settings.LLM_BATCHING = batching
+    settings.LLM_BATCH_MAX_WAIT_MS = max_wait_ms
+    rag = RAGSystem()
+    history = make_history(10)
+    game_state = {"current_scene_id": "青云山脚", "current_date": "Day 3", "story_history": history, "game_data": {}}
+    story_ms: List[float] = []
+    summary_ms: List[float] = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def player(number: int) -> None:
+        character = dict(CHARACTER, name=f"{CHARACTER['name']}{number}")
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            rag.generate_story(dict(game_state), character)
+            with lock:
+                story_ms.append((time.perf_counter() - start) * 1000)
+
+    def summarizer() -> None:
+        while not stop.wait(args.summary_interval_ms / 1000.0):
+            start = time.perf_counter()
+            rag.summarize_story("", history)
+            with lock:
+                summary_ms.append((time.perf_counter() - start) * 1000)
+
+    before = _batches()
+    players = [threading.Thread(target=player, args=(number,)) for number in range(args.players)]
+    summarizers = [threading.Thread(target=summarizer) for _ in range(args.summarizers)]
+    started = time.perf_counter()
+    for thread in players + summarizers:
+        thread.start()
+    for thread in players:
+        thread.join()
+    wall = time.perf_counter() - started
+    stop.set()
+    for thread in summarizers:
+        thread.join()
+    rag.shutdown()
+    after = _batches()
+
+    story_ms.sort()
+    summary_ms.sort()
+    calls = after["calls"] - before["calls"]
+    return {
+        "batching": batching,
+        "max_wait_ms": max_wait_ms if batching else None,
+        "stories": len(story_ms),
+        "stories_per_second": round(len(story_ms) / wall, 1),
+        "p50_ms": round(percentile(story_ms, 50), 1),
+        "p95_ms": round(percentile(story_ms, 95), 1),
+        "summaries": len(summary_ms),
+        "summary_p50_ms": round(percentile(summary_ms, 50), 1),
+        # Without batching every prompt is its own call
+        "llm_calls": int(calls) if batching else len(story_ms) + len(summary_ms),
+        "mean_batch": round((after["prompts"] - before["prompts"]) / calls, 2) if batching and calls else 1.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=16, help="players generating stories concurrently")
+    parser.add_argument("--turns", type=int, default=10, help="stories per player")
+    parser.add_argument("--summarizers", type=int, default=2, help="threads summarizing in the background lane")
+    parser.add_argument("--summary-interval-ms", type=float, default=100.0, help="pause between a summarizer's summaries")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub LLM latency per call")
+    parser.add_argument("--batch-prompt-ms", type=float, default=10.0, help="stub LLM latency per extra prompt in a batch")
+    parser.add_argument("--server-slots", type=int, default=2, help="stub LLM calls generating at once")
+    parser.add_argument("--max-waits", default="5,20", help="LLM_BATCH_MAX_WAIT_MS values to try")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/llm_batching_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # RAGSystem loads the relative knowledge_base/ directory on construction
+    settings.STORY_COALESCE = False # Measure batching alone
+    settings.STUB_LLM_LATENCY_MS = args.latency_ms
+    settings.STUB_LLM_BATCH_PROMPT_MS = args.batch_prompt_ms
+    settings.STUB_LLM_MAX_CONCURRENCY = args.server_slots
+    settings.LLM_BATCH_CONCURRENCY = args.server_slots # One batch per slot
+    rows = [run(args, False, 0.0)]
+    for max_wait_ms in (float(wait) for wait in args.max_waits.split(",") if wait):
+        rows.append(run(args, True, max_wait_ms))
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "llm_batching",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "players": args.players,
+            "turns": args.turns,
+            "summarizers": args.summarizers,
+            "latency_ms": args.latency_ms,
+            "batch_prompt_ms": args.batch_prompt_ms,
+            "server_slots": args.server_slots,
+            "max_batch_size": settings.LLM_BATCH_MAX_SIZE,
+            "concurrency": settings.LLM_BATCH_CONCURRENCY,
+        },
+        "results": rows,
+    }
+
+    print(f"{args.players} players x {args.turns} stories, {args.summarizers} background summarizers; stub LLM with {args.server_slots} slots, "
+          f"{args.latency_ms:g} ms + {args.batch_prompt_ms:g} ms per extra prompt; batches of up to {settings.LLM_BATCH_MAX_SIZE}\n")
+    print(f"{'batching':<14}{'stories/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'summary p50':>13}{'llm calls':>11}{'batch':>7}")
+    for row in rows:
+        label = f"wait {row['max_wait_ms']:g} ms" if row["batching"] else "off"
+        print(f"{label:<14}{row['stories_per_second']:>10.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['summary_p50_ms']:>13.1f}"
+              f"{row['llm_calls']:>11}{row['mean_batch']:>7.2f}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"llm_batching_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
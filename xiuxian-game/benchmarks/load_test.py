@@ -0,0 +1,330 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test for the game API.
+
+Starts the app under uvicorn against a throwaway SQLite database (or any
+SQLAlchemy URL passed with --db-url) and the deterministic stub LLM, then drives
+many concurrent simulated players through the full flow:
+
+    register -> login -> create character -> start -> N choices -> save -> list saves -> load
+
+With --transport ws the choices are made over the /ws/game/{character_id}
+WebSocket channel instead (one connection per player; latency is measured from
+sending make_choice to receiving the story_update).
+
+Every request records its latency and the X-DB-Query-Count header. The report
+(throughput, p50/p95/p99 and mean DB statements per endpoint) is printed and
+written as JSON, so runs from different commits can be compared with --baseline.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.load_test --players 50 --choices 10
+    python -m benchmarks.load_test --players 50 --choices 10 --transport ws
+    python -m benchmarks.load_test --baseline benchmarks/results/load_<sha>.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent  # xiuxian-game/
+PROJECT_ROOT = SERVICE_DIR.parent  # knowledge_base/ and plugins/ live here
+API = "/api/v1"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """Thread-safe collection of (endpoint, latency, status, db statement count) samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, int, Optional[int]]]] = defaultdict(list)
+
+    def add(self, endpoint: str, latency_ms: float, status: int, db_queries: Optional[int]) -> None:
+        with self._lock:
+            self.samples[endpoint].append((latency_ms, status, db_queries))
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        endpoints = {}
+        total = 0
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            query_counts = [s[2] for s in samples if s[2] is not None]
+            total += len(samples)
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": sum(1 for s in samples if s[1] >= 400),
+                "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+                "db_queries_mean": round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+                "db_queries_max": max(query_counts) if query_counts else None,
+            }
+        return {
+            "total_requests": total,
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(total / wall_seconds, 2) if wall_seconds else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class Player:
+    """One simulated player with its own keep-alive connection."""
+
+    def __init__(self, host: str, port: int, recorder: Recorder, timeout: float, transport: str = "http"):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.recorder = recorder
+        self.transport = transport
+        self.token: Optional[str] = None
+
+    def request(self, endpoint: str, method: str, path: str, body: Any = None, form: bool = False) -> Dict[str, Any]:
+        headers = {}
+        payload = None
+        if body is not None:
+            if form:
+                payload = urllib.parse.urlencode(body)
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            else:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        start = time.perf_counter()
+        self.conn.request(method, path, body=payload, headers=headers)
+        response = self.conn.getresponse()
+        raw = response.read()
+        latency_ms = (time.perf_counter() - start) * 1000.0
+
+        query_header = response.getheader("X-DB-Query-Count")
+        self.recorder.add(endpoint, latency_ms, response.status, int(query_header) if query_header else None)
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status}: {raw[:200]!r}")
+        return json.loads(raw) if raw else {}
+
+    def play(self, choices: int) -> None:
+        username = f"bench_{uuid.uuid4().hex[:12]}"
+        password = "bench-password"
+        self.request("auth.register", "POST", f"{API}/auth/register",
+                     {"username": username, "email": f"{username}@example.com", "password": password})
+        login = self.request("auth.login", "POST", f"{API}/auth/login",
+                             {"username": username, "password": password}, form=True)
+        self.token = login["data"]["access_token"]
+
+        character = self.request("characters.create", "POST", f"{API}/characters/", {"name": f"道友{username[-4:]}"})
+        character_id = character["data"]["id"]
+
+        scene = self.request("game.start", "POST", f"{API}/game/start", {"character_id": character_id})["data"]
+        if self.transport == "ws":
+            self.play_choices_ws(character_id, choices)
+        else:
+            for turn in range(choices):
+                choice_id = scene["choices"][turn % len(scene["choices"])]["id"]
+                scene = self.request("game.choice", "POST", f"{API}/game/choice",
+                                     {"character_id": character_id, "choice_id": choice_id})["data"]
+
+        save = self.request("game.save", "POST", f"{API}/game/save",
+                            {"character_id": character_id, "save_name": "bench"})["data"]
+        self.request("game.saves", "GET", f"{API}/game/saves")
+        self.request("game.state", "GET", f"{API}/game/state/{character_id}")
+        self.request("game.load", "POST", f"{API}/game/load", {"save_id": save["id"]})
+
+    def play_choices_ws(self, character_id: int, choices: int) -> None:
+        from websockets.sync.client import connect  # Installed with uvicorn[standard]
+
+        url = f"ws://{self.host}:{self.port}/ws/game/{character_id}"
+        with connect(url, additional_headers={"Authorization": f"Bearer {self.token}"}, open_timeout=self.timeout) as ws:
+            scene = self.receive_ws(ws, "story_update")["scene"]
+            for turn in range(choices):
+                choice_id = scene["choices"][turn % len(scene["choices"])]["id"]
+                start = time.perf_counter()
+                ws.send(json.dumps({"type": "make_choice", "data": {"choice_id": choice_id}}))
+                try:
+                    scene = self.receive_ws(ws, "story_update")["scene"]
+                except RuntimeError:
+                    self.recorder.add("ws.choice", (time.perf_counter() - start) * 1000.0, 500, None)
+                    raise
+                self.recorder.add("ws.choice", (time.perf_counter() - start) * 1000.0, 200, None)
+
+    def receive_ws(self, ws: Any, message_type: str) -> Dict[str, Any]:
+        """Reads messages until one of message_type arrives (story tokens and plugin messages are skipped)."""
+        while True:
+            message = json.loads(ws.recv(timeout=self.timeout))
+            if message["type"] == message_type:
+                return message["data"]
+            if message["type"] == "system_notification" and message["data"].get("level") == "error":
+                raise RuntimeError(f"WebSocket error: {message['data'].get('message')}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def start_server(args: argparse.Namespace, db_url: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVICE_DIR), env.get("PYTHONPATH")])),
+        "SQLALCHEMY_DATABASE_URI": db_url,
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "DB_QUERY_COUNT_HEADER": "true",
+        # Required settings that the benchmark does not use
+        "SECRET_KEY": env.get("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key"),
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-benchmark"),
+        "POSTGRES_SERVER": env.get("POSTGRES_SERVER", "unused"),
+        "POSTGRES_USER": env.get("POSTGRES_USER", "unused"),
+        "POSTGRES_PASSWORD": env.get("POSTGRES_PASSWORD", "unused"),
+        "POSTGRES_DB": env.get("POSTGRES_DB", "unused"),
+    })
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", args.host, "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    # Run from the project root so the relative knowledge_base/ and plugins/ paths resolve
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+
+
+def wait_until_ready(host: str, port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not become ready on {host}:{port} within {timeout}s")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\nComparison against baseline {baseline.get('meta', {}).get('git_commit')}:")
+    print(f"{'endpoint':<20}{'p95 base':>10}{'p95 now':>10}{'delta':>9}{'queries':>14}")
+    for endpoint, now in current["results"]["endpoints"].items():
+        base = baseline.get("results", {}).get("endpoints", {}).get(endpoint)
+        if not base:
+            continue
+        delta = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100.0 if base["p95_ms"] else 0.0
+        queries = f"{base['db_queries_mean']}->{now['db_queries_mean']}"
+        print(f"{endpoint:<20}{base['p95_ms']:>10.1f}{now['p95_ms']:>10.1f}{delta:>8.1f}%{queries:>14}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=20, help="number of simulated players")
+    parser.add_argument("--concurrency", type=int, default=None, help="players running at once (default: all)")
+    parser.add_argument("--choices", type=int, default=5, help="choices made by each player")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--transport", choices=["http", "ws"], default="http", help="how choices are sent")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db-url", default=None, help="SQLAlchemy URL (default: fresh SQLite file)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated stub LLM latency")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/load_<sha>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"load_{(commit or 'nogit')[:12]}.json"
+
+    with tempfile.TemporaryDirectory(prefix="xiuxian-bench-") as tmp_dir:
+        db_url = args.db_url or f"sqlite:///{Path(tmp_dir) / 'bench.db'}"
+        server = start_server(args, db_url)
+        try:
+            wait_until_ready(args.host, args.port, timeout=60.0)
+            recorder = Recorder()
+            failures: List[str] = []
+
+            def run_player(_: int) -> None:
+                player = Player(args.host, args.port, recorder, args.timeout, args.transport)
+                try:
+                    player.play(args.choices)
+                except Exception as e:  # A failed flow is reported, not fatal to the run
+                    failures.append(str(e))
+                finally:
+                    player.close()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency or args.players) as pool:
+                list(pool.map(run_player, range(args.players)))
+            wall_seconds = time.perf_counter() - started
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    results = recorder.summary(wall_seconds)
+    results["flows_completed"] = args.players - len(failures)
+    results["flows_failed"] = len(failures)
+    report = {
+        "meta": {
+            "benchmark": "load_test",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "database": db_url.split(":", 1)[0] if args.db_url else "sqlite",
+            "players": args.players,
+            "concurrency": args.concurrency or args.players,
+            "choices_per_player": args.choices,
+            "workers": args.workers,
+            "transport": args.transport,
+            "llm_latency_ms": args.llm_latency_ms,
+        },
+        "results": results,
+        "failures": failures[:20],
+    }
+
+    print(f"{'endpoint':<20}{'reqs':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<20}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{str(stats['db_queries_mean']):>9}")
+    print(f"total: {results['total_requests']} requests in {results['wall_seconds']}s "
+          f"({results['throughput_rps']} req/s), {len(failures)} failed flows")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"results written to {output}")
+
+    if args.baseline:
+        compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
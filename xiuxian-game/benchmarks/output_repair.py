@@ -0,0 +1,178 @@
+# benchmarks/output_repair.py
+"""
+How many malformed story outputs the lenient parser rescues, and what parsing costs.
+
+Takes --samples stub LLM outputs (well-formed ```json scenes) and damages each
+one the way models do. One row per kind of damage:
+
+  clean            the output as generated
+  trailing_comma   a comma before every closing } and ]
+  unquoted_keys    keys without quotes
+  single_quotes    every string in single quotes
+  missing_commas   no commas at line ends
+  unescaped_quote  quotes inside the plot left unescaped
+  raw_newline      a line break inside the plot
+  fullwidth        full-width colons after keys
+  prose_after      no fence, and a remark with braces after the object
+  python_literal   an extra member with a Python True
+  cut_90/75/50     output cut off after 90%, 75% and 50% of its characters
+
+Each damaged output goes through the previous parser (fence regex or first-{ to
+last-} slice, then json.loads and the schema checks) and through
+RAGSystem._parse_llm_output:
+
+  old ok / new ok  outputs that became a scene instead of the default error scene
+  exact            new-parser scenes identical to the undamaged output's scene (never
+                   for unescaped_quote and raw_newline, whose damage is in the plot
+                   text itself, or for cuts into the plot)
+  old/new p50 us   parse time per output
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.output_repair
+    python -m benchmarks.output_repair --samples 500 --repeat 20
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile
+import benchmarks.rag_micro  # noqa: F401  Selects the stub backend before the app is imported
+from app.core.rag_system import RAGSystem
+from app.core.stub_llm import StubLLM
+from app.schemas.game_schemas import StoryChoice, StoryScene
+
+_KEY = re.compile(r'"(\w+)":')
+
+
+def _unfenced(raw: str) -> str:
+    return raw.removeprefix("```json\n").removesuffix("\n```")
+
+
+DAMAGE: Dict[str, Callable[[str], str]] = {
+    "clean": lambda raw: raw,
+    "trailing_comma": lambda raw: re.sub(r"(\S)(\s*)([}\]])", r"\1,\2\3", raw),
+    "unquoted_keys": lambda raw: _KEY.sub(r"\1:", raw),
+    "single_quotes": lambda raw: raw.replace('"', "'"),
+    "missing_commas": lambda raw: raw.replace(",\n", "\n"),
+    "unescaped_quote": lambda raw: re.sub(r"，(\w{2})", r'，"\1"', raw, count=1),
+    "raw_newline": lambda raw: raw.replace("，", "，\n", 1),
+    "fullwidth": lambda raw: raw.replace('": ', '"：'),
+    "prose_after": lambda raw: _unfenced(raw) + "\n以上是下一幕（可按需调整 {plot} 与 {choices}）。",
+    "python_literal": lambda raw: raw.replace("{", '{\n  "urgent": True,', 1),
+    "cut_90": lambda raw: raw[:int(len(raw) * 0.9)],
+    "cut_75": lambda raw: raw[:int(len(raw) * 0.75)],
+    "cut_50": lambda raw: raw[:int(len(raw) * 0.5)],
+}
+
+
+def legacy_parse(raw_llm_output: str) -> Any:
+    """RAGSystem._parse_llm_output before lenient_json: json.loads, or the default error scene."""
+    match = re.search(r"```json\s*([\s\S]*?)\s*```", raw_llm_output)
+    if match:
+        json_str = match.group(1)
+    else:
+        start, end = raw_llm_output.find("{"), raw_llm_output.rfind("}")
+        json_str = raw_llm_output[start:end + 1] if start != -1 and end > start else raw_llm_output
+    parsed_output = json.loads(json_str)
+    if not all(k in parsed_output for k in ["plot", "choices", "duration_days"]):
+        raise ValueError("Missing one or more required keys")
+    if not isinstance(parsed_output["choices"], list) or len(parsed_output["choices"]) != 3:
+        raise ValueError("JSON 'choices' must be a list of 3 items.")
+    for choice in parsed_output["choices"]:
+        if not all(k in choice for k in ["id", "text"]):
+            raise ValueError("Each choice object must have 'id' and 'text' keys.")
+    duration = parsed_output.get("duration_days", 1)
+    if not isinstance(duration, int):
+        try:
+            duration = int(duration)
+        except ValueError:
+            duration = 1
+    return StoryScene(
+        plot=str(parsed_output["plot"]),
+        choices=[StoryChoice(id=str(c.get("id", "choice_fallback")), text=str(c.get("text", "---"))) for c in parsed_output["choices"]],
+        duration_days=min(max(1, duration), 7),
+    )
+
+
+def _scene_key(scene: Any) -> Any:
+    return scene.plot, [(choice.id, choice.text) for choice in scene.choices], scene.duration_days
+
+
+def _parses(parse: Callable[[str], Any], raw: str) -> Any:
+    try:
+        return parse(raw)
+    except ValueError: # json.JSONDecodeError included
+        return None
+
+
+def _time(parse: Callable[[str], Any], outputs: List[str], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        for raw in outputs:
+            start = time.perf_counter()
+            _parses(parse, raw)
+            samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return round(percentile(samples, 50), 2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200, help="stub outputs to damage per kind")
+    parser.add_argument("--repeat", type=int, default=10, help="timed passes over the outputs per kind")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/output_repair_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # RAGSystem loads the relative knowledge_base/ directory on construction
+    rag = RAGSystem()
+    llm = StubLLM()
+    originals = [llm.invoke(f'Scene {number}: answer with "plot", "choices" and "duration_days".') for number in range(args.samples)]
+    expected = [_scene_key(rag._parse_llm_output(raw)) for raw in originals]
+
+    rows: List[Dict[str, Any]] = []
+    for damage, apply in DAMAGE.items():
+        outputs = [apply(raw) for raw in originals]
+        scenes = [_parses(rag._parse_llm_output, raw) for raw in outputs]
+        rows.append({
+            "damage": damage,
+            "old_ok": sum(_parses(legacy_parse, raw) is not None for raw in outputs),
+            "new_ok": sum(scene is not None for scene in scenes),
+            "exact": sum(scene is not None and _scene_key(scene) == want for scene, want in zip(scenes, expected)),
+            "old_p50_us": _time(legacy_parse, outputs, args.repeat),
+            "new_p50_us": _time(rag._parse_llm_output, outputs, args.repeat),
+        })
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "output_repair",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "samples": args.samples,
+            "repeat": args.repeat,
+        },
+        "results": rows,
+    }
+
+    print(f"{args.samples} stub outputs per kind of damage\n")
+    print(f"{'damage':<17}{'old ok':>8}{'new ok':>8}{'exact':>7}{'old p50 us':>12}{'new p50 us':>12}")
+    for row in rows:
+        print(f"{row['damage']:<17}{row['old_ok']:>8}{row['new_ok']:>8}{row['exact']:>7}{row['old_p50_us']:>12.1f}{row['new_p50_us']:>12.1f}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"output_repair_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# benchmarks/query_counts.py
+"""
+Pinned SQL statement counts per endpoint.
+
+Plays one player through every REST endpoint in-process (TestClient, throwaway
+SQLite database, stub LLM) and checks each request against QUERY_BUDGETS with
+app.db.query_counter.expect_queries. A lazy load or extra refresh that creeps in
+shows up as a mismatch listing the request's statements; exits non-zero on any
+mismatch, so it can gate CI.
+
+Counts are exact. When a change legitimately alters one (better or worse), update
+its pin here in the same commit.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.query_counts
+    python -m benchmarks.query_counts -v    # print every request's statements
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from httpx import Response
+
+_DB_DIR = tempfile.mkdtemp(prefix="xiuxian-queries-")
+
+# Settings are read at import time, so they have to be in place before importing the app
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{Path(_DB_DIR) / 'queries.db'}")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("WRITE_BEHIND_DELAY_SECONDS", "3600") # Turns are written by the endpoint that needs them, never by the timer
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+for _name, _default in {
+    "SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "POSTGRES_SERVER": "unused", "POSTGRES_USER": "unused",
+    "POSTGRES_PASSWORD": "unused", "POSTGRES_DB": "unused",
+}.items():
+    os.environ.setdefault(_name, _default)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from benchmarks.load_test import API, PROJECT_ROOT  # noqa: E402
+from app.db.query_counter import QueryCountMismatch, expect_queries  # noqa: E402
+
+# Statements per request. Every authenticated request starts with the user lookup in deps.get_current_user.
+QUERY_BUDGETS: Dict[str, int] = {
+    "auth.register": 4, # username check, email check, INSERT, refresh
+    "auth.login": 1,
+    "characters.create": 4, # user, INSERT character, INSERT attributes, reload with detail joins
+    "characters.list": 2, # user, column projection
+    "characters.page": 2,
+    "characters.get": 2, # user, character joined with attributes and identity
+    "game.start": 5, # user, character, INSERT state, refresh, UPDATE with the opening scene
+    "game.choice.uncached": 3, # user, character (joined), active state; the turn itself is written behind
+    "game.choice.cached": 2, # user, session version check
+    "game.state.cached": 2,
+    "game.state.not_modified": 2, # If-None-Match answered from the cached session's version
+    "game.history": 2,
+    "game.save": 6, # user, character, write-behind flush, active state, INSERT save, refresh
+    "game.saves": 2,
+    "game.saves.page": 2,
+    "game.saves.not_modified": 2, # The same projection; only serialization and the body are skipped
+    "game.load": 4, # user, save, state, character
+    "game.state.uncached": 3,
+}
+
+
+def run(verbose: bool) -> List[str]:
+    failures: List[str] = []
+
+    def call(client: TestClient, name: str, method: str, path: str, **kwargs: Any) -> Response:
+        try:
+            with expect_queries(QUERY_BUDGETS[name], label=name) as counter:
+                response = client.request(method, path, **kwargs)
+        except QueryCountMismatch as e:
+            failures.append(str(e))
+            print(f"{name:<24}{QUERY_BUDGETS[name]:>8}{counter.count:>8}  MISMATCH")
+        else:
+            print(f"{name:<24}{QUERY_BUDGETS[name]:>8}{counter.count:>8}")
+        if verbose:
+            for statement in counter.statements:
+                print(f"    {' '.join(statement.split())[:160]}")
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+    print(f"{'request':<24}{'pinned':>8}{'actual':>8}")
+    with TestClient(__import__("app.main", fromlist=["app"]).app) as client:
+        credentials = {"username": "query_counts", "password": "query-counts-password"}
+        call(client, "auth.register", "POST", f"{API}/auth/register", json={**credentials, "email": "query_counts@example.com"})
+        token = call(client, "auth.login", "POST", f"{API}/auth/login", data=credentials).json()["data"]["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        character_id = call(client, "characters.create", "POST", f"{API}/characters/", json={"name": "道友"}, headers=headers).json()["data"]["id"]
+        call(client, "characters.list", "GET", f"{API}/characters/", headers=headers)
+        call(client, "characters.page", "GET", f"{API}/characters/page", headers=headers)
+        call(client, "characters.get", "GET", f"{API}/characters/{character_id}", headers=headers)
+
+        scene = call(client, "game.start", "POST", f"{API}/game/start", json={"character_id": character_id}, headers=headers).json()["data"]
+        for name in ("game.choice.uncached", "game.choice.cached"):
+            choice = {"character_id": character_id, "choice_id": scene["choices"][0]["id"]}
+            scene = call(client, name, "POST", f"{API}/game/choice", json=choice, headers=headers).json()["data"]
+        etag = call(client, "game.state.cached", "GET", f"{API}/game/state/{character_id}", headers=headers).headers["ETag"]
+        if call(client, "game.state.not_modified", "GET", f"{API}/game/state/{character_id}", headers={**headers, "If-None-Match": etag}).status_code != 304:
+            failures.append("game.state.not_modified: expected 304")
+        call(client, "game.history", "GET", f"{API}/game/history/{character_id}", headers=headers)
+
+        save = call(client, "game.save", "POST", f"{API}/game/save", json={"character_id": character_id, "save_name": "pinned"}, headers=headers).json()["data"]
+        etag = call(client, "game.saves", "GET", f"{API}/game/saves", headers=headers).headers["ETag"]
+        if call(client, "game.saves.not_modified", "GET", f"{API}/game/saves", headers={**headers, "If-None-Match": etag}).status_code != 304:
+            failures.append("game.saves.not_modified: expected 304")
+        call(client, "game.saves.page", "GET", f"{API}/game/saves/page", headers=headers)
+        call(client, "game.load", "POST", f"{API}/game/load", json={"save_id": save["id"]}, headers=headers)
+        call(client, "game.state.uncached", "GET", f"{API}/game/state/{character_id}", headers=headers)
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the statements of every request")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # The app resolves plugins/ and knowledge_base/ relative to the project root
+    failures = run(args.verbose)
+    for failure in failures:
+        print(f"\n{failure}")
+    print(f"\n{len(QUERY_BUDGETS) - len(failures)}/{len(QUERY_BUDGETS)} requests match their pinned statement counts")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
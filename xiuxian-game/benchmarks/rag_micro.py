@@ -0,0 +1,237 @@
+# benchmarks/rag_micro.py
+"""
+Per-stage micro-benchmarks for RAGSystem.generate_story.
+
+Times each pipeline stage separately: query building, query embedding, FAISS
+search, BM25 search, hybrid retrieval (both paths), prompt assembly (PromptBuilder), the LLM call and output parsing
+(app/core/lenient_json.py). The end-to-end generate_story call is timed too, and so are
+the synthetic corpora's index build and an incremental reload after adding one entry.
+
+Fixtures:
+  * the real knowledge_base/ corpus
+  * synthetic corpora of the same files scaled 10x / 100x / 1000x (--scales),
+    with entry names tagged per copy so documents stay distinct. Each copy is the
+    lore of its own region (front matter), as imported regional lore would be, so
+    a scoped retrieval searches the character's region, not the whole corpus
+  * story histories of 0 / 10 / 100 / 1000 events (--history-lengths)
+
+Everything runs in-process against the stub LLM and hashing embeddings, so the
+numbers reflect this code's own overhead rather than network latency.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.rag_micro
+    python -m benchmarks.rag_micro --scales 10,100 --repeat 200
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+# Settings are read at import time, so the stub backend has to be selected before importing the app
+os.environ.setdefault("LLM_BACKEND", "stub")
+for _name, _default in {
+    "SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "POSTGRES_SERVER": "unused", "POSTGRES_USER": "unused",
+    "POSTGRES_PASSWORD": "unused", "POSTGRES_DB": "unused",
+}.items():
+    os.environ.setdefault(_name, _default)
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.rag_system import RAGSystem  # noqa: E402
+
+KB_DIR = PROJECT_ROOT / "knowledge_base"
+HYBRID_QUERY = "a wandering cultivator looking for a quiet place to meditate" # Names no entry, so retrieval embeds it
+SYNTHETIC_REGION = "异域{}" # Region of synthetic copy n
+ENTRY_NAME = re.compile(r"^([^:：\n]+)([:：])", re.MULTILINE)
+
+
+def time_stage(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Runs func `repeat` times (after one warm-up call) and returns latency stats in microseconds."""
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples), 2),
+        "p50_us": round(percentile(samples, 50), 2),
+        "p95_us": round(percentile(samples, 95), 2),
+    }
+
+
+def build_synthetic_corpus(target_dir: Path, scale: int) -> int:
+    """
+    Writes `scale` distinct copies of every knowledge-base file into target_dir, copy n in region
+    SYNTHETIC_REGION.format(n), plus the stage, region and faction files as they are. Returns the file count.
+    """
+    count = 0
+    for source in KB_DIR.glob("**/*.md"):
+        text = source.read_text(encoding="utf-8")
+        relative = source.relative_to(KB_DIR)
+        if relative.as_posix() in (settings.RAG_STAGE_SOURCE, settings.RAG_REGION_SOURCE, settings.RAG_FACTION_SOURCE):
+            (target_dir / relative).parent.mkdir(parents=True, exist_ok=True)
+            (target_dir / relative).write_text(text, encoding="utf-8")
+            count += 1
+        for copy_index in range(scale):
+            destination = target_dir / relative.parent / f"{relative.stem}_{copy_index}.md"
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            # Entries are "名称: 描述" lines; tag each name so every copy embeds differently, as generated lore would
+            front_matter = f"---\nregion: {SYNTHETIC_REGION.format(copy_index)}\n---\n"
+            destination.write_text(front_matter + ENTRY_NAME.sub(rf"\g<1>·{copy_index}\g<2>", text), encoding="utf-8")
+            count += 1
+    return count
+
+
+def make_history(length: int) -> List[Dict[str, Any]]:
+    """Story events shaped like the ones the game endpoints append to story_history."""
+    return [
+        {
+            "scene_id": None,
+            "plot": f"第{i}日，你在青云山修炼，灵气如潮水般涌入经脉，隐约感到瓶颈松动。",
+            "choices_presented": [{"id": f"choice_{c}", "text": f"选项{c}：继续修炼或外出历练"} for c in range(1, 4)],
+            "action_taken": {"id": "choice_1", "text": "继续修炼"},
+            "messages": ["你感觉到修为精进了一丝。"],
+            "event_type": "choice_made",
+            "duration_applied_days": 1,
+            "date_before_event": f"Day {i}",
+            "date_after_event": f"Day {i + 1}",
+        }
+        for i in range(length)
+    ]
+
+
+CHARACTER = {
+    "id": 1, "user_id": 1, "name": "林逸", "identity_id": None, "level": 3,
+    "cultivation_stage": "炼气期三层", "experience": 120, "created_at": "2025-06-17T14:21:00",
+    "identity": None,
+    "attributes": {"strength": 12, "agility": 11, "intelligence": 14, "constitution": 10, "perception": 15, "luck": 9},
+    "cultivation": {"stage": "炼气期三层", "progress": 40, "spiritual_power": 80},
+}
+
+
+def bench_corpus(rag: RAGSystem, label: str, documents: int, history_lengths: List[int], repeat: int) -> Dict[str, Any]:
+    # The character is in the first synthetic region; the real corpus doesn't know it and ignores it
+    base_state = {"current_scene_id": "青云山脚", "current_date": "Day 3", "game_data": {"region": SYNTHETIC_REGION.format(0)}}
+    kb = rag.knowledge_base
+    query = rag._build_query(base_state, CHARACTER)
+    entity_text = rag._entity_text(base_state)
+    # Names RAG_TOP_K entries, so retrieval takes the lexical path and fills the context from them alone
+    lexical_entity_text = " ".join(ENTRY_NAME.match(kb.texts[entry_id]).group(1) for entry_id in range(settings.RAG_TOP_K))
+    query_vector = rag._embed_query(query)
+    scope = kb.metadata.scope(base_state, CHARACTER)
+    partitions = kb.select(scope)
+    context = rag._retrieve_context(query, scope, entity_text=entity_text)
+
+    result: Dict[str, Any] = {
+        "corpus": label, "documents": documents, "entries": len(kb), "partitions": len(kb.partitions),
+        "scanned_entries": sum(len(partition) for partition in partitions), "retrieval": {}, "by_history_length": {},
+    }
+    result["retrieval"]["build_query"] = time_stage(lambda: rag._build_query(base_state, CHARACTER), repeat)
+    result["retrieval"]["build_scope"] = time_stage(lambda: kb.metadata.scope(base_state, CHARACTER), repeat)
+    result["retrieval"]["embed_query"] = time_stage(lambda: rag._embed_query(query), repeat)
+    result["retrieval"]["faiss_search"] = time_stage(lambda: rag._search(kb, query_vector, settings.RAG_CANDIDATES, partitions), repeat)
+    result["retrieval"]["lexical_search"] = time_stage(lambda: rag._lexical_search(kb, query, settings.RAG_CANDIDATES, partitions), repeat)
+    # The scene names one known entry, too few to skip the fused ranking; HYBRID_QUERY names none
+    result["retrieval"]["retrieve_context"] = time_stage(lambda: rag._retrieve_context(query, scope, entity_text=entity_text), repeat)
+    result["retrieval"]["retrieve_context_lexical"] = time_stage(
+        lambda: rag._retrieve_context(query, scope, entity_text=lexical_entity_text), repeat)
+    result["retrieval"]["retrieve_context_hybrid"] = time_stage(lambda: rag._retrieve_context(HYBRID_QUERY, scope), repeat)
+
+    for length in history_lengths:
+        game_state = dict(base_state, story_history=make_history(length))
+        prompt = rag._build_prompt(game_state, CHARACTER, context)
+        prompt_text = prompt.text
+        raw_output = rag._call_llm(prompt_text)
+        result["by_history_length"][str(length)] = {
+            "prompt_chars": len(prompt_text),
+            "prompt_tokens": prompt.tokens,
+            "build_prompt": time_stage(lambda: rag._build_prompt(game_state, CHARACTER, context), repeat),
+            "llm_call": time_stage(lambda: rag._call_llm(prompt_text), repeat),
+            "parse_output": time_stage(lambda: rag._parse_llm_output(raw_output), repeat),
+            "generate_story": time_stage(lambda: rag.generate_story(game_state, CHARACTER), repeat),
+        }
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="10,100,1000", help="synthetic corpus multipliers")
+    parser.add_argument("--history-lengths", default="0,10,100,1000", help="story_history sizes to test")
+    parser.add_argument("--repeat", type=int, default=100, help="timed iterations per stage")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/rag_micro_<sha>.json)")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    history_lengths = [int(h) for h in args.history_lengths.split(",") if h]
+
+    os.chdir(PROJECT_ROOT)  # RAGSystem loads the relative knowledge_base/ directory on construction
+    rag = RAGSystem()
+    real_documents = len(list(KB_DIR.glob("**/*.md")))
+    corpora = [bench_corpus(rag, "knowledge_base", real_documents, history_lengths, args.repeat)]
+
+    for scale in scales:
+        with tempfile.TemporaryDirectory(prefix=f"xiuxian-kb-{scale}x-") as tmp_dir:
+            documents = build_synthetic_corpus(Path(tmp_dir), scale)
+            started = time.perf_counter()
+            rag.load_knowledge_base(Path(tmp_dir))
+            index_seconds = time.perf_counter() - started
+            corpus_result = bench_corpus(rag, f"synthetic_{scale}x", documents, history_lengths, args.repeat)
+            corpus_result["index_build_seconds"] = round(index_seconds, 3)
+            # Incremental reload after one new NPC: only that entry is embedded and only its file re-tagged
+            with open(Path(tmp_dir) / "characters" / "npcs_0.md", "a", encoding="utf-8") as f:
+                f.write("\n云游剑客: 四处寻访名山的剑修，据说曾在青云门外与人论剑三日。\n")
+            reload = rag.load_knowledge_base()
+            corpus_result["reload_seconds"] = reload.seconds
+            corpus_result["reload_embedded"] = reload.embedded
+            corpora.append(corpus_result)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "rag_micro",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+        },
+        "results": corpora,
+    }
+
+    print(f"{'corpus':<18}{'docs':>7}{'entries':>9}{'scanned':>9}{'embed':>10}{'search':>10}{'bm25':>10}{'retrieve':>10}{'lexical':>10}{'hybrid':>10}   (p50 us)")
+    for corpus in corpora:
+        r = corpus["retrieval"]
+        print(f"{corpus['corpus']:<18}{corpus['documents']:>7}{corpus['entries']:>9}{corpus['scanned_entries']:>9}{r['embed_query']['p50_us']:>10.1f}"
+              f"{r['faiss_search']['p50_us']:>10.1f}{r['lexical_search']['p50_us']:>10.1f}"
+              f"{r['retrieve_context']['p50_us']:>10.1f}{r['retrieve_context_lexical']['p50_us']:>10.1f}"
+              f"{r['retrieve_context_hybrid']['p50_us']:>10.1f}")
+    print(f"\n{'corpus':<18}{'build s':>9}{'reload s':>10}{'embedded':>10}   (one entry added, then reloaded)")
+    for corpus in corpora[1:]:
+        print(f"{corpus['corpus']:<18}{corpus['index_build_seconds']:>9.2f}{corpus['reload_seconds']:>10.2f}{corpus['reload_embedded']:>10}")
+    print(f"\n{'corpus':<18}{'history':>8}{'prompt':>10}{'llm':>10}{'parse':>10}{'total':>10}   (p50 us)")
+    for corpus in corpora:
+        for length, stages in corpus["by_history_length"].items():
+            print(f"{corpus['corpus']:<18}{length:>8}{stages['build_prompt']['p50_us']:>10.1f}"
+                  f"{stages['llm_call']['p50_us']:>10.1f}{stages['parse_output']['p50_us']:>10.1f}"
+                  f"{stages['generate_story']['p50_us']:>10.1f}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"rag_micro_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
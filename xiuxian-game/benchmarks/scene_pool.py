@@ -0,0 +1,156 @@
+# benchmarks/scene_pool.py
+"""
+/game/start latency with and without the pre-generated scene pool, and what fallbacks serve.
+
+Runs the app in-process (TestClient, throwaway SQLite database, stub LLM taking
+--latency-ms per call). Each mode starts --games games, one new character each,
+--gap-ms apart, after giving the pool --warmup seconds to fill:
+
+  live    SCENE_POOL_ENABLED off: every opening scene is generated on request
+  pooled  openings are drawn from the pool, which refills in the background
+          once a pair drops below SCENE_POOL_LOW_WATERMARK
+
+  p50/p95/max ms    /game/start latency
+  pooled            openings drawn from the pool; the rest were generated on request
+  fallbacks pooled  of --fallbacks generations that fail (no LLM), those that got a
+                    pooled scene rather than the default error scene
+
+Starting more games than SCENE_POOL_TARGET faster than the LLM can refill shows
+the pool running dry; --gap-ms at or above the LLM latency keeps up with it.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.scene_pool
+    python -m benchmarks.scene_pool --games 40 --gap-ms 50 --latency-ms 800
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+_DB_DIR = tempfile.mkdtemp(prefix="xiuxian-scene-pool-")
+
+# Settings are read at import time, so they have to be in place before importing the app
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{Path(_DB_DIR) / 'scene_pool.db'}")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+for _name, _default in {
+    "SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "POSTGRES_SERVER": "unused", "POSTGRES_USER": "unused",
+    "POSTGRES_PASSWORD": "unused", "POSTGRES_DB": "unused",
+}.items():
+    os.environ.setdefault(_name, _default)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+
+from benchmarks.load_test import API, PROJECT_ROOT, SERVICE_DIR, git_commit, percentile  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.scene_pool import scene_pool  # noqa: E402
+
+
+def _pool_hits(use: str) -> float:
+    return REGISTRY.get_sample_value("scene_pool_draws_total", {"use": use, "result": "hit"}) or 0.0
+
+
+def run(args: argparse.Namespace, mode: str) -> Dict[str, Any]:
+    scene_pool.enabled = mode == "pooled"
+    app = __import__("app.main", fromlist=["app"]).app
+    with TestClient(app) as client:
+        credentials = {"username": f"scene_pool_{mode}", "password": "scene-pool-password"}
+        client.post(f"{API}/auth/register", json={**credentials, "email": f"scene_pool_{mode}@example.com"})
+        token = client.post(f"{API}/auth/login", data=credentials).json()["data"]["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        character_ids = [client.post(f"{API}/characters/", json={"name": f"道友{number}"}, headers=headers).json()["data"]["id"]
+                         for number in range(args.games)]
+        time.sleep(args.warmup if mode == "pooled" else 0)
+        pool_size = scene_pool.size()
+
+        hits_before = _pool_hits("opening")
+        latencies: List[float] = []
+        for character_id in character_ids:
+            start = time.perf_counter()
+            response = client.post(f"{API}/game/start", json={"character_id": character_id}, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"/game/start -> {response.status_code}: {response.text[:200]}")
+            time.sleep(args.gap_ms / 1000)
+        hits = _pool_hits("opening") - hits_before
+
+        time.sleep(args.warmup if mode == "pooled" else 0) # Refill what the games drew
+        rag = app.state.rag_system
+        llm, rag.llm = rag.llm, None # Every generation falls back
+        character = {"name": "道友", "identity_id": None, "cultivation_stage": settings.SCENE_POOL_STAGES[0]}
+        state = {"current_scene_id": "青云山脚", "current_date": "Day 3", "story_history": [], "game_data": {}}
+        fallbacks_before = _pool_hits("fallback")
+        for _ in range(args.fallbacks):
+            rag.generate_story(state, character)
+        fallbacks_pooled = _pool_hits("fallback") - fallbacks_before
+        rag.llm = llm
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "games": len(latencies),
+        "pool_size_at_start": pool_size,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "max_ms": round(latencies[-1], 1),
+        "pooled": int(hits),
+        "fallbacks_pooled": int(fallbacks_pooled),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=16, help="games started per mode, one new character each")
+    parser.add_argument("--gap-ms", type=float, default=100.0, help="pause between game starts")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="stub LLM latency per call")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds the pool gets to fill before the first game")
+    parser.add_argument("--fallbacks", type=int, default=20, help="failing generations after the games")
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/scene_pool_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # The app resolves plugins/ and knowledge_base/ relative to the project root
+    settings.STUB_LLM_LATENCY_MS = args.latency_ms
+    rows = [run(args, mode) for mode in ("live", "pooled")]
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "scene_pool",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "games": args.games,
+            "gap_ms": args.gap_ms,
+            "latency_ms": args.latency_ms,
+            "warmup": args.warmup,
+            "target": settings.SCENE_POOL_TARGET,
+            "low_watermark": settings.SCENE_POOL_LOW_WATERMARK,
+        },
+        "results": rows,
+    }
+
+    print(f"{args.games} games, {args.gap_ms:g} ms apart; LLM {args.latency_ms:g} ms; pool target {settings.SCENE_POOL_TARGET}, "
+          f"low watermark {settings.SCENE_POOL_LOW_WATERMARK}\n")
+    print(f"{'mode':<8}{'pool size':>11}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'pooled':>8}{'fallbacks pooled':>18}")
+    for row in rows:
+        print(f"{row['mode']:<8}{row['pool_size_at_start']:>11}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['max_ms']:>9.1f}"
+              f"{row['pooled']:>8}{row['fallbacks_pooled']:>18}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"scene_pool_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
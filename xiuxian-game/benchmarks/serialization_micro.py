@@ -0,0 +1,126 @@
+# benchmarks/serialization_micro.py
+"""
+JSON serialization costs for long story histories, before and after orjson.
+
+For story histories of 10 / 100 / 1000 events (--history-lengths) it times:
+
+  column.write   story_history -> JSON text, as the engine does on every UPDATE
+                 (stdlib json.dumps vs app.core.serialization.dumps)
+  column.read    JSON text -> story_history, on every SELECT of a game state
+                 (json.loads vs orjson)
+  state.*        rendering GET /game/state's body from the cached session's data:
+                   before         GameStateInDB.model_validate, FastAPI's response_model
+                                  validate + serialize, JSONResponse (json.dumps)
+                   orjson_default the same, rendered with the ORJSONResponse default class
+                   after          GameStateInDB.model_construct + model_response
+                                  (model_dump_json, no intermediate dict)
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.serialization_micro
+    python -m benchmarks.serialization_micro --history-lengths 100,1000,5000 --repeat 50
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+
+from benchmarks.rag_micro import time_stage  # Also sets the environment the app's settings need
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.utils import create_model_field
+
+from app import schemas
+from app.core import serialization
+
+PLOT = "你在青云山脚下的坊市中穿行，药香与丹火的气息混杂。一位白发老者拦住去路，目光在你身上停留片刻，似乎看出了你体内那一缕尚未稳固的灵气。" * 3
+
+
+def build_history(events: int) -> List[Dict[str, Any]]:
+    history = []
+    for turn in range(events):
+        choices = [{"id": f"choice_{i}", "text": f"选项{i}：向老者请教修炼之道"} for i in range(1, 4)]
+        history.append({
+            "scene_id": f"scene_{turn}",
+            "plot": PLOT,
+            "choices_presented": choices,
+            "action_taken": choices[0],
+            "messages": ["修为略有精进。"],
+            "event_type": "choice_made",
+            "duration_applied_days": 1,
+            "date_before_event": f"Day {turn + 1}",
+            "date_after_event": f"Day {turn + 2}",
+        })
+    return history
+
+
+def build_state(events: int) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "id": 1, "character_id": 1, "current_scene_id": f"scene_{events}", "current_date": f"Day {events + 1}",
+        "story_history": build_history(events), "game_data": {"cultivation": {"stage": "炼气期三层", "exp": 120}},
+        "created_at": now, "updated_at": now,
+    }
+
+
+def bench(history_lengths: List[int], repeat: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    response_type = schemas.BaseResponse[schemas.GameStateInDB]
+    response_field = create_model_field(name="Response_state", type_=response_type, mode="serialization")
+
+    def state_before() -> bytes:
+        model = response_type(data=schemas.GameStateInDB.model_validate(state))
+        value, _ = response_field.validate(model, {}, loc=("response",)) # fastapi.routing.serialize_response
+        return JSONResponse(content=response_field.serialize(value)).body
+
+    def state_orjson_default() -> bytes:
+        model = response_type(data=schemas.GameStateInDB.model_validate(state))
+        value, _ = response_field.validate(model, {}, loc=("response",))
+        return ORJSONResponse(content=response_field.serialize(value)).body
+
+    def state_after() -> bytes:
+        return serialization.model_response(response_type(data=schemas.GameStateInDB.model_construct(**state))).body
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for events in history_lengths:
+        state = build_state(events)
+        history = state["story_history"]
+        stdlib_text, orjson_text = json.dumps(history), serialization.dumps(history)
+        assert json.loads(orjson_text) == history
+        assert json.loads(state_after()) == json.loads(state_before()) # Same document either way
+
+        stages = {
+            "column.write.stdlib": lambda: json.dumps(history),
+            "column.write.orjson": lambda: serialization.dumps(history),
+            "column.read.stdlib": lambda: json.loads(stdlib_text),
+            "column.read.orjson": lambda: serialization.loads(orjson_text),
+            "state.before": state_before,
+            "state.orjson_default": state_orjson_default,
+            "state.after": state_after,
+        }
+        results[str(events)] = {name: time_stage(func, repeat) for name, func in stages.items()}
+        results[str(events)]["payload_kb"] = {"history": round(len(orjson_text.encode()) / 1024, 1)}
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history-lengths", default="10,100,1000", help="comma-separated story history lengths")
+    parser.add_argument("--repeat", type=int, default=30, help="timed runs per stage")
+    args = parser.parse_args()
+
+    results = bench([int(n) for n in args.history_lengths.split(",")], args.repeat)
+    pairs = [("column.write", "column.write.stdlib", "column.write.orjson"),
+             ("column.read", "column.read.stdlib", "column.read.orjson"),
+             ("state", "state.before", "state.after")]
+    print(f"{'events':>7} {'history KB':>11} {'stage':<14}{'before p50 us':>15}{'after p50 us':>14}{'speedup':>9}")
+    for events, stages in results.items():
+        for label, before, after in pairs:
+            b, a = stages[before]["p50_us"], stages[after]["p50_us"]
+            print(f"{events:>7} {stages['payload_kb']['history']:>11} {label:<14}{b:>15.1f}{a:>14.1f}{b / a:>8.1f}x")
+        print(f"{'':>7} {'':>11} {'(orjson only)':<14}{stages['state.before']['p50_us']:>15.1f}{stages['state.orjson_default']['p50_us']:>14.1f}"
+              f"{stages['state.before']['p50_us'] / stages['state.orjson_default']['p50_us']:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# benchmarks/tail_latency.py
+"""
+Story generation tail latency and cost under the generation policy, against a flaky LLM.
+
+The stub LLM stands in for an unreliable upstream. Each call takes --latency-ms
+(±20%), except for a --slow-rate share of calls that take --slow-ms. A
+--fail-rate share raise, and a --malformed-rate share return their JSON cut
+off too early for the lenient parser to save. --players threads each generate
+--turns stories after --warmup unmeasured ones, which give the policy the
+latencies it sets the hedge delay from.
+
+  baseline      one attempt, no repair, no deadline: the pre-policy behaviour
+  retry+repair  up to STORY_MAX_ATTEMPTS calls: retries after errors, repair prompts
+  hedged        the same plus hedging at the STORY_HEDGE_PERCENTILE latency
+  deadline      hedged, with STORY_DEADLINE_SECONDS = --deadline
+
+  p50/p95/p99 ms  generation latency
+  fallbacks       generations that ended with the default error scene
+  calls/gen       LLM calls per generation, the cost
+  hedges (won)    hedge attempts made, and how many answered before the call they hedged
+  repairs         repair prompts sent
+
+With --stream every call streams its plot, and hedging goes by time to first token.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.tail_latency
+    python -m benchmarks.tail_latency --slow-rate 0.1 --slow-ms 5000 --stream
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
+from prometheus_client import REGISTRY
+from pydantic import PrivateAttr
+
+from benchmarks.load_test import PROJECT_ROOT, SERVICE_DIR, git_commit, percentile
+from benchmarks.rag_micro import CHARACTER, make_history
+from app.core.config import settings
+from app.core.generation_policy import GenerationPolicy
+from app.core.rag_system import RAGSystem
+from app.core.stub_llm import StubLLM
+
+# (label, STORY_MAX_ATTEMPTS, STORY_REPAIR, STORY_HEDGE, deadline)
+MODES = [("baseline", 1, False, False, False), ("retry+repair", 3, True, False, False),
+         ("hedged", 3, True, True, False), ("deadline", 3, True, True, True)]
+
+
+class FlakyLLM(StubLLM):
+    """StubLLM with a heavy latency tail, failed calls and truncated output."""
+
+    slow_rate: float = 0.0
+    slow_ms: float = 0.0
+    fail_rate: float = 0.0
+    malformed_rate: float = 0.0
+    seed: int = 7
+    _random: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+    _calls: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _draw(self) -> Tuple[float, bool, bool]:
+        """(latency in ms, fails, malformed) for one call."""
+        with self._lock:
+            self._calls += 1
+            draw = self._random.random
+            latency = self.slow_ms if draw() < self.slow_rate else self.latency_ms * (0.8 + 0.4 * draw())
+            return latency, draw() < self.fail_rate, draw() < self.malformed_rate
+
+    def _output(self, prompt: str, malformed: bool) -> str:
+        text = self._render(prompt)
+        return text[:len(text) * 2 // 5] if malformed else text # Cut inside the first choice
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> LLMResult:
+        latency, fail, malformed = self._draw()
+        self._busy(latency)
+        if fail:
+            raise RuntimeError("503 upstream overloaded")
+        return LLMResult(generations=[[Generation(text=self._output(prompt, malformed))] for prompt in prompts])
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        latency, fail, malformed = self._draw()
+        self._busy(latency) # Time to first token
+        if fail:
+            raise RuntimeError("503 upstream overloaded")
+        text = self._output(prompt, malformed)
+        for i in range(0, len(text), 8):
+            yield GenerationChunk(text=text[i:i + 8])
+
+
+def _attempts(kind: str, result: str) -> float:
+    return REGISTRY.get_sample_value("story_llm_attempts_total", {"kind": kind, "result": result}) or 0.0
+
+
+def _fallbacks() -> float:
+    return sum(REGISTRY.get_sample_value("story_generation_fallbacks_total", {"reason": reason}) or 0.0
+               for reason in ("llm_error", "deadline", "json_error", "structure_error", "unexpected_error"))
+
+
+def run(args: argparse.Namespace, mode: str) -> Dict[str, Any]:
+    rag = RAGSystem()
+    rag.policy = GenerationPolicy.from_settings()
+    rag.llm = FlakyLLM(latency_ms=args.latency_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                       fail_rate=args.fail_rate, malformed_rate=args.malformed_rate, seed=args.seed)
+    game_state = {"current_scene_id": "青云山脚", "current_date": "Day 3", "story_history": make_history(10), "game_data": {}}
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def player(number: int, turns: int, measured: bool) -> None:
+        character = dict(CHARACTER, name=f"{CHARACTER['name']}{number}")
+        for turn in range(turns):
+            state = dict(game_state, current_date=f"Day {turn}") # A new prompt every turn
+            start = time.perf_counter()
+            rag.generate_story(state, character, on_plot_delta=(lambda delta: None) if args.stream else None)
+            if measured:
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+    def play(turns: int, measured: bool) -> None:
+        threads = [threading.Thread(target=player, args=(number, turns, measured)) for number in range(args.players)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    play(max(1, args.warmup // args.players), measured=False)
+    calls_before, fallbacks_before = rag.llm.calls, _fallbacks()
+    hedges_before = {result: _attempts("hedge", result) for result in ("won", "lost", "failed")}
+    repairs_before = sum(_attempts("repair", result) for result in ("won", "lost", "failed"))
+    play(args.turns, measured=True)
+    time.sleep(args.slow_ms / 1000) # Let abandoned attempts finish, so their calls are counted
+    latencies.sort()
+    hedges = {result: _attempts("hedge", result) - before for result, before in hedges_before.items()}
+    return {
+        "mode": mode,
+        "generations": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "fallbacks": int(_fallbacks() - fallbacks_before),
+        "calls_per_generation": round((rag.llm.calls - calls_before) / len(latencies), 3),
+        "hedges": int(sum(hedges.values())),
+        "hedges_won": int(hedges["won"]),
+        "repairs": int(sum(_attempts("repair", result) for result in ("won", "lost", "failed")) - repairs_before),
+        "hedge_delay_ms": round((rag.policy.hedge_delay(args.stream) or 0.0) * 1000, 1) if settings.STORY_HEDGE else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=8, help="players generating stories concurrently")
+    parser.add_argument("--turns", type=int, default=25, help="measured stories per player")
+    parser.add_argument("--warmup", type=int, default=40, help="unmeasured stories before each run, in total")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="usual stub LLM latency per call")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of calls that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=3000.0, help="latency of a slow call")
+    parser.add_argument("--fail-rate", type=float, default=0.03, help="share of calls that raise")
+    parser.add_argument("--malformed-rate", type=float, default=0.03, help="share of calls whose output is cut off")
+    parser.add_argument("--deadline", type=float, default=1.5, help="STORY_DEADLINE_SECONDS of the deadline run")
+    parser.add_argument("--stream", action="store_true", help="stream every plot, as the WebSocket channel does")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="result JSON path (default: benchmarks/results/tail_latency_<sha>.json)")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_ROOT) # RAGSystem loads the relative knowledge_base/ directory on construction
+    settings.STORY_COALESCE = False # Measure the policy alone
+    rows = []
+    for mode, max_attempts, repair, hedge, deadline in MODES:
+        settings.STORY_MAX_ATTEMPTS, settings.STORY_REPAIR, settings.STORY_HEDGE = max_attempts, repair, hedge
+        settings.STORY_DEADLINE_SECONDS = args.deadline if deadline else 0.0
+        rows.append(run(args, mode))
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "benchmark": "tail_latency",
+            "git_commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "players": args.players,
+            "turns": args.turns,
+            "latency_ms": args.latency_ms,
+            "slow_rate": args.slow_rate,
+            "slow_ms": args.slow_ms,
+            "fail_rate": args.fail_rate,
+            "malformed_rate": args.malformed_rate,
+            "deadline": args.deadline,
+            "stream": args.stream,
+            "hedge_percentile": settings.STORY_HEDGE_PERCENTILE,
+            "hedge_budget": settings.STORY_HEDGE_BUDGET,
+        },
+        "results": rows,
+    }
+
+    print(f"{args.players} players x {args.turns} stories; LLM {args.latency_ms:g} ms, {args.slow_rate:.0%} take {args.slow_ms:g} ms, "
+          f"{args.fail_rate:.0%} fail, {args.malformed_rate:.0%} malformed{', streaming' if args.stream else ''}\n")
+    print(f"{'mode':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'fallbacks':>11}{'calls/gen':>11}{'hedges (won)':>14}{'repairs':>9}")
+    for row in rows:
+        print(f"{row['mode']:<14}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['fallbacks']:>11}"
+              f"{row['calls_per_generation']:>11.3f}{row['hedges']:>8} ({row['hedges_won']}){row['repairs']:>9}")
+
+    output = Path(args.output) if args.output else SERVICE_DIR / "benchmarks" / "results" / f"tail_latency_{(commit or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
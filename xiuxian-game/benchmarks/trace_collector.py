@@ -0,0 +1,113 @@
+# benchmarks/trace_collector.py
+"""
+Minimal stand-in for an OpenTelemetry collector, plus a span summariser.
+
+`serve` accepts OTLP/JSON on POST /v1/traces (what app.core.tracing's
+OTLPHttpSpanExporter sends) and appends each payload to a JSON-lines file.
+`summarize` reads such a file (or one written directly with TRACE_EXPORT_PATH)
+and prints count / p50 / p95 / total milliseconds per span name.
+
+Usage, from the xiuxian-game directory:
+
+    python -m benchmarks.trace_collector serve --port 4318 --output traces.jsonl
+    # in the app's environment:
+    #   TRACING_ENABLED=true TRACE_EXPORT_ENDPOINT=http://127.0.0.1:4318/v1/traces
+    python -m benchmarks.trace_collector summarize traces.jsonl
+"""
+import argparse
+import json
+import sys
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from benchmarks.load_test import percentile
+
+
+def iter_spans(path: Path) -> Iterator[dict]:
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    yield from scope_spans.get("spans", [])
+
+
+def summarize(path: Path) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for span in iter_spans(path):
+        elapsed_ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+        durations[span["name"]].append(elapsed_ms)
+
+    summary = {}
+    for name, samples in durations.items():
+        samples.sort()
+        summary[name] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "total_ms": round(sum(samples), 3),
+        }
+    return summary
+
+
+def serve(port: int, output: Path) -> None:
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                self.send_error(400, "expected OTLP/JSON")
+                return
+            with lock, output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"collecting OTLP/JSON on http://127.0.0.1:{port}/v1/traces -> {output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the OTLP/HTTP stand-in collector")
+    serve_parser.add_argument("--port", type=int, default=4318)
+    serve_parser.add_argument("--output", default="traces.jsonl")
+    summarize_parser = commands.add_parser("summarize", help="print per-span latency stats")
+    summarize_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, Path(args.output))
+        return 0
+
+    summary = summarize(Path(args.path))
+    print(f"{'span':<44}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>12}")
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+        print(f"{name:<44}{stats['count']:>8}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['total_ms']:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
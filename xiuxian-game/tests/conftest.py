@@ -0,0 +1,75 @@
+# tests/conftest.py
+"""
+Shared setup: a throwaway SQLite database and the stub LLM, in place before the app is imported.
+
+Run from the xiuxian-game directory:
+
+    python -m pytest -q
+"""
+import itertools
+import os
+import tempfile
+from pathlib import Path
+
+_DB_DIR = tempfile.mkdtemp(prefix="xiuxian-tests-")
+
+# Settings are read at import time, so they have to be in place before importing the app
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{Path(_DB_DIR) / 'tests.db'}")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("KB_INDEX_STORE", "false") # Keep tests from writing knowledge_base/.index
+for _name, _default in {
+    "SECRET_KEY": "test-secret-key-test-secret-key",
+    "OPENAI_API_KEY": "sk-test",
+    "POSTGRES_SERVER": "unused", "POSTGRES_USER": "unused",
+    "POSTGRES_PASSWORD": "unused", "POSTGRES_DB": "unused",
+}.items():
+    os.environ.setdefault(_name, _default)
+
+import pytest  # noqa: E402
+
+from app import crud, schemas  # noqa: E402
+from app.core.rag_system import RAGSystem  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.models import Base, User  # noqa: E402
+
+KB_DIR = Path(__file__).resolve().parents[2] / "knowledge_base"
+
+_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _tables():
+    Base.metadata.create_all(bind=engine)
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_character(db):
+    """Creates a user's character with an active game state; returns (user_id, character_id, game_state_id)."""
+    def make(name: str = "道友"):
+        number = next(_numbers)
+        user = User(username=f"player{number}", email=f"player{number}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        character = crud.crud_character.create_character(db, schemas.CharacterCreate(name=name), user_id=user.id)
+        game_state = crud.crud_game.create_game_state(db, character_id=character.id)
+        return user.id, character.id, game_state.id
+    return make
+
+
+@pytest.fixture(scope="session")
+def rag():
+    """A RAGSystem with the shipped knowledge base and the stub LLM."""
+    rag = RAGSystem()
+    rag.load_knowledge_base(KB_DIR)
+    return rag
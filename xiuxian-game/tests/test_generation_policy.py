@@ -0,0 +1,48 @@
+# tests/test_generation_policy.py
+import threading
+from contextvars import ContextVar
+
+import pytest
+
+from app.core.generation_policy import DeadlineExceeded, GenerationPolicy
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="")
+
+
+def _policy(deadline: float = 5.0, workers: int = 4) -> GenerationPolicy:
+    return GenerationPolicy(deadline=deadline, max_attempts=3, hedge=False, hedge_percentile=90.0, hedge_min_samples=20,
+                            hedge_min_delay=0.05, hedge_budget=0.15, workers=workers)
+
+
+def test_attempts_see_the_callers_context():
+    policy = _policy()
+    _request_id.set("req-1")
+    assert policy.call(policy.budget(), lambda emit: _request_id.get()) == "req-1"
+    policy.shutdown()
+
+
+def test_failed_attempt_is_retried():
+    policy, calls = _policy(), []
+
+    def flaky(emit):
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            raise RuntimeError("LLM hiccup")
+        return "scene"
+
+    assert policy.call(policy.budget(), flaky) == "scene"
+    assert len(calls) == 2 and all(name.startswith("story-attempt") for name in calls)
+    policy.shutdown()
+
+
+def test_attempts_wait_for_a_free_worker_within_the_deadline():
+    policy = _policy(deadline=0.2, workers=1)
+    release = threading.Event()
+    # Occupies the only worker with an attempt that outlives its caller
+    with pytest.raises(DeadlineExceeded):
+        policy.call(policy.budget(), lambda emit: release.wait(5) and "late")
+    with pytest.raises(DeadlineExceeded): # Queued behind the abandoned attempt, never started
+        policy.call(policy.budget(), lambda emit: "scene")
+    release.set()
+    assert policy.call(policy.budget(), lambda emit: "scene") == "scene"
+    policy.shutdown()
@@ -0,0 +1,52 @@
+# tests/test_knowledge_index.py
+import numpy as np
+from langchain.docstore.document import Document
+
+from app.core.config import settings
+from app.core.knowledge_index import KnowledgeIndex, KnowledgeMetadata, RetrievalScope
+
+STAGES = [["炼气期"], ["筑基期"]]
+REGIONS = {"青云山脉": "青云山脉", "青云山": "青云山脉", "十万大山": "十万大山"}
+FACTIONS = {"青云门": "青云门", "万魔宗": "万魔宗"}
+
+
+def _entry(text: str, source: str = "other.md") -> Document:
+    return Document(page_content=text, metadata={"source": source, "entry": text.split(":")[0]})
+
+
+def _tags(text: str, source: str = "other.md"):
+    return KnowledgeMetadata(STAGES, REGIONS, FACTIONS).tag(_entry(text, source))
+
+
+def test_region_and_faction_entries_are_tagged_by_what_they_define():
+    assert _tags("青云山脉/青云山: 灵气充沛，青云门所在。", settings.RAG_REGION_SOURCE) == (None, "青云山脉", None)
+    assert _tags("万魔宗: 魔道巨擘，与正道门派常有冲突。", settings.RAG_FACTION_SOURCE) == (None, None, "万魔宗")
+    # A faction with a home region is that region's lore
+    assert _tags("青云门: 正道大派，位于青云山。", settings.RAG_FACTION_SOURCE) == (None, "青云山脉", None)
+    # Other entries are tagged by what they name
+    assert _tags("青云剑诀: 青云门的入门剑法，筑基期可成。") == (1, None, "青云门")
+
+
+def test_region_and_faction_combine_with_and():
+    entries = [_entry(text) for text in ("甲: 十万大山中的万魔宗分舵。", "乙: 十万大山的妖兽。", "丙: 万魔宗的功法。", "丁: 传闻。")]
+    metadata = KnowledgeMetadata(STAGES, REGIONS, FACTIONS)
+    for entry in entries:
+        metadata.tag(entry)
+    index = KnowledgeIndex.build(entries, np.eye(len(entries), dtype=np.float32), metadata)
+
+    def names(scope):
+        return sorted(index.names[entry_id] for partition in index.select(scope) for entry_id in range(partition.start, partition.end))
+
+    assert names(RetrievalScope(regions=["十万大山"])) == ["丁", "乙"]
+    assert names(RetrievalScope(factions=["万魔宗"])) == ["丁", "丙"]
+    assert names(RetrievalScope(regions=["十万大山"], factions=["万魔宗"])) == ["丁", "丙", "乙", "甲"]
+
+
+def test_realistic_scope_selects_fewer_than_all_entries(rag):
+    kb = rag.knowledge_base
+    game_state = {"current_scene_id": "青云山脚", "story_history": [{"plot": "你在青云山修炼。"}], "game_data": {}}
+    scope = kb.metadata.scope(game_state, {"cultivation_stage": "炼气期三层"})
+    scanned = sum(len(partition) for partition in kb.select(scope))
+    assert scanned < len(kb) * 0.6
+    untagged = sum(len(partition) for partition in kb.partitions if (partition.region, partition.faction, partition.stage) == (None, None, None))
+    assert untagged < len(kb) * 0.6
@@ -0,0 +1,32 @@
+# tests/test_knowledge_watcher.py
+import time
+
+from app.services.knowledge_watcher import KnowledgeBaseWatcher
+
+
+class _CountingRAG:
+    def __init__(self, kb_dir):
+        self.kb_dir = kb_dir
+        self.loads = 0
+
+    def load_knowledge_base(self):
+        self.loads += 1
+        return object()
+
+
+def test_reindex_is_not_reloaded_by_its_own_trigger(tmp_path):
+    (tmp_path / "lore.md").write_text("青云门: 正道大派。", encoding="utf-8")
+    rag = _CountingRAG(tmp_path)
+    watcher = KnowledgeBaseWatcher(interval=0.01, trigger_name=".reindex")
+    watcher.start(rag)
+    try:
+        watcher.reindex()
+        time.sleep(0.1) # Several polls
+        assert rag.loads == 1
+        (tmp_path / "lore.md").write_text("青云门: 正道大派，以剑法闻名。", encoding="utf-8")
+        deadline = time.monotonic() + 5
+        while rag.loads == 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert rag.loads == 2 # Other changes still reload
+    finally:
+        watcher.shutdown()
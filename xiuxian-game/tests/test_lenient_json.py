@@ -0,0 +1,63 @@
+# tests/test_lenient_json.py
+import json
+import math
+
+import pytest
+
+from app.core.lenient_json import loads_object
+from app.core.metrics import OUTPUT_REPAIRS
+
+# (reply, parsed object, repairs recorded)
+REPAIRS = [
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}, {"trailing_comma"}),
+    ('{"a": 1,, "b": 2}', {"a": 1, "b": 2}, {"trailing_comma"}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}, {"missing_comma"}),
+    ('{"a": ["x" "y"]}', {"a": ["x", "y"]}, {"missing_comma"}),
+    ('{"a": "x" "b": "y"}', {"a": "x", "b": "y"}, {"missing_comma"}),
+    ('{plot: "p", duration_days: 2}', {"plot": "p", "duration_days": 2}, {"unquoted_key"}),
+    ("{'plot': 'p'}", {"plot": "p"}, {"single_quotes"}),
+    ('{"plot": "he said "go" to me"}', {"plot": 'he said "go" to me'}, {"unescaped_quote"}),
+    ('{"a": True, "b": None}', {"a": True, "b": None}, {"python_literal"}),
+    ('{"a": 1 // one\n, /* two */ "b": 2}', {"a": 1, "b": 2}, {"comment"}),
+    ('{"plot": "line\nbreak"}', {"plot": "line\nbreak"}, {"control_char"}),
+    ('{"plot": "it\\\'s \\x"}', {"plot": "it's x"}, {"bad_escape"}),
+    ('{“plot”： “p”， "a"：1}', {"plot": "p", "a": 1}, {"fullwidth_punctuation"}),
+    ('{"duration_days": 03}', {"duration_days": 3}, {"number"}),
+    ('{"plot": "p", "choices": ["a", "b', {"plot": "p", "choices": ["a", "b"]}, {"truncated"}),
+    ('{"plot": "p", "duration_days":', {"plot": "p"}, {"truncated"}),
+    ('{"a": tr', {"a": True}, {"truncated"}),
+    ('```json\n{"a": 1,}\n``` Hope this helps!', {"a": 1}, {"trailing_comma"}),
+]
+
+
+@pytest.mark.parametrize("reply, expected, repairs", REPAIRS)
+def test_repairs(reply, expected, repairs):
+    assert loads_object(reply) == (expected, repairs)
+    assert repairs <= set(OUTPUT_REPAIRS) # Every kind has its metric label
+
+
+@pytest.mark.parametrize("reply", ['{"a": NaN}', '{"a": Infinity}', '{"a": -Infinity}'])
+def test_non_finite_numbers_are_repairs(reply):
+    parsed, repairs = loads_object(reply)
+    assert repairs == {"number"}
+    assert not math.isfinite(parsed["a"])
+
+
+@pytest.mark.parametrize("duration", ["Infinity", "-Infinity", "1e999", "NaN"])
+def test_non_finite_duration_defaults_to_one_day(rag, duration):
+    scene = rag._parse_llm_output(f'{{"plot": "p", "choices": ["a", "b", "c"], "duration_days": {duration}}}')
+    assert scene.plot == "p" and scene.duration_days == 1
+
+
+@pytest.mark.parametrize("reply", [
+    '{"plot": "p", "choices": [{"id": "choice_1", "text": "t"}], "duration_days": 2}',
+    'Here you go:\n```json\n{"a": [0, -0.5, 1e3], "b": "\\u6c14"}\n```',
+])
+def test_well_formed_output_has_no_repairs(reply):
+    assert loads_object(reply)[1] == set()
+
+
+@pytest.mark.parametrize("reply", ["no object here", '{"a": [}', '{"a": @}'])
+def test_unreadable_output_raises(reply):
+    with pytest.raises(json.JSONDecodeError):
+        loads_object(reply)
@@ -0,0 +1,124 @@
+# tests/test_llm_scheduler.py
+import threading
+import time
+
+import pytest
+from langchain_core.outputs import Generation, LLMResult
+
+from app.core.llm_scheduler import GenerationScheduler
+
+
+class _RecordingLLM:
+    """Records each batch it is sent; holds the first one until `release` is set."""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.release = threading.Event()
+        self.fail = fail
+
+    def generate(self, prompts):
+        self.batches.append(list(prompts))
+        if len(self.batches) == 1:
+            self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("model server down")
+        return LLMResult(generations=[[Generation(text=f"re:{prompt}")] for prompt in prompts])
+
+
+def _scheduler(llm, max_batch_size=2, max_wait=0.01, background_max_wait=60.0):
+    return GenerationScheduler(llm, max_batch_size=max_batch_size, max_wait=max_wait,
+                               background_max_wait=background_max_wait, concurrency=1)
+
+
+def _submit(scheduler, prompt, lane, results):
+    def run():
+        try:
+            results[prompt] = scheduler.generate(prompt, lane)
+        except Exception as e:
+            results[prompt] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _occupy(scheduler, llm, results):
+    """Sends one prompt and holds it in the LLM, so later prompts queue up behind the only batch slot."""
+    thread = _submit(scheduler, "first", "interactive", results)
+    _wait_until(lambda: llm.batches)
+    return thread
+
+
+def test_interactive_prompts_go_first():
+    llm, results = _RecordingLLM(), {}
+    scheduler = _scheduler(llm)
+    threads = [_occupy(scheduler, llm, results)]
+    for prompt, lane in (("b1", "background"), ("b2", "background"), ("i1", "interactive"), ("i2", "interactive")):
+        threads.append(_submit(scheduler, prompt, lane, results))
+    _wait_until(lambda: scheduler.queued() == {"interactive": 2, "background": 2})
+    llm.release.set()
+    for thread in threads:
+        thread.join()
+    scheduler.shutdown()
+
+    assert [sorted(batch) for batch in llm.batches] == [["first"], ["i1", "i2"], ["b1", "b2"]]
+    assert results["b2"] == "re:b2" # Each caller gets the completion of its own prompt
+
+
+def test_overdue_background_prompt_gets_a_slot():
+    llm, results = _RecordingLLM(), {}
+    scheduler = _scheduler(llm, background_max_wait=0.05)
+    threads = [_occupy(scheduler, llm, results), _submit(scheduler, "b1", "background", results)]
+    for prompt in ("i1", "i2", "i3"):
+        threads.append(_submit(scheduler, prompt, "interactive", results))
+    _wait_until(lambda: scheduler.queued() == {"interactive": 3, "background": 1})
+    time.sleep(0.1) # b1 is overdue by the time the slot frees up
+    llm.release.set()
+    for thread in threads:
+        thread.join()
+    scheduler.shutdown()
+
+    assert llm.batches[1][0] == "b1" and llm.batches[1][1].startswith("i")
+    assert sorted(prompt for batch in llm.batches for prompt in batch) == ["b1", "first", "i1", "i2", "i3"]
+
+
+def test_lanes_wait_their_own_maximum():
+    llm = _RecordingLLM()
+    llm.release.set()
+    scheduler = _scheduler(llm, max_batch_size=8, max_wait=0.01, background_max_wait=0.3)
+    started = time.monotonic()
+    scheduler.generate("i1", "interactive")
+    interactive_wait = time.monotonic() - started
+    started = time.monotonic()
+    scheduler.generate("b1", "background")
+    background_wait = time.monotonic() - started
+    scheduler.shutdown()
+
+    assert interactive_wait < 0.2
+    assert background_wait >= 0.3
+
+
+def test_batch_failure_reaches_every_caller():
+    llm, results = _RecordingLLM(fail=True), {}
+    scheduler = _scheduler(llm)
+    threads = [_occupy(scheduler, llm, results)]
+    threads += [_submit(scheduler, prompt, "interactive", results) for prompt in ("i1", "i2")]
+    _wait_until(lambda: scheduler.queued()["interactive"] == 2)
+    llm.release.set()
+    for thread in threads:
+        thread.join()
+    scheduler.shutdown()
+    assert all(isinstance(results[prompt], RuntimeError) for prompt in ("first", "i1", "i2"))
+
+
+def test_unknown_lane_is_rejected():
+    scheduler = _scheduler(_RecordingLLM())
+    with pytest.raises(ValueError):
+        scheduler.generate("prompt", "urgent")
+    scheduler.shutdown()
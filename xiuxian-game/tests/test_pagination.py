@@ -0,0 +1,75 @@
+# tests/test_pagination.py
+from datetime import datetime
+
+import pytest
+
+from app import crud, schemas
+from app.models.game_models import GameSave
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def test_cursor_round_trip():
+    key = (datetime(2025, 6, 17, 14, 21, 0, 123456), 42)
+    cursor = encode_cursor(key)
+    assert "=" not in cursor # Padding is stripped; the cursor goes in a query string
+    assert decode_cursor(cursor, (datetime, int)) == key
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    encode_cursor([1, 2]), # Wrong number of values
+    encode_cursor(["1"]), # Wrong type
+    encode_cursor([True]), # bool is not an id
+    "",
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (int,))
+
+
+def test_keyset_page_flags():
+    rows = list(range(1, 5))
+    items, pagination = keyset_page(rows, 3, None, sort_key=lambda row: (row,))
+    assert items == [1, 2, 3]
+    assert pagination.has_next and not pagination.has_prev
+    assert decode_cursor(pagination.next_cursor, (int,)) == (3,)
+
+    items, pagination = keyset_page(rows[:2], 3, "cursor", sort_key=lambda row: (row,))
+    assert items == [1, 2]
+    assert not pagination.has_next and pagination.has_prev and pagination.next_cursor is None
+
+
+def test_character_pages_cover_every_character_once(db, make_character):
+    user_id, _, _ = make_character("甲")
+    for name in ("乙", "丙", "丁", "戊"):
+        crud.crud_character.create_character(db, schemas.CharacterCreate(name=name), user_id=user_id)
+
+    seen, after_id = [], None
+    while True:
+        rows = crud.crud_character.get_character_summaries_by_user(db, user_id, limit=2 + 1, after_id=after_id)
+        items, pagination = keyset_page(rows, 2, after_id, sort_key=lambda row: (row.id,))
+        seen += [row.name for row in items]
+        if not pagination.has_next:
+            break
+        (after_id,) = decode_cursor(pagination.next_cursor, (int,))
+    assert seen == ["甲", "乙", "丙", "丁", "戊"]
+
+
+def test_save_pages_break_created_at_ties_by_id(db, make_character):
+    user_id, character_id, game_state_id = make_character()
+    created_at = datetime(2025, 1, 1) # Every save in the same instant: only the id orders them
+    saves = [GameSave(user_id=user_id, character_id=character_id, game_state_id=game_state_id, save_name=f"save{n}", created_at=created_at)
+             for n in range(5)]
+    db.add_all(saves)
+    db.commit()
+    expected = [save.id for save in sorted(saves, key=lambda save: save.id, reverse=True)]
+
+    seen, before = [], None
+    while True:
+        rows = crud.crud_game.get_game_save_rows_by_user(db, user_id, limit=2 + 1, before=before)
+        items, pagination = keyset_page(rows, 2, before, sort_key=lambda row: (row.created_at, row.id))
+        seen += [row.id for row in items]
+        if not pagination.has_next:
+            break
+        before = decode_cursor(pagination.next_cursor, (datetime, int))
+    assert seen == expected
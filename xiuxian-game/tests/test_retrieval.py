@@ -0,0 +1,44 @@
+# tests/test_retrieval.py
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.core.rag_system import RAGSystem
+from app.services.scene_pool import OPENING_STATE
+
+CHARACTER = {"name": "道友", "cultivation_stage": "炼气期一层"}
+
+
+def _paths(path: str) -> float:
+    return REGISTRY.get_sample_value("rag_retrievals_total", {"path": path}) or 0.0
+
+
+def _retrieve(rag: RAGSystem, game_state):
+    kb = rag.knowledge_base
+    query = rag._build_query(game_state, CHARACTER)
+    return rag._retrieve_context(query, kb.metadata.scope(game_state, CHARACTER), kb, rag._entity_text(game_state)).split("\n")
+
+
+def test_stage_in_query_does_not_take_lexical_path(rag):
+    # Regression: the stage is in every query, so every retrieval matched it and skipped the fused ranking
+    hybrid_before, lexical_before = _paths("hybrid"), _paths("lexical")
+    entries = _retrieve(rag, OPENING_STATE)
+    assert len(entries) == settings.RAG_TOP_K
+    assert _paths("hybrid") == hybrid_before + 1
+    assert _paths("lexical") == lexical_before
+
+
+def test_scene_naming_a_place_or_sect_takes_lexical_path(rag, monkeypatch):
+    monkeypatch.setattr(rag, "_embed_query", lambda query: pytest.fail("embedded a query naming known entries"))
+    for scene, first in (("青云山脚", "青云山脉"), ("青云门外", "青云门")):
+        lexical_before = _paths("lexical")
+        entries = _retrieve(rag, dict(OPENING_STATE, current_scene_id=scene))
+        assert _paths("lexical") == lexical_before + 1
+        assert entries[0].startswith(first)
+        assert 1 < len(entries) <= settings.RAG_TOP_K # BM25 matches fill the slots the named entries leave
+
+
+def test_plot_naming_only_a_stage_takes_hybrid_path(rag):
+    hybrid_before = _paths("hybrid")
+    _retrieve(rag, dict(OPENING_STATE, story_history=[{"plot": "你终于踏入了筑基期。"}]))
+    assert _paths("hybrid") == hybrid_before + 1
@@ -0,0 +1,47 @@
+# tests/test_scene_pool.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app.db.session import engine
+from app.services.scene_pool import PLACEHOLDER_NAME, ScenePool, _scenes
+
+STAGE = "测试期" # Keeps these rows apart from any other test's
+CHARACTER = {"name": "林逸", "identity_id": None, "cultivation_stage": STAGE}
+
+
+def _pool() -> ScenePool:
+    return ScenePool(enabled=True, stages=[STAGE], target=2, low_watermark=0, refill_interval=60.0, claim_ttl=300.0)
+
+
+def _store_scene(plot: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(_scenes.insert().values(identity_id=None, cultivation_stage=STAGE, plot=plot,
+                                             choices=[{"id": "choice_1", "text": "前行"}], duration_days=1))
+
+
+def _stored() -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(_scenes).where(_scenes.c.cultivation_stage == STAGE)).scalar()
+
+
+def test_drawn_scene_is_personalized_and_deleted():
+    _store_scene(f"{PLACEHOLDER_NAME}踏上青云山。")
+    pool = _pool()
+    assert pool._claim((None, STAGE), 2) == 1
+    assert pool.draw(CHARACTER).plot == "林逸踏上青云山。"
+    assert _stored() == 0
+    assert pool.draw(CHARACTER) is None
+
+
+def test_scene_taken_over_after_the_claim_expired_is_served_once():
+    _store_scene("山门前。")
+    slow, other = _pool(), _pool()
+    assert slow._claim((None, STAGE), 2) == 1
+    with engine.begin() as conn: # The slow worker missed its heartbeats
+        conn.execute(update(_scenes).where(_scenes.c.owner == slow.owner).values(claimed_at=datetime.utcnow() - timedelta(hours=1)))
+    assert other._claim((None, STAGE), 2) == 1 # Both now hold the scene in memory
+
+    assert other.draw(CHARACTER).plot == "山门前。"
+    assert slow.draw(CHARACTER) is None # Its DELETE finds no row
+    assert slow.size() == 0 and _stored() == 0
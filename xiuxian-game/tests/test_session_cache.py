@@ -0,0 +1,98 @@
+# tests/test_session_cache.py
+import time
+
+from sqlalchemy import select
+
+from app.db.session import engine
+from app.models.game_models import GameState
+from app.services.session_cache import SessionCache
+
+
+def _cache(max_sessions: int = 10, flush_delay: float = 3600.0) -> SessionCache:
+    return SessionCache(max_sessions=max_sessions, idle_seconds=3600.0, flush_delay=flush_delay, version_check=False)
+
+
+def _play_turn(session, plot: str) -> None:
+    """What GameSession.make_choice does to the state, without the LLM and plugins."""
+    with session.state_lock:
+        session.game_state.story_history = list(session.game_state.story_history or []) + [{"plot": plot}]
+        session.version += 1
+
+
+def _stored(game_state_id: int):
+    with engine.connect() as conn:
+        return conn.execute(select(GameState.story_history, GameState.version).where(GameState.id == game_state_id)).one()
+
+
+def test_turn_on_evicted_session_is_flushed(db, make_character):
+    # Regression: a session evicted while its turn was running lost the turn
+    user_id, first_id, first_state = make_character()
+    other_user, second_id, _ = make_character()
+    cache = _cache(max_sessions=1)
+    session = cache.get(db, first_id, user_id)
+
+    cache.get(db, second_id, other_user) # Evicts the first session (LRU)
+    assert cache.peek(db, first_id, user_id) is None
+    _play_turn(session, "洞府中悟道")
+    cache.mark_dirty(session)
+    cache.shutdown()
+
+    history, version = _stored(first_state)
+    assert history == [{"plot": "洞府中悟道"}]
+    assert version == session.version
+
+
+def test_turn_after_discard_is_flushed(db, make_character):
+    user_id, character_id, game_state_id = make_character()
+    cache = _cache()
+    session = cache.get(db, character_id, user_id)
+    cache.discard(character_id)
+    _play_turn(session, "下山")
+    cache.mark_dirty(session)
+    cache.flush_all()
+    assert _stored(game_state_id).story_history == [{"plot": "下山"}]
+
+
+def test_session_with_turn_in_progress_is_not_evicted(db, make_character):
+    user_id, first_id, _ = make_character()
+    other_user, second_id, _ = make_character()
+    cache = _cache(max_sessions=1)
+    session = cache.get(db, first_id, user_id)
+    with session.turn_lock:
+        cache.get(db, second_id, other_user)
+        assert cache.peek(db, first_id, user_id) is session
+    cache.get(db, second_id, other_user) # Over capacity again once the turn is done
+    assert cache.peek(db, first_id, user_id) is None
+    cache.shutdown()
+
+
+def test_write_behind_flushes_after_delay(db, make_character):
+    user_id, character_id, game_state_id = make_character()
+    cache = _cache(flush_delay=0.05)
+    session = cache.get(db, character_id, user_id)
+    _play_turn(session, "第一回合")
+    _play_turn(session, "第二回合")
+    cache.mark_dirty(session)
+    assert _stored(game_state_id).story_history == [] # Not yet written
+
+    deadline = time.monotonic() + 5
+    while session.dirty and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert _stored(game_state_id).story_history == [{"plot": "第一回合"}, {"plot": "第二回合"}]
+    cache.shutdown()
+
+
+def test_stale_flush_loses_compare_and_set(db, make_character):
+    user_id, character_id, game_state_id = make_character()
+    first, second = _cache(), _cache() # Two workers with the same character cached
+    mine = first.get(db, character_id, user_id)
+    theirs = second.get(db, character_id, user_id)
+    _play_turn(theirs, "他处的回合")
+    second.mark_dirty(theirs)
+    second.flush_all()
+    _play_turn(mine, "过时的回合")
+    first.mark_dirty(mine)
+    first.flush_all()
+
+    assert _stored(game_state_id).story_history == [{"plot": "他处的回合"}]
+    assert first.peek(db, character_id, user_id) is None # Evicted: the database wins
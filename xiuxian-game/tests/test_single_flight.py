@@ -0,0 +1,122 @@
+# tests/test_single_flight.py
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.rag_system import CHARACTER_NAME_TOKEN, _TokenStream
+from app.core.single_flight import SingleFlight
+
+GAME_STATE = {"current_scene_id": "青云山脚", "current_date": "Day 3", "story_history": [], "game_data": {}}
+
+
+def _burst(flights: SingleFlight, count: int, func, on_deltas=None, share_deltas: bool = True):
+    """count concurrent do("key", func) calls, the first one the leader. Returns [(result, shared) or exception]."""
+    results = [None] * count
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_func(emit):
+        started.set()
+        release.wait(5) # Until the followers have joined
+        return func(emit)
+
+    def run(number):
+        on_delta = on_deltas[number] if on_deltas else None
+        try:
+            results[number] = flights.do("key", leader_func if number == 0 else func, on_delta=on_delta, share_deltas=share_deltas)
+        except Exception as e:
+            results[number] = e
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_run():
+    runs = []
+    results = _burst(SingleFlight(), 5, lambda emit: runs.append(1) or "scene")
+    assert len(runs) == 1
+    assert results == [("scene", False)] + [("scene", True)] * 4
+
+
+def test_followers_get_the_leaders_exception():
+    def fail(emit):
+        raise RuntimeError("LLM down")
+
+    results = _burst(SingleFlight(), 3, fail)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_calls_after_a_flight_run_again():
+    flights, runs = SingleFlight(), []
+    for _ in range(2):
+        flights.do("key", lambda emit: runs.append(1))
+    assert len(runs) == 2
+
+
+def _stream(emit):
+    for piece in ("青云", "山下", "。"):
+        emit(piece)
+    return "青云山下。"
+
+
+def test_followers_get_the_leaders_deltas():
+    received = [[] for _ in range(3)]
+    _burst(SingleFlight(), 3, _stream, on_deltas=[pieces.append for pieces in received])
+    assert ["".join(pieces) for pieces in received] == ["青云山下。"] * 3
+
+
+def test_unshared_deltas_reach_only_the_leader():
+    received = [[] for _ in range(3)]
+    results = _burst(SingleFlight(), 3, _stream, on_deltas=[pieces.append for pieces in received], share_deltas=False)
+    assert ["".join(pieces) for pieces in received] == ["青云山下。", "", ""]
+    assert [result[0] for result in results] == ["青云山下。"] * 3
+
+
+@pytest.mark.parametrize("pieces", [
+    ["道友[[NAME]]来了"],
+    ["道友[[NA", "ME]]来了"], # Token split across pieces
+    ["道友[", "[", "NAME", "]", "]来了"],
+    ["道友[[NAX]]来了"], # Not the token: passed on as it is
+])
+def test_token_stream_replaces_split_tokens(pieces):
+    out = []
+    stream = _TokenStream(out.append, CHARACTER_NAME_TOKEN, "林逸")
+    for piece in pieces:
+        stream(piece)
+    stream.flush()
+    expected = "".join(pieces).replace(CHARACTER_NAME_TOKEN, "林逸")
+    assert "".join(out) == expected
+
+
+@pytest.fixture
+def across_names():
+    original = settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES
+    settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES = True, True
+    yield
+    settings.STORY_COALESCE, settings.STORY_COALESCE_ACROSS_NAMES = original
+
+
+def test_prompts_across_names_are_equal(rag, across_names):
+    characters = [{"name": name, "cultivation_stage": "炼气期一层"} for name in ("林逸", "韩立")]
+    assert rag._build_query(GAME_STATE, characters[0]) == rag._build_query(GAME_STATE, characters[1]) # Same retrieved context
+    prompts = [rag._build_prompt(GAME_STATE, character, "").text for character in characters]
+    assert prompts[0] == prompts[1]
+    assert CHARACTER_NAME_TOKEN in prompts[0] and "林逸" not in prompts[0]
+
+
+def test_shared_output_gets_each_players_name(rag, across_names, monkeypatch):
+    # The model writes the token; a name it happens to write verbatim is left alone
+    output = '{"plot": "[[NAME]]拜入青云门，与林逸同行。", "choices": ["a", "b", "c"], "duration_days": 1}'
+    monkeypatch.setattr(rag, "_call_llm", lambda prompt_text, on_plot_delta=None, lane="interactive": output)
+    prompt_text = rag._build_prompt(GAME_STATE, {"name": "林逸"}, "").text
+    assert rag._call_story_llm(prompt_text, {"name": "韩\"立"})[0] == output.replace(CHARACTER_NAME_TOKEN, '韩\\"立')